@@ -0,0 +1,154 @@
+"""
+Concurrent slow requests under sync (WSGI) and async (ASGI) workers.
+
+Starts local stand-ins for S3 and for Google's sign-in certificate endpoint
+that take ``--delay`` seconds to answer, builds a fresh benchmark database
+(see benchmarks/flows.py), then serves the app twice with the same number of
+worker processes: gunicorn's sync workers on mysite.wsgi, and uvicorn workers
+on mysite.asgi. Each serves ``--concurrency`` requests at a time of
+
+* download - a document streamed from the S3 stand-in, and
+* sign_in - Google sign-in with a token signed by the stand-in's key.
+
+    python benchmarks/concurrency.py
+    python benchmarks/concurrency.py --delay 0.5 --workers 2 --concurrency 50 --requests 200
+
+A sync worker is busy for the whole of each slow request, so its throughput is
+at most ``workers / delay``; an async worker keeps serving while it waits.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CLIENT_ID = 'benchmark-client'
+KEY_ID = 'benchmark'
+EMAIL = 'sign-in@example.com'
+CONTENT = b'benchmark document\n' * 512
+
+
+def make_key():
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                serialization.NoEncryption())
+    public = key.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+    return private, public.decode()
+
+
+def start_stub_server(delay, public_key):
+    """A server that answers like S3 (any object is CONTENT) and Google's certificate URL, after ``delay``."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_HEAD(self):
+            time.sleep(delay)
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(CONTENT)))
+            self.send_header('Last-Modified', 'Mon, 05 May 2025 10:00:00 GMT')
+            self.end_headers()
+
+        def do_GET(self):
+            time.sleep(delay)
+            if self.path == '/certs':
+                body, status = json.dumps({KEY_ID: public_key}).encode(), 200
+            else:
+                start, end = 0, len(CONTENT) - 1
+                if self.headers.get('Range'):
+                    first, last = self.headers['Range'].removeprefix('bytes=').split('-')
+                    start, end = int(first), int(last)
+                body, status = CONTENT[start:end + 1], 206 if self.headers.get('Range') else 200
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--delay', type=float, default=0.2, help="Seconds S3 and Google take to answer.")
+    parser.add_argument('--workers', type=int, default=2, help="Worker processes in both modes.")
+    parser.add_argument('--concurrency', type=int, default=20, help="Requests in flight at once.")
+    parser.add_argument('--requests', type=int, default=100, help="Measured requests per flow.")
+    parser.add_argument('--warmup', type=int, default=10, help="Unmeasured requests per flow first.")
+    parser.add_argument('--flows', default='download,sign_in', help="Comma-separated flows to run.")
+    parser.add_argument('--classes', type=int, default=2)
+    parser.add_argument('--projects', type=int, default=5, help="Projects per class.")
+    parser.add_argument('--documents', type=int, default=10, help="Documents per project.")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    private_key, public_key = make_key()
+    stub = start_stub_server(args.delay, public_key)
+    stub_url = f'http://127.0.0.1:{stub.server_port}'
+    # Read by benchmarks/settings.py, here and in the servers started below
+    os.environ['BENCHMARK_S3_ENDPOINT_URL'] = stub_url
+    os.environ['BENCHMARK_GOOGLE_CERTS_URL'] = f'{stub_url}/certs'
+    os.environ['GOOGLE_OAUTH_CLIENT_ID'] = CLIENT_ID
+
+    # Sets up Django with benchmarks/settings.py
+    from benchmarks.flows import HttpRunner, Targets, build_database, run_flow
+    from django.contrib.auth.models import User
+    from django.urls import reverse
+    from google.auth import crypt, jwt
+
+    viewer = build_database(args)
+    # Signing in an existing user, so concurrent first sign-ins don't race to create the account
+    User.objects.create_user(username=EMAIL, email=EMAIL)
+    targets = Targets(viewer, args.seed)
+    signer = crypt.RSASigner.from_string(private_key, key_id=KEY_ID)
+
+    def download(targets, i):
+        return 'GET', reverse('classes:projects:doc:download_document', args=targets.document()), None, None
+
+    def sign_in(targets, i):
+        now = int(time.time())
+        token = jwt.encode(signer, {'iss': 'https://accounts.google.com', 'aud': CLIENT_ID, 'email': EMAIL,
+                                    'iat': now, 'exp': now + 3600}).decode()
+        return 'POST', reverse('login:auth_receiver'), {'credential': token}, None
+
+    flows = {flow.__name__: flow for flow in (download, sign_in)}
+    print(f"\n{args.workers} workers, {args.concurrency} requests in flight, S3 and Google take {args.delay}s; "
+          f"sync workers top out near {args.workers / args.delay:.0f} req/s")
+    print(f"\n{'server':<8} {'flow':<10} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    results = {}
+    try:
+        for label, asgi in (('wsgi', False), ('asgi', True)):
+            runner = HttpRunner(viewer, args.workers, asgi=asgi)
+            try:
+                for name in args.flows.split(','):
+                    run_flow(runner, targets, flows[name], args.warmup, args.concurrency)
+                    result = results[label, name] = run_flow(runner, targets, flows[name], args.requests,
+                                                             args.concurrency)
+                    print(f"{label:<8} {name:<10} {result['throughput']:>8} {result['p50_ms']:>9} "
+                          f"{result['p95_ms']:>9} {result['p99_ms']:>9} {result['errors']:>7}")
+            finally:
+                runner.close()
+    finally:
+        stub.shutdown()
+
+    print()
+    for name in args.flows.split(','):
+        wsgi, asgi = results['wsgi', name], results['asgi', name]
+        print(f"{name}: ASGI serves {asgi['throughput'] / wsgi['throughput']:.1f}x the requests per second")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Synthetic data for the benchmark suite.
+
+``generate()`` fills an empty database with ``classes`` classes, ``projects``
+projects per class and ``documents`` documents per project, each with tags,
+comments and likes, using bulk inserts so even large data sets take seconds.
+Rows are inserted directly, so signal-maintained data (tag usage counts and the
+search index) is rebuilt at the end. The same seed always produces the same data.
+"""
+import random
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import transaction
+from classes.models import Class
+from doc import tags as doc_tags
+from doc.models import Document, DocumentComment, Like, Tag
+from projects.models import Project, ProjectComment
+
+PASSWORD = 'benchmark'
+WORDS = ('photosynthesis', 'mitosis', 'entropy', 'integral', 'vector', 'protein', 'algorithm', 'circuit',
+         'equilibrium', 'genome', 'matrix', 'momentum', 'neuron', 'polymer', 'quantum', 'syntax')
+TAGS = ('notes', 'exam', 'lab', 'homework', 'slides', 'summary', 'midterm', 'final', 'reading', 'project')
+
+
+def sentence(rng, words=8):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+@transaction.atomic
+def generate(classes=5, projects=10, documents=20, members=8, comments=3, likes=4, seed=1, stdout=None):
+    """Create the data set and return the benchmark user, who is a member of every project."""
+    rng = random.Random(seed)
+    password = make_password(PASSWORD)
+
+    admin = User.objects.create_superuser('benchmark-admin', 'admin@example.com', PASSWORD)
+    User.objects.bulk_create(User(username=f'student{i}', password=password) for i in range(members * 4))
+    students = list(User.objects.filter(username__startswith='student').order_by('id'))
+    viewer = students[0]
+
+    Class.objects.bulk_create(
+        Class(owner=admin, name=f'{rng.choice(WORDS).title()} {100 + i}', class_code=f'BENCH{100 + i}',
+              description=sentence(rng))
+        for i in range(classes)
+    )
+    all_classes = list(Class.objects.order_by('class_id'))
+
+    Project.objects.bulk_create(
+        Project(owner=rng.choice(students), name=f'{klass.class_code} project {j}', class_belongs_to=klass,
+                folder_in_s3=f'documents/benchmark-{klass.class_id}-{j}', description=sentence(rng))
+        for klass in all_classes for j in range(projects)
+    )
+    all_projects = list(Project.objects.order_by('project_id'))
+
+    Membership = Project.members.through
+    project_members = {}
+    for project in all_projects:
+        project_members[project.pk] = {viewer.pk, project.owner_id, *(s.pk for s in rng.sample(students, members))}
+    Membership.objects.bulk_create(
+        Membership(project_id=project_id, user_id=user_id)
+        for project_id, user_ids in project_members.items() for user_id in user_ids
+    )
+    ProjectComment.objects.bulk_create(
+        ProjectComment(project=project, author_id=rng.choice(sorted(project_members[project.pk])), content=sentence(rng))
+        for project in all_projects for _ in range(comments)
+    )
+
+    Tag.objects.bulk_create(Tag(name=name) for name in TAGS)
+    tags = list(Tag.objects.all())
+
+    Document.objects.bulk_create(
+        Document(owner_id=rng.choice(sorted(project_members[project.pk])), project=project,
+                 title=f'{sentence(rng, 3)} {k}', description=sentence(rng, 20),
+                 file=f'documents/project-{project.pk}/benchmark-{k}.txt', likes=likes)
+        for project in all_projects for k in range(documents)
+    )
+    all_documents = list(Document.objects.order_by('id').values_list('id', 'project_id'))
+
+    DocumentTag = Document.tags.through
+    DocumentTag.objects.bulk_create(
+        DocumentTag(document_id=document_id, tag_id=tag.pk)
+        for document_id, _ in all_documents for tag in rng.sample(tags, 3)
+    )
+    DocumentComment.objects.bulk_create(
+        DocumentComment(document_id=document_id, author_id=rng.choice(sorted(project_members[project_id])),
+                        content=sentence(rng))
+        for document_id, project_id in all_documents for _ in range(comments)
+    )
+    # The benchmark user never starts out liking a document, so the like flow always adds then removes
+    Like.objects.bulk_create(
+        Like(document_id=document_id, user_id=user_id)
+        for document_id, project_id in all_documents
+        for user_id in rng.sample(sorted(project_members[project_id] - {viewer.pk}), likes)
+    )
+
+    doc_tags.recount()
+    call_command('rebuild_search_index', stdout=stdout)
+    if stdout:
+        stdout.write(f"Generated {len(all_classes)} classes, {len(all_projects)} projects, "
+                     f"{len(all_documents)} documents and {len(students)} students.\n")
+    return viewer
@@ -0,0 +1,335 @@
+"""
+Latency, throughput and query counts of the core user flows.
+
+Builds a fresh benchmark database (see benchmarks/settings.py and
+benchmarks/data.py), then runs each flow as a logged-in project member, either
+through the Django test client or over HTTP against a local gunicorn:
+
+    python benchmarks/flows.py                                # test client
+    python benchmarks/flows.py --http --workers 3 --concurrency 6
+    python benchmarks/flows.py --http --asgi --workers 3 --concurrency 6   # uvicorn workers
+    python benchmarks/flows.py --classes 20 --projects 20 --documents 50 --requests 200
+
+Query counts come from the instrumentation middleware (``response.perf`` with
+the test client, the ``Server-Timing`` header over HTTP).
+
+``--save-baseline NAME`` writes the results to benchmarks/baselines/NAME.json;
+``--compare NAME`` reports the change against that baseline and exits with
+status 1 if a flow's p95 latency grew by more than ``--tolerance`` (and by at
+least ``--min-delta-ms``) or any flow ran more queries. Latency baselines only
+mean something on the machine that recorded them; query counts are comparable
+anywhere.
+
+SQLite can't queue concurrent writers, so over HTTP the like and upload flows
+run one request at a time unless BENCHMARK_DATABASE_URL points at PostgreSQL.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINES = os.path.join(ROOT, 'benchmarks', 'baselines')
+sys.path.insert(0, ROOT)
+os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.files.uploadedfile import SimpleUploadedFile  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.urls import reverse  # noqa: E402
+from django.utils.crypto import get_random_string  # noqa: E402
+from benchmarks import data  # noqa: E402
+from doc.models import Document  # noqa: E402
+from mysite.perf import percentile  # noqa: E402
+from projects.models import Project  # noqa: E402
+
+QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+
+
+class Targets:
+    """Classes, projects and documents the benchmark user can visit, picked at random per request."""
+
+    def __init__(self, viewer, seed):
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.projects = list(Project.objects.filter(members=viewer).values_list('class_belongs_to_id', 'project_id'))
+        self.documents = list(Document.objects.filter(project__members=viewer)
+                              .values_list('project__class_belongs_to_id', 'project_id', 'id'))
+
+    def project(self):
+        with self.lock:
+            return self.rng.choice(self.projects)
+
+    def document(self):
+        with self.lock:
+            return self.rng.choice(self.documents)
+
+    def word(self):
+        with self.lock:
+            return self.rng.choice(data.WORDS)
+
+
+# Each flow returns (method, path, form data, files) for one request
+
+def class_list(targets, i):
+    return 'GET', reverse('classes:class_list'), None, None
+
+
+def class_detail(targets, i):
+    class_id, _ = targets.project()
+    return 'GET', reverse('classes:class_detail', args=[class_id]), None, None
+
+
+def project_detail(targets, i):
+    return 'GET', reverse('classes:projects:project_detail', args=targets.project()), None, None
+
+
+def document_detail(targets, i):
+    return 'GET', reverse('classes:projects:doc:document_detail', args=targets.document()), None, None
+
+
+def search(targets, i):
+    return 'GET', reverse('projects:search_documents') + f'?q={targets.word()}', None, None
+
+
+def like(targets, i):
+    return 'POST', reverse('classes:projects:doc:like_document', args=targets.document()), {}, None
+
+
+def upload(targets, i):
+    class_id, project_id = targets.project()
+    form = {'title': f'Benchmark upload {i}', 'description': 'Uploaded by the benchmark', 'tags_input': 'notes, lab'}
+    files = {'file': (f'upload-{i}.txt', b'benchmark upload\n' * 64)}
+    return 'POST', reverse('classes:projects:doc:upload_document', args=[class_id, project_id]), form, files
+
+
+FLOWS = {flow.__name__: flow for flow in (
+    class_list, class_detail, project_detail, document_detail, search, like, upload)}
+WRITE_FLOWS = {'like', 'upload'}
+
+
+class TestClientRunner:
+    """Runs requests in this process through the Django test client."""
+
+    label = 'client'
+
+    def __init__(self, viewer):
+        self.local = threading.local()
+        self.viewer = viewer
+
+    def client(self):
+        if not hasattr(self.local, 'client'):
+            self.local.client = Client()
+            self.local.client.force_login(self.viewer)
+        return self.local.client
+
+    def request(self, method, path, form, files):
+        client = self.client()
+        if method == 'GET':
+            response = client.get(path)
+        else:
+            if files:
+                form = {**form, **{name: SimpleUploadedFile(*file) for name, file in files.items()}}
+            response = client.post(path, form)
+        perf = getattr(response, 'perf', None)
+        return response.status_code, perf.queries if perf else None
+
+    def close(self):
+        pass
+
+
+class HttpRunner:
+    """Sends requests to a gunicorn started for the benchmark database, with uvicorn workers if ``asgi``."""
+
+    label = 'http'
+
+    def __init__(self, viewer, workers, asgi=False):
+        import requests
+
+        # A session saved through the session engine is valid in every gunicorn worker
+        client = Client()
+        client.force_login(viewer)
+        self.cookies = {settings.SESSION_COOKIE_NAME: client.cookies[settings.SESSION_COOKIE_NAME].value}
+        self.csrf_token = get_random_string(32)
+        self.cookies[settings.CSRF_COOKIE_NAME] = self.csrf_token
+        self.local = threading.local()
+        self.requests = requests
+
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        self.base_url = f'http://127.0.0.1:{port}'
+        app = ['mysite.asgi:application', '--worker-class', 'uvicorn_worker.UvicornWorker'] if asgi else ['mysite.wsgi']
+        self.server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', *app, '--bind', f'127.0.0.1:{port}',
+             '--workers', str(workers), '--log-level', 'warning'],
+            cwd=ROOT, env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'benchmarks.settings'},
+        )
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                requests.get(self.base_url + reverse('home'), timeout=1)
+                break
+            except requests.ConnectionError:
+                if time.monotonic() > deadline or self.server.poll() is not None:
+                    self.close()
+                    raise RuntimeError("gunicorn didn't start")
+                time.sleep(0.2)
+
+    def session(self):
+        if not hasattr(self.local, 'session'):
+            self.local.session = self.requests.Session()
+            self.local.session.cookies.update(self.cookies)
+        return self.local.session
+
+    def request(self, method, path, form, files):
+        headers = {'X-CSRFToken': self.csrf_token} if method == 'POST' else {}
+        response = self.session().request(method, self.base_url + path, data=form, files=files,
+                                          headers=headers, allow_redirects=False, timeout=60)
+        match = QUERIES_RE.search(response.headers.get('Server-Timing', ''))
+        return response.status_code, int(match.group(1)) if match else None
+
+    def close(self):
+        self.server.terminate()
+        self.server.wait(timeout=10)
+
+
+def run_flow(runner, targets, flow, count, concurrency):
+    def one(i):
+        request = flow(targets, i)
+        start = time.perf_counter()
+        try:
+            status, queries = runner.request(*request)
+        except Exception:
+            status, queries = None, None
+        return (time.perf_counter() - start) * 1000, status, queries
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(one, range(count)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _, _ in results)
+    queries = [q for _, _, q in results if q is not None]
+    return {
+        'requests': count,
+        'errors': sum(1 for _, status, _ in results if status is None or status >= 400),
+        'throughput': round(count / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'mean_queries': round(sum(queries) / len(queries), 1) if queries else None,
+        'max_queries': max(queries) if queries else None,
+    }
+
+
+def build_database(args):
+    shutil.rmtree(settings.BENCHMARK_DIR, ignore_errors=True)
+    os.makedirs(settings.BENCHMARK_DIR)
+    call_command('migrate', verbosity=0)
+    if connection.vendor == 'sqlite':
+        # Lets the gunicorn workers read while one of them writes
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
+    else:
+        call_command('flush', interactive=False, verbosity=0)
+    return data.generate(classes=args.classes, projects=args.projects, documents=args.documents,
+                         seed=args.seed, stdout=sys.stdout)
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """Print the change against ``baseline`` and return the names of flows that regressed."""
+    regressed = []
+    print(f"\nAgainst baseline ({baseline['meta']['runner']}, recorded {baseline['meta']['recorded']}):")
+    for name, result in results.items():
+        before = baseline['flows'].get(name)
+        if before is None:
+            continue
+        change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] if before['p95_ms'] else 0
+        more_queries = (result['max_queries'] or 0) > (before['max_queries'] or 0)
+        # Sub-millisecond jitter on fast flows isn't a regression
+        slower = change > tolerance and result['p95_ms'] - before['p95_ms'] > min_delta_ms
+        flag = ' REGRESSION' if slower or more_queries else ''
+        print(f"  {name:<16} p95 {before['p95_ms']:8.2f} -> {result['p95_ms']:8.2f} ms ({change:+.0%})"
+              f"   max queries {before['max_queries']} -> {result['max_queries']}{flag}")
+        if flag:
+            regressed.append(name)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--classes', type=int, default=5)
+    parser.add_argument('--projects', type=int, default=10, help="Projects per class.")
+    parser.add_argument('--documents', type=int, default=20, help="Documents per project.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=100, help="Measured requests per flow.")
+    parser.add_argument('--warmup', type=int, default=10, help="Unmeasured requests per flow first.")
+    parser.add_argument('--flows', default=','.join(FLOWS), help="Comma-separated flows to run.")
+    parser.add_argument('--http', action='store_true', help="Run against a local gunicorn instead of the test client.")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn workers with --http.")
+    parser.add_argument('--asgi', action='store_true', help="Use uvicorn workers on mysite.asgi with --http.")
+    parser.add_argument('--concurrency', type=int, default=1, help="Requests in flight at once.")
+    parser.add_argument('--save-baseline', metavar='NAME')
+    parser.add_argument('--compare', metavar='NAME')
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed p95 growth against the baseline.")
+    parser.add_argument('--min-delta-ms', type=float, default=2.0,
+                        help="p95 growth smaller than this many ms is never a regression.")
+    args = parser.parse_args()
+
+    viewer = build_database(args)
+    targets = Targets(viewer, args.seed)
+    runner = HttpRunner(viewer, args.workers, args.asgi) if args.http else TestClientRunner(viewer)
+
+    results = {}
+    print(f"\n{'flow':<16} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8} {'errors':>7}")
+    try:
+        for name in args.flows.split(','):
+            flow = FLOWS[name]
+            concurrency = args.concurrency
+            if args.http and name in WRITE_FLOWS and connection.vendor == 'sqlite':
+                # SQLite fails concurrent writers with "database is locked" instead of queueing them
+                concurrency = 1
+            run_flow(runner, targets, flow, args.warmup, concurrency)
+            result = results[name] = run_flow(runner, targets, flow, args.requests, concurrency)
+            print(f"{name:<16} {result['throughput']:>8} {result['p50_ms']:>9} {result['p95_ms']:>9} "
+                  f"{result['p99_ms']:>9} {result['mean_queries'] or '-':>8} {result['errors']:>7}")
+    finally:
+        runner.close()
+
+    meta = {
+        'runner': runner.label, 'recorded': time.strftime('%Y-%m-%d'),
+        'classes': args.classes, 'projects': args.projects, 'documents': args.documents,
+        'requests': args.requests, 'concurrency': args.concurrency,
+        'workers': args.workers if args.http else None, 'asgi': args.asgi if args.http else None,
+    }
+    if args.save_baseline:
+        os.makedirs(BASELINES, exist_ok=True)
+        path = os.path.join(BASELINES, f'{args.save_baseline}.json')
+        with open(path, 'w') as f:
+            json.dump({'meta': meta, 'flows': results}, f, indent=2)
+            f.write('\n')
+        print(f"\nSaved baseline {path}")
+    if args.compare:
+        with open(os.path.join(BASELINES, f'{args.compare}.json')) as f:
+            regressed = compare(results, json.load(f), args.tolerance, args.min_delta_ms)
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Per-delete latency of a new boto3 client per call vs the shared client.
+
+Runs against a local stand-in for S3 (a tiny HTTP server that accepts every
+DELETE), so it measures client construction and connection reuse rather than
+the network:
+
+    python benchmarks/s3_client.py --deletes 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StubS3Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like S3
+
+    def do_DELETE(self):
+        self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubS3Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def timed(delete, count):
+    timings = []
+    for i in range(count):
+        start = time.perf_counter()
+        delete(f'documents/project-1/file-{i}.pdf')
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(label, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f'{label:<24} mean {statistics.mean(timings):7.2f} ms   p50 {statistics.median(timings):7.2f} ms'
+          f'   p95 {p95:7.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--deletes', type=int, default=100)
+    args = parser.parse_args()
+
+    server = start_stub_server()
+    os.environ['AWS_S3_ENDPOINT_URL'] = f'http://127.0.0.1:{server.server_port}'
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+
+    import boto3
+    import django
+    from django.conf import settings
+    django.setup()
+    from mysite.s3 import get_s3_client
+
+    def delete_with_new_client(key):
+        # What Document/Profile.delete_file_from_s3 used to do
+        s3 = boto3.client('s3',
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            region_name=settings.AWS_S3_REGION_NAME,
+            endpoint_url=settings.AWS_S3_ENDPOINT_URL,
+        )
+        s3.delete_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key)
+
+    def delete_with_shared_client(key):
+        get_s3_client().delete_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key)
+
+    print(f'{args.deletes} deletes against {settings.AWS_S3_ENDPOINT_URL}')
+    report('new client per delete', timed(delete_with_new_client, args.deletes))
+    report('shared client', timed(delete_with_shared_client, args.deletes))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
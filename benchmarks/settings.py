@@ -0,0 +1,60 @@
+"""
+Settings for the benchmark suite: the site's settings with a separate SQLite
+database and local file storage, so benchmark runs never touch the development
+database or S3. Used by benchmarks/flows.py, benchmarks/concurrency.py and the
+gunicorn they start.
+"""
+import os
+import dj_database_url
+from mysite.settings import *  # noqa: F401,F403
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.data')
+
+DEBUG = False
+ALLOWED_HOSTS = ['localhost', '127.0.0.1', 'testserver']
+# An SQLite file unless BENCHMARK_DATABASE_URL names another (empty, disposable) database, e.g. PostgreSQL
+# to match production. Its contents are replaced on every run.
+if os.getenv('BENCHMARK_DATABASE_URL'):
+    DATABASES = {'default': dj_database_url.parse(os.environ['BENCHMARK_DATABASE_URL'])}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BENCHMARK_DIR, 'benchmark.sqlite3'),
+            'OPTIONS': {'timeout': 30},
+        }
+    }
+DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
+MEDIA_ROOT = os.path.join(BENCHMARK_DIR, 'media')
+MEDIA_URL = '/media/'
+DOCUMENT_DIRECT_UPLOADS = False
+# Every gunicorn worker must see the same sessions and view marks; a file cache shares them
+# without competing with the requests for SQLite's write lock
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BENCHMARK_DIR, 'cache'),
+        'KEY_PREFIX': 'benchmark',
+    }
+}
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+# benchmarks/concurrency.py points S3 and Google's sign-in certificates at slow local stand-ins
+if os.getenv('BENCHMARK_S3_ENDPOINT_URL'):
+    DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
+    AWS_S3_ENDPOINT_URL = os.environ['BENCHMARK_S3_ENDPOINT_URL']
+    AWS_ACCESS_KEY_ID = AWS_SECRET_ACCESS_KEY = 'benchmark'
+    DOCUMENT_DOWNLOAD_MODE = 'stream'
+if os.getenv('BENCHMARK_GOOGLE_CERTS_URL'):
+    from google.oauth2 import id_token
+    id_token._GOOGLE_OAUTH2_CERTS_URL = os.environ['BENCHMARK_GOOGLE_CERTS_URL']
+# The benchmark reports query counts itself, so don't log every over-budget request; do show server errors
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {'console': {'class': 'logging.StreamHandler'}},
+    'loggers': {
+        'mysite.perf': {'level': 'ERROR'},
+        'django.request': {'handlers': ['console'], 'level': 'ERROR'},
+    },
+}
@@ -1,7 +1,20 @@
-from django.contrib import admin
+import io
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import path, reverse
 from .models import Class
+from .roster import ROLES, import_roster
 from django.contrib.auth.models import User
 
+
+class RosterImportForm(forms.Form):
+    roster = forms.FileField(help_text="A CSV with an email address or computing ID per row, "
+                                       "or with email, computing_id, first_name and last_name columns.")
+    role = forms.ChoiceField(choices=[('members', 'Members'), ('pma_admins', 'PMA admins')], initial='members')
+
+
 class ClassAdmin(admin.ModelAdmin):
     list_display = ('name', 'owner', 'class_code', 'description')
     search_fields = ('name', 'class_code', 'owner__username')
@@ -14,6 +27,48 @@ class ClassAdmin(admin.ModelAdmin):
         }),
     )
 
+    actions = ['import_roster']
+
+    def get_urls(self):
+        return [
+            path('<int:class_id>/roster/', self.admin_site.admin_view(self.import_roster_view),
+                 name='classes_class_import_roster'),
+        ] + super().get_urls()
+
+    @admin.action(description="Import a roster into the selected class")
+    def import_roster(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, "Select exactly one class to import a roster into.", messages.WARNING)
+            return None
+        return redirect('admin:classes_class_import_roster', queryset.get().pk)
+
+    def import_roster_view(self, request, class_id):
+        klass = get_object_or_404(Class, pk=class_id)
+        if not self.has_change_permission(request, klass):
+            raise PermissionDenied
+        form = RosterImportForm(request.POST or None, request.FILES or None)
+        if form.is_valid():
+            # Read the upload as text a chunk at a time rather than all at once
+            lines = io.TextIOWrapper(form.cleaned_data['roster'].file, encoding='utf-8-sig', newline='')
+            try:
+                result = import_roster(klass, lines, form.cleaned_data['role'])
+            except UnicodeDecodeError:
+                form.add_error('roster', "The file isn't UTF-8 text.")
+            else:
+                self.message_user(request, f"{klass.class_code}: {result.summary()}.", messages.SUCCESS)
+                for line_number, row in result.invalid_rows:
+                    self.message_user(request, f"Line {line_number} is not an email or computing ID: {row}",
+                                      messages.WARNING)
+                return redirect('admin:classes_class_change', klass.pk)
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'original': klass,
+            'form': form,
+            'title': f"Import a roster into {klass}",
+        }
+        return render(request, 'admin/classes/class/import_roster.html', context)
+
     def save_model(self, request, obj, form, change):
         # Validate that the owner is a superuser before saving
         if not obj.owner.is_superuser:
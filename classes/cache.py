@@ -0,0 +1,36 @@
+"""
+The class list, cached.
+
+Every visit to /classes/ lists all classes, which change a few times a term, so
+the rows are kept in the shared cache. classes.signals drops them whenever a
+class is saved or deleted, and ``python manage.py warm_cache`` fills the cache
+after a deploy.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from .models import Class
+
+CLASS_LIST_KEY = 'classes:list'
+CLASS_LIST_TIMEOUT = 24 * 60 * 60
+
+
+def load_class_list():
+    return list(Class.objects.order_by('class_id').values('class_id', 'class_code', 'name', 'description'))
+
+
+def class_list():
+    """``[{'class_id', 'class_code', 'name', 'description'}]`` for every class."""
+    classes = cache.get(CLASS_LIST_KEY)
+    if classes is None:
+        classes = warm_class_list()
+    return classes
+
+
+def warm_class_list():
+    classes = load_class_list()
+    cache.set(CLASS_LIST_KEY, classes, CLASS_LIST_TIMEOUT)
+    return classes
+
+
+def invalidate_class_list():
+    transaction.on_commit(lambda: cache.delete(CLASS_LIST_KEY))
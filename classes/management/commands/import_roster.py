@@ -0,0 +1,37 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from classes.models import Class
+from classes.roster import BATCH_SIZE, ROLES, import_roster
+
+
+class Command(BaseCommand):
+    help = "Enroll the students in a CSV of emails or computing IDs in a class (see classes/roster.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('class_code')
+        parser.add_argument('path', help="CSV file, or - for standard input")
+        parser.add_argument('--role', choices=sorted(ROLES), default='members')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            klass = Class.objects.get(class_code=options['class_code'])
+        except Class.DoesNotExist:
+            raise CommandError(f"No class has the code {options['class_code']!r}.")
+
+        def progress(result):
+            self.stdout.write(f"  {result.rows} rows read, {result.added} added so far")
+
+        if options['path'] == '-':
+            result = import_roster(klass, sys.stdin, options['role'], options['batch_size'], progress)
+        else:
+            try:
+                roster = open(options['path'], newline='', encoding='utf-8-sig')
+            except OSError as error:
+                raise CommandError(f"Can't read {options['path']}: {error}")
+            with roster:
+                result = import_roster(klass, roster, options['role'], options['batch_size'], progress)
+
+        for line_number, row in result.invalid_rows:
+            self.stdout.write(self.style.WARNING(f"  line {line_number}: not an email or computing ID: {row}"))
+        self.stdout.write(self.style.SUCCESS(f"{klass.class_code}: {result.summary()}."))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from classes.user_types import sync_user_types
+
+
+class Command(BaseCommand):
+    help = "Recompute every profile's user type from the classes' PMA admins."
+
+    def handle(self, *args, **options):
+        promoted, demoted = sync_user_types()
+        self.stdout.write(self.style.SUCCESS(
+            f"Made {promoted} profile{'s' if promoted != 1 else ''} PMA Admin "
+            f"and {demoted} profile{'s' if demoted != 1 else ''} Common."))
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from classes.cache import warm_class_list
+from doc import tags
+
+
+class Command(BaseCommand):
+    help = "Fill the shared cache with frequently read objects, e.g. after a deploy changes the key prefix."
+
+    def handle(self, *args, **options):
+        backend = settings.CACHES['default']['BACKEND']
+        if backend.endswith('LocMemCache'):
+            self.stdout.write(self.style.WARNING("The cache is per-process local memory; only this process is warmed."))
+
+        classes = warm_class_list()
+        self.stdout.write(f"  class list: {len(classes)} classes")
+
+        if connection.vendor != 'postgresql':
+            names, _ = tags.prefix_index.load()
+            self.stdout.write(f"  tag prefix index: {len(names)} tags")
+
+        self.stdout.write(self.style.SUCCESS(f"Warmed the cache ({backend.rsplit('.', 1)[-1]})."))
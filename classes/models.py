@@ -25,4 +25,11 @@ class Class(models.Model):
         super().save(*args, **kwargs)
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+    # Membership checks are single EXISTS queries on the through tables' (class_id, user_id) unique index
+    def has_member(self, user):
+        return Class.member_list.through.objects.filter(class_id=self.pk, user_id=user.pk).exists()
+
+    def has_pma_admin(self, user):
+        return Class.pma_admins.through.objects.filter(class_id=self.pk, user_id=user.pk).exists()
\ No newline at end of file
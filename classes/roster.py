@@ -0,0 +1,186 @@
+"""
+Class roster import.
+
+A roster is a CSV with one student per row, identified by email address or by
+computing ID (which becomes ``<id>@ROSTER_EMAIL_DOMAIN``). With a header row,
+the ``email``, ``computing_id``, ``first_name`` and ``last_name`` columns are
+read; without one, the first column holds the identifier.
+
+``import_roster()`` reads the rows in batches of ``batch_size``, so a file of
+any size is imported in constant memory. For each batch it looks up the
+existing users and profiles in one query each, creates the missing ones with
+``bulk_create`` and adds the users to the class's ``member_list`` or
+``pma_admins`` with one through-table insert. The whole import is one
+transaction, so a failed import leaves the class as it was. Users created here
+have no password; they sign in with Google like everyone else, and the account
+is matched on email.
+
+Through-table inserts send no ``m2m_changed``, so the work its handlers would
+do (PMA admin user types) is done here per batch.
+"""
+import csv
+import re
+from dataclasses import dataclass, field
+from itertools import islice
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import Q
+from profiles.models import Profile
+from .models import Class
+from .user_types import sync_user_types
+
+ROLES = {'members': 'member_list', 'pma_admins': 'pma_admins'}
+COMPUTING_ID_RE = re.compile(r'^[a-z][a-z0-9]{1,9}$')
+BATCH_SIZE = 500
+MAX_REPORTED_INVALID = 20
+
+
+@dataclass
+class Student:
+    email: str
+    computing_id: str = None
+    first_name: str = ''
+    last_name: str = ''
+
+
+@dataclass
+class RosterResult:
+    rows: int = 0
+    created: int = 0
+    added: int = 0
+    already_enrolled: int = 0
+    invalid: int = 0
+    # (line number, row) of the first MAX_REPORTED_INVALID bad rows, so memory stays bounded
+    invalid_rows: list = field(default_factory=list)
+
+    def add_invalid(self, line_number, row):
+        self.invalid += 1
+        if len(self.invalid_rows) < MAX_REPORTED_INVALID:
+            self.invalid_rows.append((line_number, ','.join(row)))
+
+    def summary(self):
+        return (f"{self.rows} rows: {self.added} added ({self.created} new user{'s' if self.created != 1 else ''}), "
+                f"{self.already_enrolled} already enrolled, {self.invalid} invalid")
+
+
+def parse_identifier(value):
+    """``(email, computing_id)`` for an email address or computing ID, or ``None`` when it is neither."""
+    value = value.strip().lower()
+    if '@' in value:
+        try:
+            validate_email(value)
+        except ValidationError:
+            return None
+        local, domain = value.split('@')
+        return value, local if domain == settings.ROSTER_EMAIL_DOMAIN and COMPUTING_ID_RE.match(local) else None
+    if COMPUTING_ID_RE.match(value):
+        return f'{value}@{settings.ROSTER_EMAIL_DOMAIN}', value
+    return None
+
+
+def read_roster(lines, result):
+    """Students from CSV ``lines`` (any iterable of strings), one at a time; bad rows are counted in ``result``."""
+    rows = csv.reader(lines)
+    first = next(rows, None)
+    if first is None:
+        return
+    header = [column.strip().lower() for column in first]
+    if 'email' in header or 'computing_id' in header:
+        columns = {name: header.index(name) for name in ('email', 'computing_id', 'first_name', 'last_name')
+                   if name in header}
+    else:
+        columns = None
+        rows = _prepend(first, rows)
+
+    for line_number, row in enumerate(rows, start=2 if columns else 1):
+        if not any(cell.strip() for cell in row):
+            continue
+        result.rows += 1
+
+        def cell(name, default=''):
+            index = columns.get(name) if columns else (0 if name == 'email' else None)
+            return row[index].strip() if index is not None and index < len(row) else default
+
+        parsed = parse_identifier(cell('email') or cell('computing_id'))
+        if parsed is None:
+            result.add_invalid(line_number, row)
+            continue
+        email, computing_id = parsed
+        yield Student(email, computing_id, cell('first_name')[:150], cell('last_name')[:150])
+
+
+def _prepend(row, rows):
+    yield row
+    yield from rows
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def resolve_users(students):
+    """``{email: user id}`` for the batch, creating the users and profiles that don't exist yet."""
+    students = list({student.email: student for student in students}.values())
+    emails = [student.email for student in students]
+    computing_ids = [student.computing_id for student in students if student.computing_id]
+
+    user_ids = {}
+    wanted = set(emails)
+    for user_id, username, email in User.objects.filter(Q(email__in=emails) | Q(username__in=emails)).values_list(
+            'id', 'username', 'email'):
+        user_ids.setdefault(email.lower() if email.lower() in wanted else username.lower(), user_id)
+    by_computing_id = dict(Profile.objects.filter(computing_id__in=computing_ids).values_list('computing_id', 'user_id'))
+    for student in students:
+        if student.email not in user_ids and student.computing_id in by_computing_id:
+            user_ids[student.email] = by_computing_id[student.computing_id]
+
+    missing = [student for student in students if student.email not in user_ids]
+    if missing:
+        # Like accounts made on first Google sign-in (see login.views): username and email are the address
+        password = make_password(None)
+        User.objects.bulk_create(User(username=student.email, email=student.email, password=password,
+                                      first_name=student.first_name, last_name=student.last_name)
+                                 for student in missing)
+        user_ids.update((email.lower(), user_id) for user_id, email in
+                        User.objects.filter(username__in=[student.email for student in missing]).values_list('id', 'email'))
+
+    with_profile = set(Profile.objects.filter(user_id__in=user_ids.values()).values_list('user_id', flat=True))
+    taken = set(by_computing_id)
+    Profile.objects.bulk_create(
+        [Profile(user_id=user_ids[student.email],
+                 computing_id=student.computing_id if student.computing_id not in taken else None)
+         for student in students if user_ids[student.email] not in with_profile],
+        ignore_conflicts=True,
+    )
+    return user_ids, len(missing)
+
+
+@transaction.atomic
+def import_roster(klass, lines, role='members', batch_size=BATCH_SIZE, progress=None):
+    """
+    Enroll the students in CSV ``lines`` in ``klass`` as ``role`` ('members' or 'pma_admins').
+    ``progress(result)`` is called after each batch.
+    """
+    relation = getattr(Class, ROLES[role]).through
+    result = RosterResult()
+    for batch in batches(read_roster(lines, result), batch_size):
+        user_ids, created = resolve_users(batch)
+        result.created += created
+        ids = set(user_ids.values())
+        enrolled = set(relation.objects.filter(class_id=klass.pk, user_id__in=ids).values_list('user_id', flat=True))
+        new = ids - enrolled
+        relation.objects.bulk_create([relation(class_id=klass.pk, user_id=user_id) for user_id in new],
+                                     ignore_conflicts=True)
+        result.added += len(new)
+        result.already_enrolled += len(ids & enrolled)
+        if role == 'pma_admins':
+            sync_user_types(new)
+        if progress:
+            progress(result)
+    return result
@@ -1,28 +1,26 @@
-from django.db.models.signals import m2m_changed
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
+from classes.cache import invalidate_class_list
 from classes.models import Class
-from profiles.models import Profile  # Import the correct Profile model
-from django.contrib.auth.models import User
+from classes.user_types import sync_user_types
 
 @receiver(m2m_changed, sender=Class.pma_admins.through)
 def update_user_type(sender, instance, action, reverse, pk_set, **kwargs):
     """
-    Signal to update user_type when users are added to or removed from the pma_admins field.
+    Keep Profile.user_type in step with pma_admins. ``pk_set`` is None on
+    clear, so the users being cleared are remembered before the rows go.
     """
+    if action == 'pre_clear' and not reverse:
+        instance._cleared_admin_ids = list(instance.pma_admins.values_list('pk', flat=True))
+    elif action in ['post_add', 'post_remove', 'post_clear']:
+        if reverse:
+            # instance is a user; pk_set holds class ids
+            user_ids = [instance.pk]
+        else:
+            user_ids = pk_set if action != 'post_clear' else instance._cleared_admin_ids
+        sync_user_types(user_ids)
 
-    if action in ['post_add', 'post_remove', 'post_clear']:
-        for user_id in pk_set:
-            user = User.objects.get(pk=user_id)
-            try:
-                profile = Profile.objects.get(user=user)  # Correctly fetch the profile
-                # Check if the user is still an admin in any class
-                is_pma_admin = Class.objects.filter(pma_admins__id=user.id).exists()
-                print(f"User {user.username} i_pma_admin: {is_pma_admin}")
-                if is_pma_admin:
-                    profile.user_type = 'PMA Admin'
-                    profile.save()
-                elif not is_pma_admin:
-                    profile.user_type = 'Common'
-                    profile.save()
-            except Profile.DoesNotExist:
-                print(f"No profile found for user {user.username}")
+
+@receiver([post_save, post_delete], sender=Class)
+def drop_cached_class_list(sender, **kwargs):
+    invalidate_class_list()
@@ -5,4 +5,7 @@ register = template.Library()
 @register.filter
 def has_group(user, group_name):
     """Returns True if the user is in the specified group."""
-    return user.groups.filter(name=group_name).exists()
+    # Load the user's group names once and keep them on the user for the rest of the request
+    if not hasattr(user, '_group_names'):
+        user._group_names = set(user.groups.values_list('name', flat=True)) if user.is_authenticated else set()
+    return group_name in user._group_names
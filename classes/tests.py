@@ -1,7 +1,25 @@
-from django.test import TestCase
+import os
+import tempfile
+from io import StringIO
+from django.test import TestCase, override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.management import call_command
 from django.core.exceptions import ValidationError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from classes import roster
+from classes.cache import CLASS_LIST_KEY
 from classes.models import Class
+from classes.user_types import sync_user_types
+from mysite.caches import backend_stats, cache_settings
+from mysite.perf import assert_within_budget
+from doc.models import Document
+from profiles.models import Profile
+from projects.models import Project
 
 class ClassModelTest(TestCase):
     def setUp(self):
@@ -70,3 +88,240 @@ class ClassModelTest(TestCase):
         self.assertIn(self.regular_user, class_instance.member_list.all())
         self.assertEqual(class_instance.member_list.count(), 1)
 
+
+class ClassDetailViewTest(TestCase):
+    def setUp(self):
+        self.superuser = User.objects.create_superuser(
+            username='superuser',
+            email='superuser@example.com',
+            password='password'
+        )
+        self.student = User.objects.create_user(username='student', password='password')
+        self.class_instance = Class.objects.create(
+            owner=self.superuser,
+            name='Biology 101',
+            class_code='BIO101',
+            description='Introduction to Biology'
+        )
+        self.url = reverse('classes:class_detail', args=[self.class_instance.class_id])
+        self.client.login(username='student', password='password')
+
+    def add_projects(self, count):
+        for i in range(count):
+            project = Project.objects.create(
+                name=f'Project {Project.objects.count()}',
+                owner=self.student,
+                class_belongs_to=self.class_instance,
+                folder_in_s3=f'documents/project-{Project.objects.count()}'
+            )
+            Document.objects.create(owner=self.student, title='Notes', file='notes.txt', project=project)
+
+    def test_project_counts_are_annotated(self):
+        self.add_projects(1)
+        project = Project.objects.with_activity().get()
+        self.assertEqual(project.document_count, 1)
+        self.assertEqual(project.member_count, 1)
+        self.assertEqual(project.comment_count, 0)
+        self.assertGreaterEqual(project.latest_activity, project.date_created)
+
+    def test_class_detail_queries_do_not_grow_with_projects(self):
+        self.add_projects(2)
+        with CaptureQueriesContext(connection) as few_projects:
+            self.client.get(self.url)
+
+        self.add_projects(10)
+        with CaptureQueriesContext(connection) as many_projects:
+            response = self.client.get(self.url)
+
+        self.assertEqual(len(few_projects), len(many_projects))
+        self.assertEqual(response.context['projects'].paginator.count, 12)
+        assert_within_budget(response)
+
+
+class CacheSettingsTest(TestCase):
+
+    def test_backend_is_picked_from_the_environment(self):
+        self.assertTrue(cache_settings({})['default']['BACKEND'].endswith('LocMemCache'))
+        self.assertTrue(cache_settings({'DYNO': 'web.1'})['default']['BACKEND'].endswith('DatabaseCache'))
+        self.assertEqual(cache_settings({'DYNO': 'web.1'})['default']['LOCATION'], 'django_cache')
+
+        file_cache = cache_settings({'CACHE_BACKEND': 'file', 'CACHE_LOCATION': '/tmp/notes-cache'})['default']
+        self.assertTrue(file_cache['BACKEND'].endswith('FileBasedCache'))
+        self.assertEqual(file_cache['LOCATION'], '/tmp/notes-cache')
+
+        redis = cache_settings({'CACHE_BACKEND': 'redis', 'REDIS_TLS_URL': 'rediss://cache:6380'})['default']
+        self.assertTrue(redis['BACKEND'].endswith('RedisCache'))
+        self.assertEqual(redis['OPTIONS'], {'ssl_cert_reqs': None})
+
+        memcached = cache_settings({'CACHE_BACKEND': 'memcached', 'MEMCACHIER_SERVERS': 'a:11211,b:11211'})['default']
+        self.assertEqual(memcached['LOCATION'], ['a:11211', 'b:11211'])
+
+        with self.assertRaises(ValueError):
+            cache_settings({'CACHE_BACKEND': 'mongo'})
+
+    def test_keys_are_prefixed_per_release(self):
+        self.assertEqual(cache_settings({'HEROKU_RELEASE_VERSION': 'v42'})['default']['KEY_PREFIX'], 'v42')
+        self.assertEqual(cache_settings({'CACHE_KEY_PREFIX': 'staging', 'HEROKU_RELEASE_VERSION': 'v42'})
+                         ['default']['KEY_PREFIX'], 'staging')
+
+    def test_backend_stats(self):
+        with tempfile.TemporaryDirectory() as location:
+            file_cache = FileBasedCache(location, {})
+            file_cache.set('a', 1)
+            self.assertEqual(backend_stats(file_cache)['keys'], 1)
+
+
+class ClassListCacheTest(TestCase):
+
+    def setUp(self):
+        self.superuser = User.objects.create_superuser(username='superuser', email='superuser@example.com', password='password')
+        Class.objects.create(owner=self.superuser, name='Biology 101', class_code='BIO101', description='Cells')
+        self.url = reverse('classes:class_list')
+        cache.clear()
+
+    def test_class_list_is_cached_until_a_class_changes(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as cached:
+            response = self.client.get(self.url)
+        self.assertFalse(any('classes_class' in query['sql'] for query in cached.captured_queries))
+        self.assertContains(response, 'BIO101')
+        assert_within_budget(response)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Class.objects.create(owner=self.superuser, name='Chemistry 101', class_code='CHEM101', description='Atoms')
+        self.assertContains(self.client.get(self.url), 'CHEM101')
+
+    def test_warm_cache_command(self):
+        out = StringIO()
+        call_command('warm_cache', stdout=out)
+        self.assertEqual([c['class_code'] for c in cache.get(CLASS_LIST_KEY)], ['BIO101'])
+        self.assertIn('1 classes', out.getvalue())
+
+    def test_cache_stats_are_staff_only(self):
+        url = reverse('cache_stats')
+        User.objects.create_user(username='student', password='password')
+        self.client.login(username='student', password='password')
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.login(username='superuser', password='password')
+        cache.set('some-key', 1)
+        stats = self.client.get(url).json()
+        self.assertTrue(stats['backend'].endswith('LocMemCache'))
+        self.assertGreaterEqual(stats['stats']['keys'], 1)
+        self.assertIn('project-documents', stats['fragments'])
+
+
+class UserTypeTest(TestCase):
+
+    def setUp(self):
+        self.superuser = User.objects.create_superuser(username='superuser', email='superuser@example.com', password='password')
+        self.classs = Class.objects.create(name='Test Class', class_code='TEST101', owner=self.superuser, description='')
+        self.other_class = Class.objects.create(name='Other Class', class_code='TEST102', owner=self.superuser, description='')
+
+    def make_users(self, count, prefix='ta'):
+        users = [User.objects.create_user(username=f'{prefix}{i}', password='password') for i in range(count)]
+        for user in users:
+            Profile.objects.create(user=user)
+        return users
+
+    def user_types(self, users):
+        return list(Profile.objects.filter(user__in=users).order_by('user_id').values_list('user_type', flat=True))
+
+    def test_bulk_changes_take_the_same_queries_for_any_number_of_users(self):
+        few, many = self.make_users(2, 'few'), self.make_users(20, 'many')
+        with CaptureQueriesContext(connection) as few_queries:
+            self.classs.pma_admins.add(*few)
+        with CaptureQueriesContext(connection) as many_queries:
+            self.classs.pma_admins.add(*many)
+        self.assertEqual(len(few_queries), len(many_queries))
+        self.assertEqual(set(self.user_types(few + many)), {'PMA Admin'})
+
+        self.classs.pma_admins.remove(*many)
+        self.assertEqual(set(self.user_types(many)), {'Common'})
+
+    def test_clearing_keeps_admins_of_other_classes(self):
+        stays, goes = self.make_users(2)
+        self.classs.pma_admins.add(stays, goes)
+        self.other_class.pma_admins.add(stays)
+
+        self.classs.pma_admins.clear()
+        self.assertEqual(self.user_types([stays, goes]), ['PMA Admin', 'Common'])
+
+        stays.project_pma_admins.clear()
+        self.assertEqual(self.user_types([stays]), ['Common'])
+        stays.project_pma_admins.add(self.other_class)
+        self.assertEqual(self.user_types([stays]), ['PMA Admin'])
+
+    def test_other_user_types_are_left_alone(self):
+        guest, = self.make_users(1, 'guest')
+        Profile.objects.filter(user=guest).update(user_type='Anonymous')
+        self.assertEqual(sync_user_types([guest.pk]), (0, 0))
+        self.assertEqual(self.user_types([guest]), ['Anonymous'])
+
+    def test_recompute_command(self):
+        admin, former = self.make_users(2)
+        self.classs.pma_admins.add(admin)
+        Profile.objects.filter(user=admin).update(user_type='Common')
+        Profile.objects.filter(user=former).update(user_type='PMA Admin')
+
+        out = StringIO()
+        call_command('recompute_user_types', stdout=out)
+        self.assertIn('Made 1 profile PMA Admin and 1 profile Common', out.getvalue())
+        self.assertEqual(self.user_types([admin, former]), ['PMA Admin', 'Common'])
+
+
+@override_settings(ROSTER_EMAIL_DOMAIN='virginia.edu')
+class RosterImportTest(TestCase):
+
+    def setUp(self):
+        self.superuser = User.objects.create_superuser(username='superuser', email='superuser@example.com', password='password')
+        self.classs = Class.objects.create(name='Test Class', class_code='TEST101', owner=self.superuser, description='')
+
+    def test_students_are_created_and_enrolled_in_batches(self):
+        existing = User.objects.create_user(username='abc1de@virginia.edu', email='abc1de@virginia.edu')
+        rows = ['computing_id,first_name,last_name', 'abc1de,Ann,Existing', 'not an id!', ''] + [
+            f'st{i}x,Student,{i}' for i in range(250)]
+
+        with CaptureQueriesContext(connection) as queries:
+            result = roster.import_roster(self.classs, rows, batch_size=100)
+        self.assertEqual((result.rows, result.added, result.created, result.invalid), (252, 251, 250, 1))
+        self.assertEqual(result.invalid_rows, [(3, 'not an id!')])
+        # A handful of queries per batch of 100, not per student
+        self.assertLess(len(queries), 30)
+
+        self.assertEqual(self.classs.member_list.count(), 251)
+        self.assertTrue(self.classs.member_list.filter(pk=existing.pk).exists())
+        student = User.objects.get(email='st7x@virginia.edu')
+        self.assertEqual((student.username, student.last_name), ('st7x@virginia.edu', '7'))
+        self.assertFalse(student.has_usable_password())
+        self.assertEqual(student.profile.computing_id, 'st7x')
+
+        # Importing again changes nothing
+        result = roster.import_roster(self.classs, ['st1x@virginia.edu', 'ST2X'])
+        self.assertEqual((result.added, result.already_enrolled, result.created), (0, 2, 0))
+
+    def test_pma_admin_rosters_update_user_types(self):
+        result = roster.import_roster(self.classs, ['ta1a', 'ta2b'], role='pma_admins')
+        self.assertEqual(result.added, 2)
+        self.assertEqual(set(Profile.objects.filter(user__in=self.classs.pma_admins.all()).values_list('user_type', flat=True)),
+                         {'PMA Admin'})
+
+    def test_command_and_admin_view(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as csv_file:
+            csv_file.write('email\nfirst@example.com\nsecond@example.com\n')
+        self.addCleanup(os.remove, csv_file.name)
+        out = StringIO()
+        call_command('import_roster', 'TEST101', csv_file.name, stdout=out)
+        self.assertIn('2 added (2 new users)', out.getvalue())
+
+        self.client.login(username='superuser', password='password')
+        url = reverse('admin:classes_class_import_roster', args=[self.classs.pk])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        upload = SimpleUploadedFile('roster.csv', b'third@example.com\nfirst@example.com\n', content_type='text/csv')
+        response = self.client.post(url, {'roster': upload, 'role': 'members'}, follow=True)
+        self.assertContains(response, '1 added (1 new user), 1 already enrolled')
+        self.assertEqual(self.classs.member_list.count(), 3)
+
+        response = self.client.post(reverse('admin:classes_class_changelist'),
+                                    {'action': 'import_roster', '_selected_action': [self.classs.pk]})
+        self.assertRedirects(response, url)
@@ -0,0 +1,30 @@
+"""
+Profile.user_type for class PMA admins.
+
+A user's profile says 'PMA Admin' while they are a PMA admin of at least one
+class and 'Common' once they no longer are (other types, such as 'Anonymous',
+are left alone). classes.signals calls ``sync_user_types()`` with the users
+whose admin rights changed; it works on the whole set at once with two
+``UPDATE ... WHERE`` statements, however many users there are.
+``python manage.py recompute_user_types`` runs it for everyone.
+"""
+from django.db.models import Exists, OuterRef
+from profiles.models import Profile
+from .models import Class
+
+PMA_ADMIN = 'PMA Admin'
+COMMON = 'Common'
+
+
+def sync_user_types(user_ids=None):
+    """Bring the profiles of ``user_ids`` (all users when ``None``) in line; returns (promoted, demoted)."""
+    profiles = Profile.objects.all()
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return 0, 0
+        profiles = profiles.filter(user_id__in=user_ids)
+    admins_any_class = Exists(Class.pma_admins.through.objects.filter(user_id=OuterRef('user_id')))
+    promoted = profiles.filter(admins_any_class).exclude(user_type=PMA_ADMIN).update(user_type=PMA_ADMIN)
+    demoted = profiles.filter(~admins_any_class, user_type=PMA_ADMIN).update(user_type=COMMON)
+    return promoted, demoted
@@ -1,17 +1,22 @@
 from django.shortcuts import render, get_object_or_404
+from .cache import class_list as cached_class_list
 from .models import Class
 from django.contrib.auth.decorators import login_required
+from mysite.roles import get_roles
+from mysite.pagination import paginate
+from projects.views import PROJECTS_PER_PAGE
 
 def class_list(request):
-    classes = Class.objects.all()
+    classes = cached_class_list()
     return render(request, 'classes/all_classes.html', {'classes': classes})
 
 @login_required
 def class_detail(request, class_id):
     class_instance = get_object_or_404(Class, class_id=class_id)
-    projects = class_instance.project_set.all()
+    projects = class_instance.project_set.with_activity().order_by('-date_created', '-project_id')
     context = {
         'class': class_instance,
-        'projects': projects,
+        'projects': paginate(request, projects, PROJECTS_PER_PAGE),
+        'is_class_pma_admin': get_roles(request).is_pma_admin_of(class_instance),
     }
-    return render(request, 'classes/class.html', context)
\ No newline at end of file
+    return render(request, 'classes/class.html', context)
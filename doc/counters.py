@@ -0,0 +1,78 @@
+"""
+Document view counters.
+
+Views are counted with ``UPDATE ... SET views = views + n`` instead of
+load/increment/save, so concurrent hits can't overwrite each other and only the
+``views`` column is written. With ``DOCUMENT_VIEW_BUFFER_SIZE`` above 1 the
+increments are kept in process memory and flushed in batches, which turns a
+burst of hits on a popular document into a single row update.
+
+Each user's views of a document are counted once per
+``DOCUMENT_VIEW_DEDUPE_SECONDS``. The "already seen" marks live in the shared
+cache with that timeout rather than in the session, so counting a view never
+rewrites the session row and the marks expire on their own.
+"""
+import atexit
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from .models import Document
+
+
+class ViewCounter:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(int)
+        self._pending_total = 0
+        self._last_flush = time.monotonic()
+
+    def record(self, document_id):
+        buffer_size = getattr(settings, 'DOCUMENT_VIEW_BUFFER_SIZE', 1)
+        flush_seconds = getattr(settings, 'DOCUMENT_VIEW_FLUSH_SECONDS', 10)
+
+        with self._lock:
+            self._pending[document_id] += 1
+            self._pending_total += 1
+            due = (self._pending_total >= buffer_size
+                   or time.monotonic() - self._last_flush >= flush_seconds)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered increments, one UPDATE per distinct increment size."""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+            self._pending_total = 0
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+
+        by_increment = defaultdict(list)
+        for document_id, increment in pending.items():
+            by_increment[increment].append(document_id)
+
+        with transaction.atomic():
+            for increment, document_ids in by_increment.items():
+                Document.objects.filter(pk__in=document_ids).update(views=F('views') + increment)
+
+
+view_counter = ViewCounter()
+atexit.register(view_counter.flush)
+
+
+def record_view(document):
+    """Count one view of ``document`` and reflect it on the in-memory instance."""
+    view_counter.record(document.pk)
+    document.views += 1
+
+
+def is_first_view(user, document):
+    """True the first time ``user`` views ``document`` within the dedupe window, False after that."""
+    timeout = getattr(settings, 'DOCUMENT_VIEW_DEDUPE_SECONDS', 24 * 60 * 60)
+    # add() only writes if the key is missing, so two requests racing on the first view count it once
+    return cache.add(f'doc:viewed:{user.pk}:{document.pk}', 1, timeout)
@@ -0,0 +1,264 @@
+"""
+Serving document files to project members.
+
+Files on S3 are served by redirecting to a short-lived presigned URL, so the
+bytes never pass through a web worker. The URL is cached for a while and
+reused, which lets the browser's own cache hit on repeat views. Other storages
+(and S3 when ``DOCUMENT_DOWNLOAD_MODE`` is ``'stream'``) are streamed by the
+app with single-range ``Range`` support for PDF viewers and media seeking.
+
+Only types a browser shows without running anything from the file (PDFs,
+images, and text sent as text/plain) are served inline; anything else, an
+uploaded HTML or SVG page say, is always an attachment. Streamed responses come
+from the site's own origin, so they're also sandboxed and not sniffed.
+
+Uploaded file names are never reused (AWS_S3_FILE_OVERWRITE is off), so a
+file's size and modification time are cached by name and turned into the
+ETag and Last-Modified headers that browsers revalidate against.
+
+``afile_response()`` is the same for async views. It reaches S3 over HTTP with
+httpx on presigned URLs instead of through boto3, so streaming a file, or
+waiting on a slow S3 response, holds no worker thread.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+from email.utils import parsedate_to_datetime
+from asgiref.sync import sync_to_async
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import content_disposition_header, http_date, quote_etag
+from storages.backends.s3 import S3Storage
+from mysite.s3 import get_async_http_client, get_s3_client
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+FILE_INFO_TIMEOUT = 24 * 60 * 60
+INLINE_TYPES = {'application/pdf', 'image/png', 'image/jpeg', 'image/gif', 'text/plain'}
+
+
+def max_age():
+    """Seconds a browser may reuse a download before revalidating it."""
+    return getattr(settings, 'DOCUMENT_DOWNLOAD_MAX_AGE', 300)
+
+
+def is_s3(storage):
+    return isinstance(storage, S3Storage)
+
+
+def content_headers(filename, inline):
+    """``(content_type, content_disposition)`` for a file; ``inline`` is only honoured for INLINE_TYPES."""
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    if inline and content_type.startswith('text/') and content_type != 'text/html':
+        # CSV, Markdown and the like are shown as their source
+        content_type = 'text/plain'
+    inline = inline and content_type in INLINE_TYPES
+    return content_type, content_disposition_header(not inline, filename)
+
+
+def file_info_key(name):
+    return f'doc:file-info:{hashlib.sha1(name.encode()).hexdigest()}'
+
+
+def make_file_info(name, size, modified):
+    etag = quote_etag(hashlib.sha1(f'{name}:{size}:{modified.timestamp()}'.encode()).hexdigest()[:20])
+    return size, modified, etag
+
+
+def file_info(file):
+    """``(size, last_modified, etag)`` of a stored file, cached by file name."""
+    name = file.name
+    info = cache.get(file_info_key(name))
+    if info is None:
+        storage = file.storage
+        try:
+            if is_s3(storage):
+                # One HEAD request instead of the two storage.size() and get_modified_time() would make
+                head = get_s3_client().head_object(Bucket=storage.bucket_name, Key=name)
+                size, modified = head['ContentLength'], head['LastModified']
+            else:
+                size, modified = storage.size(name), storage.get_modified_time(name)
+        except FileNotFoundError:
+            raise Http404("The document's file is missing.")
+        except ClientError as error:
+            if error.response['ResponseMetadata']['HTTPStatusCode'] == 404:
+                raise Http404("The document's file is missing.")
+            raise
+        info = make_file_info(name, size, modified)
+        cache.set(file_info_key(name), info, FILE_INFO_TIMEOUT)
+    return info
+
+
+def signed_url(file, method):
+    """A one-minute presigned URL for ``method`` ('get_object' or 'head_object') on an S3 file; signing is local."""
+    return get_s3_client().generate_presigned_url(
+        method, Params={'Bucket': file.storage.bucket_name, 'Key': file.name}, ExpiresIn=60,
+    )
+
+
+async def afile_info(file):
+    """``file_info()`` for S3 files, without blocking the event loop."""
+    name = file.name
+    info = await cache.aget(file_info_key(name))
+    if info is None:
+        response = await get_async_http_client().head(signed_url(file, 'head_object'))
+        if response.status_code == 404:
+            raise Http404("The document's file is missing.")
+        response.raise_for_status()
+        info = make_file_info(name, int(response.headers['Content-Length']),
+                              parsedate_to_datetime(response.headers['Last-Modified']))
+        await cache.aset(file_info_key(name), info, FILE_INFO_TIMEOUT)
+    return info
+
+
+def parse_range(header, size):
+    """
+    The ``(start, end)`` byte positions (inclusive) asked for by a Range header,
+    None to send the whole file, or ``False`` if the range can't be satisfied.
+    Multiple ranges aren't supported and get the whole file, which the spec allows.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        # "bytes=-500" is the last 500 bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def iter_range(file, start, end):
+    storage = file.storage
+    if is_s3(storage):
+        body = get_s3_client().get_object(
+            Bucket=storage.bucket_name, Key=file.name, Range=f'bytes={start}-{end}',
+        )['Body']
+        try:
+            yield from body.iter_chunks(CHUNK_SIZE)
+        finally:
+            body.close()
+        return
+
+    with storage.open(file.name, 'rb') as opened:
+        opened.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = opened.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def aiter_range(file, start, end):
+    """``iter_range()`` for S3 files, as an async iterator."""
+    headers = {'Range': f'bytes={start}-{end}'}
+    async with get_async_http_client().stream('GET', signed_url(file, 'get_object'), headers=headers) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes(CHUNK_SIZE):
+            yield chunk
+
+
+def add_caching_headers(response, etag, modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(modified.timestamp())
+    # Private: only project members may see the file, so shared caches mustn't keep it
+    patch_cache_control(response, private=True, max_age=max_age())
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+def presigned_url(file, content_type, disposition):
+    """A presigned GET URL for the file, reused until it's close to expiring."""
+    name = file.name
+    expires = max(getattr(settings, 'DOCUMENT_DOWNLOAD_URL_EXPIRY', 3600), 2 * max_age())
+    cache_key = f'doc:download-url:{hashlib.sha1(f"{name}:{content_type}:{disposition}".encode()).hexdigest()}'
+    url = cache.get(cache_key)
+    if url is None:
+        url = get_s3_client().generate_presigned_url('get_object', Params={
+            'Bucket': file.storage.bucket_name,
+            'Key': name,
+            'ResponseContentType': content_type,
+            'ResponseContentDisposition': disposition,
+            'ResponseCacheControl': f'private, max-age={expires // 2}',
+        }, ExpiresIn=expires)
+        # Stop handing the URL out well before it expires, so a browser reusing it still has time to load it
+        cache.set(cache_key, url, expires // 2)
+    return url
+
+
+def redirect_response(url):
+    response = HttpResponseRedirect(url)
+    patch_cache_control(response, private=True, max_age=max_age())
+    return response
+
+
+def use_redirect(file):
+    return is_s3(file.storage) and getattr(settings, 'DOCUMENT_DOWNLOAD_MODE', 'redirect') == 'redirect'
+
+
+def file_response(request, file, inline=False):
+    """Redirect to or stream a stored file (a FieldFile), honouring conditional and Range requests."""
+    content_type, disposition = content_headers(os.path.basename(file.name), inline)
+    if use_redirect(file):
+        return redirect_response(presigned_url(file, content_type, disposition))
+    return streamed_response(request, content_type, disposition, file_info(file),
+                             lambda start, end: iter_range(file, start, end))
+
+
+async def afile_response(request, file, inline=False):
+    """``file_response()`` for async views."""
+    if not is_s3(file.storage) or not isinstance(request, ASGIRequest):
+        # Local files are read from disk, and a WSGI server would buffer an async iterator
+        # rather than stream it, so both take the sync path, in a thread
+        return await sync_to_async(file_response)(request, file, inline=inline)
+    content_type, disposition = content_headers(os.path.basename(file.name), inline)
+    if use_redirect(file):
+        return redirect_response(await sync_to_async(presigned_url)(file, content_type, disposition))
+    return streamed_response(request, content_type, disposition, await afile_info(file),
+                             lambda start, end: aiter_range(file, start, end))
+
+
+def streamed_response(request, content_type, disposition, info, read_range):
+    """
+    The file's bytes from ``read_range(start, end)``, or a 304 or 416 response,
+    for a file with ``info`` from ``file_info()``.
+    """
+    size, modified, etag = info
+    conditional = get_conditional_response(request, etag=etag, last_modified=int(modified.timestamp()))
+    if conditional is not None:
+        return add_caching_headers(conditional, etag, modified)
+
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    if 'Range' in request.headers and (if_range is None or if_range in (etag, http_date(modified.timestamp()))):
+        byte_range = parse_range(request.headers['Range'], size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    start, end = byte_range or (0, size - 1)
+    response = StreamingHttpResponse(
+        read_range(start, end),
+        status=206 if byte_range else 200,
+        content_type=content_type,
+    )
+    response['Content-Length'] = str(end - start + 1)
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = disposition
+    # The bytes are the uploader's, served from our origin: never sniff them into HTML, and never run their scripts
+    response['X-Content-Type-Options'] = 'nosniff'
+    response['Content-Security-Policy'] = 'sandbox'
+    return add_caching_headers(response, etag, modified)
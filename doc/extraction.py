@@ -0,0 +1,155 @@
+"""
+Text extraction from uploaded document files.
+
+The file is read from storage in chunks and never loaded into memory whole:
+plain text is decoded as it streams, while formats that need random access
+(PDF, and the zip-based office formats) are first spooled to a temporary file
+that only moves to disk once it grows past a few megabytes. Extraction stops
+once ``DOCUMENT_TEXT_MAX_CHARS`` characters have been collected.
+
+PDF support needs the optional ``pypdf`` package; without it PDFs are marked
+unsupported.
+"""
+import codecs
+import os
+import tempfile
+import zipfile
+from xml.etree.ElementTree import iterparse
+from django.conf import settings
+from django.utils import timezone
+from .models import Document, DocumentText
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # pragma: no cover - optional dependency
+    PdfReader = None
+
+TEXT_EXTENSIONS = {'.txt', '.md', '.csv'}
+# Zip member holding the text of each office format; slides are matched by prefix
+OFFICE_PARTS = {
+    '.docx': ['word/document.xml'],
+    '.pptx': ['ppt/slides/slide'],
+    '.xlsx': ['xl/sharedStrings.xml'],
+    '.odt': ['content.xml'],
+    '.odp': ['content.xml'],
+    '.ods': ['content.xml'],
+}
+SPOOL_MAX_MEMORY = 4 * 1024 * 1024
+
+
+class UnsupportedFormat(Exception):
+    pass
+
+
+class TextCollector:
+    """Accumulates text up to a character limit."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.parts = []
+        self.length = 0
+        self.truncated = False
+
+    @property
+    def full(self):
+        return self.length >= self.limit
+
+    def add(self, text):
+        if not text or self.full:
+            return
+        remaining = self.limit - self.length
+        if len(text) > remaining:
+            text = text[:remaining]
+            self.truncated = True
+        self.parts.append(text)
+        self.length += len(text)
+
+    def text(self):
+        return ''.join(self.parts)
+
+
+def spool(file):
+    """Copy ``file`` chunk by chunk into a seekable temporary file."""
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    for chunk in file.chunks():
+        spooled.write(chunk)
+    spooled.seek(0)
+    return spooled
+
+
+def extract_plain_text(file, collector):
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    for chunk in file.chunks():
+        collector.add(decoder.decode(chunk))
+        if collector.full:
+            return
+    collector.add(decoder.decode(b'', final=True))
+
+
+def extract_office_text(file, extension, collector):
+    prefixes = OFFICE_PARTS[extension]
+    with spool(file) as spooled, zipfile.ZipFile(spooled) as archive:
+        names = sorted(name for name in archive.namelist() if any(name.startswith(p) for p in prefixes))
+        for name in names:
+            with archive.open(name) as part:
+                for _, element in iterparse(part):
+                    # Paragraphs (OOXML and ODF), ODF headings and spreadsheet shared strings
+                    if element.tag.rsplit('}', 1)[-1] in ('p', 'h', 'si'):
+                        collector.add(''.join(element.itertext()))
+                        collector.add('\n')
+                        element.clear()  # Frees the parsed paragraph and keeps nested text from repeating
+                    if collector.full:
+                        return
+
+
+def extract_pdf_text(file, collector):
+    if PdfReader is None:
+        raise UnsupportedFormat("PDF extraction needs the pypdf package")
+    with spool(file) as spooled:
+        for page in PdfReader(spooled).pages:
+            collector.add(page.extract_text() or '')
+            collector.add('\n')
+            if collector.full:
+                return
+
+
+def extract_text(file, extension, limit):
+    """Return ``(text, truncated)`` for an open storage file."""
+    collector = TextCollector(limit)
+    if extension in TEXT_EXTENSIONS:
+        extract_plain_text(file, collector)
+    elif extension in OFFICE_PARTS:
+        extract_office_text(file, extension, collector)
+    elif extension == '.pdf':
+        extract_pdf_text(file, collector)
+    else:
+        raise UnsupportedFormat(f"No text extractor for {extension or 'files without an extension'}")
+    return collector.text(), collector.truncated
+
+
+def extract_document_text(document_id):
+    """Extract and store the text of one document, then reindex it for search."""
+    from . import search  # search imports the models this module uses
+
+    try:
+        document = Document.objects.get(pk=document_id)
+    except Document.DoesNotExist:
+        return None
+
+    extension = os.path.splitext(document.file.name)[1].lower()
+    limit = getattr(settings, 'DOCUMENT_TEXT_MAX_CHARS', 200_000)
+    values = {'text': '', 'truncated': False, 'error': '', 'extracted_at': timezone.now()}
+    try:
+        with document.file.open('rb') as file:
+            values['text'], values['truncated'] = extract_text(file, extension, limit)
+        values['status'] = 'done'
+    except UnsupportedFormat as e:
+        values.update(status='unsupported', error=str(e))
+    except Exception as e:
+        # Record the failure, then re-raise so the job queue retries it
+        DocumentText.objects.update_or_create(document=document, defaults={**values, 'status': 'failed', 'error': str(e)})
+        raise
+
+    document_text, _ = DocumentText.objects.update_or_create(document=document, defaults=values)
+    search.index_document(document)
+    return document_text
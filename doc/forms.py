@@ -21,6 +21,12 @@ class DocumentForm(forms.ModelForm):
             'due_date': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
         }
 
+class DocumentDetailsForm(DocumentForm):
+    """Document fields for a file that was uploaded straight to S3."""
+
+    class Meta(DocumentForm.Meta):
+        fields = ['title', 'description', 'due_date']
+
 class DocumentCommentForm(forms.ModelForm):
     class Meta:
         model = DocumentComment
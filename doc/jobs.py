@@ -0,0 +1,21 @@
+from django.conf import settings
+from jobs.queue import job
+from mysite.s3 import get_s3_client
+from .extraction import extract_document_text
+from .renditions import generate_rendition
+
+
+@job('doc.delete_s3_object')
+def delete_s3_object(file_key):
+    """Delete a removed document's file from S3; errors propagate so the job is retried."""
+    get_s3_client().delete_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=file_key)
+
+
+@job('doc.extract_text', max_attempts=3)
+def extract_text(document_id):
+    extract_document_text(document_id)
+
+
+@job('doc.generate_rendition', max_attempts=3)
+def render_preview(document_id):
+    generate_rendition(document_id)
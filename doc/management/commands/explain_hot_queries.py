@@ -0,0 +1,87 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from doc.models import Document, DocumentComment, Like, Tag
+from profiles.models import Profile
+from projects.models import JoinRequest, Project, ProjectComment
+
+
+def first_id(model):
+    return model.objects.order_by().values_list('pk', flat=True).first() or 0
+
+
+def hot_queries():
+    """``(description, index, queryset)`` for each hot query; ``index`` is a name or a tuple of leading columns."""
+    project, document, user = first_id(Project), first_id(Document), first_id(User)
+    queries = [
+        ("a project's documents, newest first", 'doc_document_project_recent',
+         Document.objects.filter(project_id=project).order_by('-date_uploaded', '-id')[:26]),
+        ("documents browsed by filters, newest first", 'doc_document_recent',
+         Document.objects.order_by('-date_uploaded', '-id')[:21]),
+        ("a document's comments, newest first", 'doc_comment_document_recent',
+         DocumentComment.objects.filter(document_id=document).order_by('-created_at', '-id')[:21]),
+        ("a project's comments, newest first", 'project_comment_recent',
+         ProjectComment.objects.filter(project_id=project).order_by('-created_at', '-id')[:21]),
+        ("a project's pending join requests", 'joinrequest_project_approved',
+         JoinRequest.objects.filter(project_id=project, approved=False)),
+        ("has this user liked this document", 'doc_like_unique_document_user',
+         Like.objects.filter(document_id=document, user_id=user)[:1]),
+        ("profiles by user type", 'profile_user_type',
+         Profile.objects.filter(user_type='PMA Admin')),
+        ("the tag cloud", ('usage_count',),
+         Tag.objects.filter(usage_count__gt=0).order_by('-usage_count', 'name')[:30]),
+    ]
+    if connection.vendor == 'postgresql':
+        # LIKE can't use an index on SQLite, which completes tags from the in-memory prefix index instead
+        queries.append(("tag autocomplete", 'doc_tag_name_prefix',
+                        Tag.objects.filter(name__startswith='a', usage_count__gt=0)))
+    return queries
+
+
+def index_names(model, index):
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    if isinstance(index, str):
+        names = [index]
+    else:
+        names = [name for name, info in constraints.items()
+                 if (info['index'] or info['unique']) and info['columns'][:len(index)] == list(index)]
+    if connection.vendor == 'sqlite' and any(constraints.get(name, {}).get('unique') for name in names):
+        # SQLite backs unique constraints declared in the table with indexes of its own naming
+        names.append(f'sqlite_autoindex_{table}_')
+    return names
+
+
+def explain(queryset):
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            # Test tables are small enough that a sequential scan wins; ask whether the index can be used at all
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the hot queries and fail unless each one uses its index."
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f"Query plans are only checked on SQLite and Postgres, not {connection.vendor}.")
+
+        failures = 0
+        for description, index, queryset in hot_queries():
+            plan = explain(queryset)
+            names = index_names(queryset.model, index)
+            used = next((name for name in names if name in plan), None)
+            if used:
+                self.stdout.write(f"  ok    {description}: {used}")
+            else:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f"  FAIL  {description}: expected {' or '.join(names) or index}"))
+            if options['verbosity'] > 1 or not used:
+                self.stdout.write('\n'.join(f"          {line}" for line in plan.splitlines()))
+
+        if failures:
+            raise CommandError(f"{failures} hot quer{'y does' if failures == 1 else 'ies do'} not use an index.")
+        self.stdout.write(self.style.SUCCESS(f"All hot queries use their indexes ({connection.vendor})."))
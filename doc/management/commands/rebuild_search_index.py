@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from doc.models import Document
+from doc import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for every document."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        self.stdout.write(f"Indexing with {type(backend).__name__}")
+
+        documents = Document.objects.select_related('extracted_text').prefetch_related('tags', 'comments').order_by('id')
+        total = 0
+        for document in documents.iterator(chunk_size=options['batch_size']):
+            backend.index(document)
+            total += 1
+            if total % options['batch_size'] == 0:
+                self.stdout.write(f"  {total} documents indexed")
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} documents."))
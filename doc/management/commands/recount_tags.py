@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from doc import tags
+
+
+class Command(BaseCommand):
+    help = "Recompute every tag's usage count from the documents that carry it."
+
+    def handle(self, *args, **options):
+        updated = tags.recount()
+        self.stdout.write(self.style.SUCCESS(f"Recounted {updated} tags."))
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:16
+
+import django.contrib.postgres.search
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_search_index(apps, schema_editor):
+    """The full-text index itself depends on the database: GIN on PostgreSQL, an FTS5 table on SQLite."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX doc_searchentry_vector_gin ON doc_searchentry USING gin (search_vector)'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE doc_searchentry_fts USING fts5("
+            "title, tags, description, comments, tokenize='porter unicode61')"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS doc_searchentry_vector_gin')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS doc_searchentry_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doc', '0009_merge_20241103_1311'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_entry', serialize=False, to='doc.document')),
+                ('title', models.TextField(blank=True)),
+                ('tags', models.TextField(blank=True)),
+                ('description', models.TextField(blank=True)),
+                ('comments', models.TextField(blank=True)),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def add_content_to_fts(apps, schema_editor):
+    """FTS5 tables can't gain columns, so rebuild the SQLite index with a content column."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS doc_searchentry_fts')
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE doc_searchentry_fts USING fts5("
+        "title, tags, description, comments, content, tokenize='porter unicode61')"
+    )
+    schema_editor.execute(
+        "INSERT INTO doc_searchentry_fts (rowid, title, tags, description, comments, content) "
+        "SELECT document_id, title, tags, description, comments, content FROM doc_searchentry"
+    )
+
+
+def remove_content_from_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS doc_searchentry_fts')
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE doc_searchentry_fts USING fts5("
+        "title, tags, description, comments, tokenize='porter unicode61')"
+    )
+    schema_editor.execute(
+        "INSERT INTO doc_searchentry_fts (rowid, title, tags, description, comments) "
+        "SELECT document_id, title, tags, description, comments FROM doc_searchentry"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doc', '0010_searchentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentText',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='extracted_text', serialize=False, to='doc.document')),
+                ('text', models.TextField(blank=True)),
+                ('truncated', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('unsupported', 'Unsupported'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('error', models.TextField(blank=True)),
+                ('extracted_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='searchentry',
+            name='content',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(add_content_to_fts, remove_content_from_fts),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+import doc.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doc', '0011_documenttext'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Rendition',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rendition', serialize=False, to='doc.document')),
+                ('kind', models.CharField(choices=[('thumbnail', 'Thumbnail'), ('snippet', 'Text snippet'), ('none', 'None')], default='none', max_length=20)),
+                ('file', models.FileField(blank=True, upload_to=doc.models.upload_to_renditions_folder)),
+                ('width', models.PositiveIntegerField(blank=True, null=True)),
+                ('height', models.PositiveIntegerField(blank=True, null=True)),
+                ('text', models.TextField(blank=True)),
+                ('source_name', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('done', 'Done'), ('unsupported', 'Unsupported'), ('failed', 'Failed')], default='done', max_length=20)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:47
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_tag_usage(apps, schema_editor):
+    Tag = apps.get_model('doc', 'Tag')
+    DocumentTag = apps.get_model('doc', 'Document').tags.through
+    usage = (DocumentTag.objects.filter(tag=OuterRef('pk')).order_by()
+             .values('tag').annotate(total=Count('pk')).values('total'))
+    Tag.objects.update(usage_count=Coalesce(Subquery(usage, output_field=IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doc', '0012_rendition'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='usage_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(count_tag_usage, migrations.RunPython.noop),
+    ]
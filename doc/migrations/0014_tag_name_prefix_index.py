@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def create_prefix_index(apps, schema_editor):
+    """A varchar_pattern_ops index lets Postgres serve ``name LIKE 'prefix%'`` under any collation."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE INDEX IF NOT EXISTS doc_tag_name_prefix ON doc_tag (name varchar_pattern_ops)')
+
+
+def drop_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS doc_tag_name_prefix')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doc', '0013_tag_usage_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_index, drop_prefix_index),
+    ]
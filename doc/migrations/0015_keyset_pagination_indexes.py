@@ -0,0 +1,25 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doc', '0014_tag_name_prefix_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['project', '-date_uploaded', '-id'], name='doc_document_project_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['-date_uploaded', '-id'], name='doc_document_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='documentcomment',
+            index=models.Index(fields=['document', '-created_at', '-id'], name='doc_comment_document_recent'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:59
+
+from django.db import migrations
+from django.db.models import Count, IntegerField, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_likes(apps, schema_editor):
+    """Keep the first like of each (document, user) pair and recount the documents that had more."""
+    Like = apps.get_model('doc', 'Like')
+    Document = apps.get_model('doc', 'Document')
+    duplicates = (Like.objects.order_by().values('document_id', 'user_id')
+                  .annotate(count=Count('pk'), first=Min('pk')).filter(count__gt=1))
+    document_ids = set()
+    for pair in duplicates:
+        Like.objects.filter(document_id=pair['document_id'], user_id=pair['user_id']).exclude(pk=pair['first']).delete()
+        document_ids.add(pair['document_id'])
+    if document_ids:
+        likes = (Like.objects.filter(document=OuterRef('pk')).order_by()
+                 .values('document').annotate(total=Count('pk')).values('total'))
+        Document.objects.filter(pk__in=document_ids).update(
+            likes=Coalesce(Subquery(likes, output_field=IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doc', '0015_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_likes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        # A separate migration, so Postgres has no pending deletes on doc_like when the constraint is added
+        ('doc', '0016_remove_duplicate_likes'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='like',
+            constraint=models.UniqueConstraint(fields=('document', 'user'), name='doc_like_unique_document_user'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.16 on 2026-10-18 13:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0011_drop_redundant_foreign_key_index'),
+        ('doc', '0017_like_unique_document_user'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='document',
+            name='project',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='projects.project'),
+        ),
+        migrations.AlterField(
+            model_name='documentcomment',
+            name='document',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='doc.document'),
+        ),
+        migrations.AlterField(
+            model_name='like',
+            name='document',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='liked_by_users', to='doc.document'),
+        ),
+    ]
@@ -1,10 +1,11 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
 from projects.models import Project
 from classes.models import Class
-from django.conf import settings
-import boto3
+from jobs.queue import enqueue
 
 def upload_to_project_folder(instance, filename):
     # instance.project gives access to the project this document belongs to
@@ -12,12 +13,23 @@ def upload_to_project_folder(instance, filename):
 
 class Tag(models.Model):
     name = models.CharField(max_length=50, unique=True)
+    # Number of documents with this tag, kept up to date by doc.signals (see doc/tags.py)
+    usage_count = models.PositiveIntegerField(default=0, db_index=True)
 
     def __str__(self):
         return self.name
 
+    @staticmethod
+    def normalize(name):
+        """Lowercase, trim and collapse whitespace, so 'Lab  Notes ' and 'lab notes' are one tag."""
+        return ' '.join(name.lower().split())[:50]
+
     def clean(self):
-        self.name = self.name.lower().strip()
+        self.name = self.normalize(self.name)
+
+    def save(self, *args, **kwargs):
+        self.name = self.normalize(self.name)
+        super().save(*args, **kwargs)
 
 class Document(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='documents')
@@ -26,13 +38,21 @@ class Document(models.Model):
     date_uploaded = models.DateTimeField(auto_now_add=True)
     description = models.TextField(blank=True, help_text="Describe the contents of this file")
     # class_name = models.CharField(max_length=255)
-    project = models.ForeignKey(Project, on_delete=models.CASCADE, null=True)
+    # Indexed by doc_document_project_recent, which leads with project
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, null=True, db_index=False)
     tags = models.ManyToManyField(Tag, related_name='documents', blank=True)
     views = models.IntegerField(default=0)
     likes = models.IntegerField(default=0)
     due_date = models.DateField(null=True, blank=True, help_text="Optional: Is there a due date for this document?")
     liked_by = models.ManyToManyField(User, through='Like', related_name='liked_documents_set')
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of a project's documents and of browsing by filters (see mysite/pagination.py)
+            models.Index(fields=['project', '-date_uploaded', '-id'], name='doc_document_project_recent'),
+            models.Index(fields=['-date_uploaded', '-id'], name='doc_document_recent'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -41,50 +61,59 @@ class Document(models.Model):
     
 
     def delete_file_from_s3(self):
-        """This is a helper method to delete file from S3"""
-        try:
-            s3 = boto3.client('s3',
-                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                region_name=settings.AWS_S3_REGION_NAME
-            )
-            s3.delete_object(
-                Bucket=settings.AWS_STORAGE_BUCKET_NAME,
-                Key=self.file.name
-            )
-            return True
-        except Exception as e:
-            print(f"Error deleting file from S3: {e}")
-            return False
+        """Queue the document's file for deletion from S3 (see doc.jobs)."""
+        return enqueue('doc.delete_s3_object', file_key=self.file.name)
 
     def delete(self, *args, **kwargs):
         user = kwargs.pop('user', None)
-        if not user or (user != self.owner and user not in self.project.get_all_pma_admins()):
+        if not user or (user != self.owner and not self.project.has_pma_admin(user)):
             raise ValidationError("Only the document owner or PMA admins can delete this document.")
-        
-        # Delete the file from S3 first
-        self.delete_file_from_s3()
-        
-        # Then delete the model instance
-        super().delete(*args, **kwargs)
+
+        with transaction.atomic():
+            # The delete jobs are written in this transaction, so the files are only removed if the row is
+            self.delete_file_from_s3()
+            rendition = Rendition.objects.filter(document=self).exclude(file='').first()
+            if rendition is not None:
+                enqueue('doc.delete_s3_object', file_key=rendition.file.name)
+            super().delete(*args, **kwargs)
     
     def is_liked_by(self, user):
         return self.liked_by_users.filter(user=user).exists()
 
     def toggle_like(self, user):
-        like, created = Like.objects.get_or_create(document=self, user=user)
-        if not created:  # If the like already existed
-            like.delete()  # Remove the like
-            self.likes -= 1
-            self.save()
-            return False  # Indicates the document was unliked
-        else:  # If this is a new like
-            self.likes += 1
-            self.save()
-            return True  # Indicates the document was liked
+        """
+        Like or unlike the document for ``user``; returns True if it is now liked.
+
+        ``likes`` is moved by one with a single ``UPDATE ... SET likes = likes ± 1``
+        for the Like row this call actually deleted or created, so it stays exact
+        under concurrent toggles without recounting, and the rest of the row is
+        never rewritten. A user can like a document only once (a unique
+        constraint), so when two requests both try to add the like, the second
+        finds it already there and leaves the count alone.
+
+        Since the count is no longer recomputed from the rows, Like rows created
+        or deleted any other way (``Like.objects.create()``, the admin) leave
+        ``likes`` stale; likes should only change through here.
+        """
+        with transaction.atomic():
+            deleted, _ = Like.objects.filter(document=self, user=user).delete()
+            if deleted:
+                change = F('likes') - 1
+            else:
+                try:
+                    with transaction.atomic():
+                        Like.objects.create(document=self, user=user)
+                    change = F('likes') + 1
+                except IntegrityError:
+                    change = None
+            if change is not None:
+                Document.objects.filter(pk=self.pk).update(likes=change)
+        self.refresh_from_db(fields=['likes'])
+        return not deleted
 
 class DocumentComment(models.Model):
-    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='comments')
+    # Indexed by doc_comment_document_recent, which leads with document
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='comments', db_index=False)
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
@@ -92,6 +121,10 @@ class DocumentComment(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of a document's comments (see mysite/pagination.py)
+            models.Index(fields=['document', '-created_at', '-id'], name='doc_comment_document_recent'),
+        ]
 
     def __str__(self):
         return f'Comment by {self.author.username} on {self.document.title}'
@@ -102,9 +135,86 @@ class DocumentComment(models.Model):
         super().save(*args, **kwargs)
 
 class Like(models.Model):
-    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='liked_by_users') 
+    # Indexed by doc_like_unique_document_user, which leads with document
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='liked_by_users', db_index=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     date_liked = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # Also the index for "has this user liked this document?"
+            models.UniqueConstraint(fields=['document', 'user'], name='doc_like_unique_document_user'),
+        ]
+
+    def __str__(self):
+        return f'{self.user.username} liked {self.document.title}'
+
+
+class SearchEntry(models.Model):
+    """
+    Searchable text of a document, denormalized from the document, its tags and its comments.
+
+    Kept up to date by doc.signals; see doc.search for the backends that index it.
+    """
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, primary_key=True, related_name='search_entry')
+    title = models.TextField(blank=True)
+    tags = models.TextField(blank=True)
+    description = models.TextField(blank=True)
+    comments = models.TextField(blank=True)
+    content = models.TextField(blank=True)  # Text extracted from the file, see DocumentText
+    search_vector = SearchVectorField(null=True)  # Only populated on PostgreSQL
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Search entry for {self.title}'
+
+
+class DocumentText(models.Model):
+    """Text extracted from a document's file by doc.extraction, limited to DOCUMENT_TEXT_MAX_CHARS."""
+    STATUS_CHOICES = [('pending', 'Pending'),
+                      ('done', 'Done'),
+                      ('unsupported', 'Unsupported'),
+                      ('failed', 'Failed')
+                      ]
+
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, primary_key=True, related_name='extracted_text')
+    text = models.TextField(blank=True)
+    truncated = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(blank=True)
+    extracted_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'Text of {self.document.title} ({self.status})'
+
+
+def upload_to_renditions_folder(instance, filename):
+    # Next to the original, in the project's folder
+    return f'documents/project-{instance.document.project.project_id}/renditions/{filename}'
+
+
+class Rendition(models.Model):
+    """A lightweight preview of a document's file, generated in the background by doc.renditions."""
+    KIND_CHOICES = [('thumbnail', 'Thumbnail'),
+                    ('snippet', 'Text snippet'),
+                    ('none', 'None')
+                    ]
+    STATUS_CHOICES = [('done', 'Done'),
+                      ('unsupported', 'Unsupported'),
+                      ('failed', 'Failed')
+                      ]
+
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, primary_key=True, related_name='rendition')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='none')
+    file = models.FileField(upload_to=upload_to_renditions_folder, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    text = models.TextField(blank=True)
+    # The document file this was made from; a different name means the document was replaced
+    source_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='done')
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
-        return f'{self.user.username} liked {self.document.title}'
\ No newline at end of file
+        return f'{self.get_kind_display()} of {self.document.title} ({self.status})'
@@ -0,0 +1,111 @@
+"""
+Preview renditions of uploaded documents.
+
+Images are downscaled to a JPEG thumbnail. PDFs get a thumbnail of the largest
+image on their first page (the scanned page, for scanned handouts), or a text
+snippet of the first page when it has no images. Plain text files get a text
+snippet. Thumbnails are stored under ``documents/project-<id>/renditions/``.
+
+Renditions are generated by the ``doc.generate_rendition`` job and regenerated
+when a document's file is replaced (see doc.signals). Thumbnails need the
+optional ``Pillow`` package; without it only text snippets are made.
+"""
+import io
+import os
+from django.core.files.base import ContentFile
+from jobs.queue import enqueue
+from .extraction import PdfReader, TEXT_EXTENSIONS, UnsupportedFormat, spool
+from .models import Document, Rendition
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp'}
+THUMBNAIL_SIZE = (320, 320)
+SNIPPET_CHARS = 400
+
+
+def thumbnail(image):
+    """JPEG bytes and size of ``image`` shrunk to fit THUMBNAIL_SIZE."""
+    image.draft('RGB', THUMBNAIL_SIZE)  # Lets JPEGs decode at a reduced scale
+    image.thumbnail(THUMBNAIL_SIZE)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=80, optimize=True)
+    return output.getvalue(), image.size
+
+
+def render_image(file):
+    if Image is None:
+        raise UnsupportedFormat("Image thumbnails need the Pillow package")
+    with spool(file) as spooled, Image.open(spooled) as image:
+        return thumbnail(image)
+
+
+def render_pdf(file):
+    """A thumbnail of the first page's largest image, or failing that a snippet of its text."""
+    if PdfReader is None:
+        raise UnsupportedFormat("PDF previews need the pypdf package")
+    with spool(file) as spooled:
+        page = PdfReader(spooled).pages[0]
+        if Image is not None:
+            images = [image.image for image in page.images]
+            if images:
+                return thumbnail(max(images, key=lambda image: image.width * image.height))
+        return (page.extract_text() or '').strip()[:SNIPPET_CHARS]
+
+
+def render_text(file):
+    # Enough bytes for the snippet even if every character is multi-byte
+    return file.read(SNIPPET_CHARS * 4).decode('utf-8', errors='ignore')[:SNIPPET_CHARS].strip()
+
+
+def render(file, extension):
+    """``(jpeg_bytes, (width, height))`` for a thumbnail, or a string for a snippet, from an open storage file."""
+    if extension in IMAGE_EXTENSIONS:
+        return render_image(file)
+    if extension == '.pdf':
+        return render_pdf(file)
+    if extension in TEXT_EXTENSIONS:
+        return render_text(file)
+    raise UnsupportedFormat(f"No preview for {extension or 'files without an extension'}")
+
+
+def generate_rendition(document_id):
+    """Render and store the preview of one document, replacing any earlier one."""
+    document = Document.objects.select_related('project').filter(pk=document_id).first()
+    if document is None:
+        return None
+    old = Rendition.objects.filter(document=document).first()
+    rendition = Rendition(document=document, source_name=document.file.name)
+    extension = os.path.splitext(document.file.name)[1].lower()
+
+    try:
+        with document.file.open('rb') as file:
+            result = render(file, extension)
+    except UnsupportedFormat as e:
+        rendition.status, rendition.error = 'unsupported', str(e)
+    except Exception as e:
+        # Keep any earlier preview (and its file, and the source it was made from) but record the
+        # failure; the job queue retries it
+        if old is not None:
+            old.status, old.error = 'failed', str(e)
+            old.save(update_fields=['status', 'error'])
+        else:
+            Rendition.objects.create(document=document, source_name=document.file.name, status='failed', error=str(e))
+        raise
+    else:
+        if isinstance(result, str):
+            rendition.kind, rendition.text = 'snippet', result
+        else:
+            content, (rendition.width, rendition.height) = result
+            rendition.kind = 'thumbnail'
+            rendition.file.save(f'{document.pk}-thumbnail.jpg', ContentFile(content), save=False)
+    rendition.save()
+
+    if old is not None and old.file and old.file.name != rendition.file.name:
+        enqueue('doc.delete_s3_object', file_key=old.file.name)
+    return rendition
@@ -0,0 +1,183 @@
+"""
+Full-text search over documents.
+
+Each document has a SearchEntry row holding its title, tag names, description,
+comments and extracted file text (see doc.extraction) as plain text. A backend keeps a full-text index of those rows and
+turns a user's query into a filtered, ranked Document queryset:
+
+* PostgresSearchBackend - a weighted ``tsvector`` column with a GIN index.
+* SQLiteSearchBackend - an FTS5 virtual table ranked with bm25().
+* DatabaseSearchBackend - ``icontains`` fallback for anything else.
+
+The backend is picked from the database vendor, or from the
+``DOCUMENT_SEARCH_BACKEND`` setting (a dotted path) when it is set.
+
+Backends order results by ``rank_key``, the rank scaled to an integer (see
+``ranked()``), and don't annotate the float rank itself, so it's computed once
+per row. Results are keyset-paginated, and a float rank (a float4 from
+Postgres's ts_rank) doesn't compare equal to itself after a trip through the
+JSON cursor, which would repeat or skip rows at page boundaries.
+"""
+import re
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import BigIntegerField, Case, F, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+from django.utils.module_loading import import_string
+from projects.models import Project
+from .models import Document, DocumentText, SearchEntry
+
+WORD_RE = re.compile(r'\w+')
+FTS_TABLE = 'doc_searchentry_fts'
+RANK_SCALE = 1_000_000
+SEARCH_ORDER = ('-rank_key', '-date_uploaded', '-id')
+
+
+def ranked(queryset, rank):
+    """``queryset`` with ``rank`` (a float expression) as the integer ``rank_key``, in SEARCH_ORDER."""
+    return queryset.annotate(rank_key=Cast(rank * RANK_SCALE, BigIntegerField())).order_by(*SEARCH_ORDER)
+
+
+def accessible_documents(user):
+    """Documents in projects the user can see (see Project.objects.accessible_projects_for), filtered in SQL."""
+    return Document.objects.filter(project__in=Project.objects.accessible_projects_for(user).values('pk'))
+
+
+class DatabaseSearchBackend:
+    """Portable backend: substring matching, ranked by which field matched."""
+
+    def index(self, document):
+        tags = ' '.join(tag.name for tag in document.tags.all())
+        comments = '\n'.join(comment.content for comment in document.comments.all())
+        try:
+            content = document.extracted_text.text
+        except DocumentText.DoesNotExist:
+            content = ''
+        entry, _ = SearchEntry.objects.update_or_create(
+            document=document,
+            defaults={
+                'title': document.title,
+                'tags': tags,
+                'description': document.description,
+                'comments': comments,
+                'content': content,
+            },
+        )
+        return entry
+
+    def remove(self, document_id):
+        SearchEntry.objects.filter(document_id=document_id).delete()
+
+    def search(self, queryset, query):
+        words = WORD_RE.findall(query)
+        if not words:
+            return queryset.none()
+
+        matches = Q()
+        for word in words:
+            matches &= (Q(search_entry__title__icontains=word) | Q(search_entry__tags__icontains=word)
+                        | Q(search_entry__description__icontains=word) | Q(search_entry__comments__icontains=word)
+                        | Q(search_entry__content__icontains=word))
+        rank = Case(
+            When(search_entry__title__icontains=words[0], then=Value(4.0)),
+            When(search_entry__tags__icontains=words[0], then=Value(3.0)),
+            When(search_entry__description__icontains=words[0], then=Value(2.0)),
+            default=Value(1.0),
+            output_field=FloatField(),
+        )
+        return ranked(queryset.filter(matches), rank)
+
+
+class PostgresSearchBackend(DatabaseSearchBackend):
+    """Weighted tsvector (title A, tags B, description C, comments and file text D) behind a GIN index."""
+
+    config = 'english'
+
+    def index(self, document):
+        entry = super().index(document)
+        SearchEntry.objects.filter(pk=entry.pk).update(search_vector=(
+            SearchVector('title', weight='A', config=self.config)
+            + SearchVector('tags', weight='B', config=self.config)
+            + SearchVector('description', weight='C', config=self.config)
+            + SearchVector('comments', weight='D', config=self.config)
+            + SearchVector('content', weight='D', config=self.config)
+        ))
+        return entry
+
+    def search(self, queryset, query):
+        search_query = SearchQuery(query, search_type='websearch', config=self.config)
+        return ranked(queryset.filter(search_entry__search_vector=search_query),
+                      SearchRank(F('search_entry__search_vector'), search_query))
+
+
+class SQLiteSearchBackend(DatabaseSearchBackend):
+    """FTS5 index for local development, ranked by bm25 with the same field weights."""
+
+    weights = '10.0, 5.0, 2.0, 1.0, 1.0'  # title, tags, description, comments, content
+
+    def index(self, document):
+        entry = super().index(document)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [entry.pk])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, tags, description, comments, content) '
+                f'VALUES (%s, %s, %s, %s, %s, %s)',
+                [entry.pk, entry.title, entry.tags, entry.description, entry.comments, entry.content],
+            )
+        return entry
+
+    def remove(self, document_id):
+        super().remove(document_id)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [document_id])
+
+    def search(self, queryset, query):
+        words = WORD_RE.findall(query)
+        if not words:
+            return queryset.none()
+
+        # Quote every word so user input can't inject FTS5 syntax; each one is a prefix match
+        match = ' '.join(f'"{word}"*' for word in words)
+        table = Document._meta.db_table
+        # bm25() is lower for better matches, so negate it to sort like the other backends
+        rank = RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, {self.weights}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{table}"."id"',
+            [match],
+            output_field=FloatField(),
+        )
+        matching = queryset.filter(id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match]))
+        return ranked(matching, rank)
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        backend_path = getattr(settings, 'DOCUMENT_SEARCH_BACKEND', None)
+        if backend_path:
+            _backend = import_string(backend_path)()
+        elif connection.vendor == 'postgresql':
+            _backend = PostgresSearchBackend()
+        elif connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names():
+            _backend = SQLiteSearchBackend()
+        else:
+            _backend = DatabaseSearchBackend()
+    return _backend
+
+
+def index_document(document):
+    return get_backend().index(document)
+
+
+def remove_document(document_id):
+    get_backend().remove(document_id)
+
+
+def search_documents(user, query):
+    """Documents the user can see that match ``query``, best match first, in SEARCH_ORDER."""
+    return get_backend().search(accessible_documents(user), query)
@@ -0,0 +1,189 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from doc.models import Document, DocumentComment, Like, Rendition, Tag
+from doc import search, tags
+from jobs.queue import enqueue
+from mysite import fragments
+
+
+def deleted_directly(model, origin):
+    """True when ``delete()`` was called on ``model`` itself rather than reached through a cascade."""
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return origin_model is model
+
+
+@receiver(post_save, sender=Document)
+def index_document(sender, instance, created, **kwargs):
+    search.index_document(instance)
+    # A rendition made from a different file means the document's file was replaced
+    replaced = not created and Rendition.objects.filter(document=instance).exclude(source_name=instance.file.name).exists()
+    if created or replaced:
+        # Extracting text and rendering previews can be slow, so leave them to the job worker
+        enqueue('doc.extract_text', key=f'extract:{instance.pk}:{instance.file.name}', document_id=instance.pk)
+        enqueue('doc.generate_rendition', key=f'rendition:{instance.pk}:{instance.file.name}', document_id=instance.pk)
+
+
+@receiver(post_delete, sender=Document)
+def remove_document_from_index(sender, instance, **kwargs):
+    search.remove_document(instance.pk)
+
+
+@receiver(m2m_changed, sender=Document.tags.through)
+def reindex_tagged_documents(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Reindex documents whose tags changed.
+    """
+    if not reverse:
+        if action in ['post_add', 'post_remove', 'post_clear']:
+            search.index_document(instance)
+        return
+
+    # instance is a tag; pk_set holds document ids, except on clear
+    if action == 'pre_clear':
+        instance._cleared_document_ids = list(instance.documents.values_list('id', flat=True))
+    elif action in ['post_add', 'post_remove', 'post_clear']:
+        document_ids = pk_set if action != 'post_clear' else instance._cleared_document_ids
+        for document in Document.objects.filter(id__in=document_ids):
+            search.index_document(document)
+
+
+@receiver(post_save, sender=Tag)
+def reindex_renamed_tag(sender, instance, created, **kwargs):
+    if not created:
+        for document in instance.documents.all():
+            search.index_document(document)
+
+
+@receiver(post_delete, sender=Tag)
+def reindex_deleted_tag(sender, instance, **kwargs):
+    # The documents are remembered by remember_deleted_tag_documents, before the through rows go
+    document_ids = instance._tagged_document_ids
+
+    def reindex():
+        for document in Document.objects.filter(id__in=document_ids):
+            search.index_document(document)
+    transaction.on_commit(reindex)
+
+
+@receiver(m2m_changed, sender=Document.tags.through)
+def count_tag_usage(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Keep Tag.usage_count in step with the documents' tags. Removals are counted
+    from the through rows that actually exist, since remove() accepts tags a
+    document doesn't have.
+    """
+    DocumentTag = Document.tags.through
+    if not reverse:
+        # instance is a document; pk_set holds tag ids
+        if action == 'post_add':
+            tags.adjust_usage(pk_set, 1)
+        elif action == 'pre_remove':
+            instance._removed_tag_ids = list(
+                DocumentTag.objects.filter(document=instance, tag_id__in=pk_set).values_list('tag_id', flat=True))
+        elif action == 'pre_clear':
+            instance._removed_tag_ids = list(DocumentTag.objects.filter(document=instance).values_list('tag_id', flat=True))
+        elif action in ['post_remove', 'post_clear']:
+            tags.adjust_usage(instance._removed_tag_ids, -1)
+        return
+
+    # instance is a tag; pk_set holds document ids
+    if action == 'post_add':
+        tags.adjust_usage([instance.pk], len(pk_set))
+    elif action == 'pre_remove':
+        instance._removed_document_count = DocumentTag.objects.filter(tag=instance, document_id__in=pk_set).count()
+    elif action == 'pre_clear':
+        instance._removed_document_count = DocumentTag.objects.filter(tag=instance).count()
+    elif action in ['post_remove', 'post_clear']:
+        tags.adjust_usage([instance.pk], -instance._removed_document_count)
+
+
+@receiver(pre_delete, sender=Document)
+def uncount_deleted_document_tags(sender, instance, **kwargs):
+    # The document's through rows are deleted without an m2m_changed signal; this runs in the delete's transaction
+    tags.adjust_usage(instance.tags.values_list('pk', flat=True), -1)
+
+
+@receiver(post_save, sender=DocumentComment)
+def index_new_comment(sender, instance, **kwargs):
+    search.index_document(instance.document)
+
+
+@receiver(post_delete, sender=DocumentComment)
+def remove_deleted_comment(sender, instance, origin=None, **kwargs):
+    # When the document itself is being deleted there's nothing left to reindex
+    if deleted_directly(DocumentComment, origin):
+        search.index_document(instance.document)
+
+
+# Cached template fragments (see mysite/fragments.py)
+
+def invalidate_documents(document_ids):
+    """Invalidate the tag lists of these documents and the document lists of their projects."""
+    document_ids = list(document_ids)
+    fragments.bump('document-tags', *document_ids)
+    project_ids = Document.objects.filter(id__in=document_ids).values_list('project_id', flat=True).distinct()
+    fragments.bump('project-documents', *project_ids)
+
+
+@receiver(post_save, sender=Document)
+@receiver(post_delete, sender=Document)
+def invalidate_document_list(sender, instance, **kwargs):
+    fragments.bump('project-documents', instance.project_id)
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+def invalidate_like_counts(sender, instance, **kwargs):
+    # Document.toggle_like moves likes with an UPDATE, which sends no signal of its own
+    project_ids = Document.objects.filter(pk=instance.document_id).values_list('project_id', flat=True)
+    fragments.bump('project-documents', *project_ids)
+
+
+@receiver(post_save, sender=Rendition)
+def invalidate_document_previews(sender, instance, **kwargs):
+    fragments.bump('project-documents', instance.document.project_id)
+
+
+@receiver(m2m_changed, sender=Document.tags.through)
+def invalidate_tag_lists(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ['post_add', 'post_remove', 'post_clear']:
+            fragments.bump('document-tags', instance.pk)
+            fragments.bump('project-documents', instance.project_id)
+        return
+
+    if action == 'pre_clear':
+        instance._fragment_document_ids = list(instance.documents.values_list('id', flat=True))
+    elif action in ['post_add', 'post_remove', 'post_clear']:
+        invalidate_documents(pk_set if action != 'post_clear' else instance._fragment_document_ids)
+
+
+@receiver(post_save, sender=Tag)
+def invalidate_renamed_tag(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_documents(instance.documents.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_deleted_tag_documents(sender, instance, **kwargs):
+    # Deleting a tag removes its through rows without an m2m_changed signal
+    instance._tagged_document_ids = list(instance.documents.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def invalidate_deleted_tag(sender, instance, **kwargs):
+    invalidate_documents(instance._tagged_document_ids)
+
+
+@receiver(post_save, sender=DocumentComment)
+@receiver(post_delete, sender=DocumentComment)
+def invalidate_document_comments(sender, instance, **kwargs):
+    fragments.bump('document-comments', instance.document_id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tag_prefix_index(sender, **kwargs):
+    tags.invalidate_prefix_index()
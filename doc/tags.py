@@ -0,0 +1,183 @@
+"""
+Resolving and attaching tags.
+
+``parse()`` turns the comma-separated tags box into normalized, deduplicated
+names. ``resolve()`` maps names to Tag rows in one SELECT, creating the missing
+ones with a single ``bulk_create(ignore_conflicts=True)`` (so two uploads
+adding the same new tag at once don't collide) and one more SELECT for their
+ids. ``add_tags()`` and ``set_tags()`` then attach or replace a document's tags
+with one through-table insert and one delete.
+
+``Tag.usage_count`` is the number of documents carrying each tag. doc.signals
+adjusts it with ``UPDATE ... SET usage_count = usage_count + n`` on every
+change to document tags, and ``python manage.py recount_tags`` rebuilds it from
+scratch. ``popular()`` reads it for the tag cloud.
+
+``suggest()`` completes a prefix for the autocomplete endpoint. On Postgres it
+is a ``LIKE 'prefix%'`` query served by the ``varchar_pattern_ops`` index on
+``Tag.name`` (doc migration 0014). Other databases can't use an index for that,
+so the names and counts are kept as a sorted list and searched with bisect. The
+list is cached under a version number that moves on whenever tags are created,
+renamed or deleted, or recounted. Usage counts change on every upload, so they
+don't move the version; instead the list expires TAG_PREFIX_INDEX_TIMEOUT
+seconds after it was built, in the cache and in each process alike, which bounds
+how stale suggestion order and counts (and a tag back in use) can get.
+"""
+import bisect
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from .models import Document, Tag
+
+
+def parse(tags_input):
+    """Normalized tag names from comma-separated input, without duplicates, in input order."""
+    names = (Tag.normalize(name) for name in tags_input.split(','))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def resolve(names):
+    """Tag rows for ``names``, creating any that don't exist yet."""
+    if not names:
+        return []
+    tags = {tag.name: tag for tag in Tag.objects.filter(name__in=names)}
+    missing = [name for name in names if name not in tags]
+    if missing:
+        Tag.objects.bulk_create([Tag(name=name) for name in missing], ignore_conflicts=True)
+        # bulk_create sends no post_save, so the prefix index has to be told directly
+        invalidate_prefix_index()
+        tags.update((tag.name, tag) for tag in Tag.objects.filter(name__in=missing))
+    return [tags[name] for name in names]
+
+
+@transaction.atomic
+def add_tags(document, tags_input):
+    """Attach the tags named in ``tags_input`` to ``document``, keeping the ones it has."""
+    tags = resolve(parse(tags_input))
+    if tags:
+        document.tags.add(*tags)
+    return tags
+
+
+@transaction.atomic
+def set_tags(document, tags_input):
+    """Make the tags named in ``tags_input`` the document's only tags."""
+    tags = resolve(parse(tags_input))
+    current = set(document.tags.values_list('pk', flat=True))
+    wanted = {tag.pk for tag in tags}
+    if current - wanted:
+        document.tags.remove(*(current - wanted))
+    if wanted - current:
+        document.tags.add(*(wanted - current))
+    return tags
+
+
+def adjust_usage(tag_ids, change):
+    """Add ``change`` to the usage count of each tag in ``tag_ids`` (an id may repeat)."""
+    by_tag = {}
+    for tag_id in tag_ids:
+        by_tag[tag_id] = by_tag.get(tag_id, 0) + change
+    for amount in set(by_tag.values()) - {0}:
+        ids = [tag_id for tag_id, total in by_tag.items() if total == amount]
+        # Never below zero, even if rows were changed behind the signals' back
+        Tag.objects.filter(pk__in=ids).update(usage_count=Greatest(F('usage_count') + amount, 0))
+
+
+def recount(tags=None):
+    """Recompute usage counts from the through table, for all tags or the given queryset."""
+    usage = (Document.tags.through.objects.filter(tag=OuterRef('pk')).order_by()
+             .values('tag').annotate(total=Count('pk')).values('total'))
+    tags = Tag.objects.all() if tags is None else tags
+    updated = tags.update(usage_count=Coalesce(Subquery(usage, output_field=IntegerField()), 0))
+    invalidate_prefix_index()
+    return updated
+
+
+def popular(limit=30):
+    """The most used tags, for the tag cloud."""
+    return list(Tag.objects.filter(usage_count__gt=0).order_by('-usage_count', 'name')[:limit])
+
+
+PREFIX_INDEX_VERSION_KEY = 'doc:tag-index-version'
+
+
+def prefix_index_key(version):
+    return f'doc:tag-index:{version}'
+
+
+def prefix_index_timeout():
+    return getattr(settings, 'TAG_PREFIX_INDEX_TIMEOUT', 600)
+
+
+def invalidate_prefix_index():
+    """Rebuild the in-memory prefix index on next use, once the current transaction commits."""
+    def bump():
+        try:
+            cache.incr(PREFIX_INDEX_VERSION_KEY)
+        except ValueError:
+            cache.set(PREFIX_INDEX_VERSION_KEY, time.time_ns(), None)
+    transaction.on_commit(bump)
+
+
+class PrefixIndex:
+    """Tag names sorted for prefix lookups, with their usage counts, shared through the cache."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._expires = 0
+        self._names = []
+        self._counts = []
+
+    def current_version(self):
+        version = cache.get(PREFIX_INDEX_VERSION_KEY)
+        if version is None:
+            cache.add(PREFIX_INDEX_VERSION_KEY, time.time_ns(), None)
+            version = cache.get(PREFIX_INDEX_VERSION_KEY)
+        return version
+
+    def load(self):
+        version = self.current_version()
+        with self._lock:
+            if version == self._version and time.time() < self._expires:
+                return self._names, self._counts
+        cached = cache.get(prefix_index_key(version))
+        if cached is None:
+            entries = list(Tag.objects.order_by('name').values_list('name', 'usage_count'))
+            # Stored with its expiry, so a process that loads it late still drops it when the cache does
+            cached = (time.time() + prefix_index_timeout(), entries)
+            cache.set(prefix_index_key(version), cached, prefix_index_timeout())
+        expires, entries = cached
+        names = [name for name, _ in entries]
+        counts = [count for _, count in entries]
+        with self._lock:
+            self._version, self._expires, self._names, self._counts = version, expires, names, counts
+        return names, counts
+
+    def search(self, prefix, limit):
+        names, counts = self.load()
+        start = bisect.bisect_left(names, prefix)
+        # Every name starting with the prefix sorts before prefix + the highest code point
+        end = bisect.bisect_left(names, prefix + '\U0010ffff', start)
+        matches = [(names[i], counts[i]) for i in range(start, end) if counts[i] > 0]
+        matches.sort(key=lambda match: (-match[1], match[0]))
+        return matches[:limit]
+
+
+prefix_index = PrefixIndex()
+
+
+def suggest(prefix, limit=10):
+    """``(name, usage_count)`` of the most used tags starting with ``prefix``."""
+    prefix = Tag.normalize(prefix)
+    if not prefix:
+        return []
+    if connection.vendor == 'postgresql':
+        tags = (Tag.objects.filter(name__startswith=prefix, usage_count__gt=0)
+                .order_by('-usage_count', 'name').values_list('name', 'usage_count'))
+        return list(tags[:limit])
+    return prefix_index.search(prefix, limit)
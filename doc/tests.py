@@ -1,9 +1,40 @@
+from asgiref.sync import sync_to_async
+import httpx
 from django.test import TestCase
 from django.contrib.auth.models import User
-from .models import Document, DocumentComment, Like
+from django.core.management import call_command
+from django.template.loader import render_to_string
+from django.urls import reverse
+from io import BytesIO, StringIO
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from unittest import mock
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from .models import Document, DocumentComment, DocumentText, Like, Rendition, SearchEntry, Tag
+from .extraction import extract_document_text
+from .renditions import generate_rendition
+from . import facets as facets_module, search, tags
 from projects.models import Project
 from classes.models import Class
 from django.core.exceptions import ValidationError
+from django.test import override_settings
+from .counters import record_view, view_counter
+from jobs.models import Job
+from jobs.queue import registry
+from mysite.perf import assert_within_budget
+from mysite.s3 import get_s3_client
+from botocore.stub import Stubber
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, QuerySet
+from django.test.utils import CaptureQueriesContext
+from storages.backends.s3boto3 import S3Boto3Storage
+from django.conf import settings
+from PIL import Image
 
 class DocumentModelTest(TestCase):
 
@@ -50,8 +81,11 @@ class DocumentModelTest(TestCase):
             self.document.delete(user=another_user)
 
         # Ensure the document can be deleted by the owner
+        file_key = self.document.file.name
         self.document.delete(user=self.user)
         self.assertFalse(Document.objects.filter(title='Test Document').exists())
+        # The S3 object is removed later by the job worker
+        self.assertTrue(Job.objects.filter(name='doc.delete_s3_object', payload={'file_key': file_key}).exists())
 
 
 class CommentModelTest(TestCase):
@@ -121,10 +155,8 @@ class LikeModelTest(TestCase):
         )
 
         # Create a test like
-        self.like = Like.objects.create(
-            document=self.document,
-            user=self.user
-        )
+        self.document.toggle_like(self.user)
+        self.like = Like.objects.get(document=self.document, user=self.user)
 
     def test_like_creation(self):
         # Test that the like is created correctly
@@ -134,3 +166,784 @@ class LikeModelTest(TestCase):
     def test_like_str(self):
         # Test the string representation of a like
         self.assertEqual(str(self.like), f'{self.user.username} liked {self.document.title}')
+
+    def test_toggle_like(self):
+        other_user = User.objects.create_user(username='otheruser', password='otherpass')
+
+        self.assertTrue(self.document.toggle_like(other_user))
+        self.assertEqual(self.document.likes, 2)  # includes the like from setUp
+
+        self.assertFalse(self.document.toggle_like(other_user))
+        self.assertEqual(self.document.likes, 1)
+        self.assertEqual(Document.objects.get(pk=self.document.pk).likes, 1)
+
+    def test_a_user_likes_a_document_once(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Like.objects.create(document=self.document, user=self.user)
+
+        # A concurrent request added the like between this toggle's delete and insert
+        other_user = User.objects.create_user(username='otheruser', password='otherpass')
+        real_delete = QuerySet.delete
+
+        def delete_then_race(queryset):
+            result = real_delete(queryset)
+            # The racing toggle inserts the like and counts it, as toggle_like does
+            Like.objects.create(document=self.document, user=other_user)
+            Document.objects.filter(pk=self.document.pk).update(likes=F('likes') + 1)
+            return result
+
+        with mock.patch.object(QuerySet, 'delete', delete_then_race):
+            self.assertTrue(self.document.toggle_like(other_user))
+        # Two likes, counted once each: this toggle didn't count the racer's like again
+        self.assertEqual(self.document.likes, 2)
+        self.assertEqual(Like.objects.filter(document=self.document).count(), 2)
+
+
+class HotQueryIndexTest(TestCase):
+
+    def test_hot_queries_use_their_indexes(self):
+        out = StringIO()
+        call_command('explain_hot_queries', stdout=out)
+        self.assertIn('All hot queries use their indexes', out.getvalue())
+
+
+class ViewCounterTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.superuser = User.objects.create_superuser(username='superuser', email='superuser@example.com', password='testpassword')
+        self.classs = Class.objects.create(name='Test Class', owner=self.superuser)
+        self.project = Project.objects.create(name='Test Project', owner=self.user, class_belongs_to=self.classs)
+        self.document = Document.objects.create(
+            owner=self.user,
+            title='Test Document',
+            file='testfile.txt',
+            project=self.project
+        )
+
+    def test_record_view_updates_only_the_counter(self):
+        # Another writer changes the title; counting a view must not overwrite it
+        Document.objects.filter(pk=self.document.pk).update(title='Renamed')
+
+        record_view(self.document)
+        record_view(self.document)
+
+        document = Document.objects.get(pk=self.document.pk)
+        self.assertEqual(document.views, 2)
+        self.assertEqual(document.title, 'Renamed')
+
+    @override_settings(DOCUMENT_VIEW_BUFFER_SIZE=3, DOCUMENT_VIEW_FLUSH_SECONDS=3600)
+    def test_buffered_views_are_flushed_in_batches(self):
+        view_counter.flush()
+        record_view(self.document)
+        record_view(self.document)
+        self.assertEqual(Document.objects.get(pk=self.document.pk).views, 0)
+
+        record_view(self.document)
+        self.assertEqual(Document.objects.get(pk=self.document.pk).views, 3)
+
+    def test_views_are_counted_once_per_user_without_writing_the_session(self):
+        cache.clear()
+        other = User.objects.create_user(username='otheruser', password='otherpass')
+        url = reverse('classes:projects:doc:document_detail',
+                      args=[self.classs.class_id, self.project.project_id, self.document.id])
+
+        self.client.login(username='testuser', password='testpass')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as repeat:
+            self.client.get(url)
+        self.assertEqual(Document.objects.get(pk=self.document.pk).views, 1)
+        self.assertNotIn('viewed_documents', self.client.session)
+        self.assertFalse([q for q in repeat.captured_queries
+                          if 'django_session' in q['sql'] and not q['sql'].startswith('SELECT')])
+
+        self.client.login(username='otheruser', password='otherpass')
+        response = self.client.get(url)
+        self.assertEqual(Document.objects.get(pk=self.document.pk).views, 2)
+        assert_within_budget(response)
+
+
+class TagServiceTest(TestCase):
+
+    def setUp(self):
+        self.superuser = User.objects.create_superuser(username='superuser', email='superuser@example.com', password='testpassword')
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.other = User.objects.create_user(username='otheruser', password='otherpass')
+        self.classs = Class.objects.create(name='Test Class', owner=self.superuser)
+        self.project = Project.objects.create(name='Test Project', owner=self.user, class_belongs_to=self.classs)
+        self.document = Document.objects.create(owner=self.user, title='Notes', file='notes.txt', project=self.project)
+        self.other_document = Document.objects.create(owner=self.user, title='Lab', file='lab.txt', project=self.project)
+
+    def usage(self):
+        return dict(Tag.objects.values_list('name', 'usage_count'))
+
+    def test_input_is_normalized_and_deduplicated(self):
+        self.assertEqual(tags.parse(' Lab  Notes, lab notes,EXAM,, exam '), ['lab notes', 'exam'])
+        self.assertEqual(Tag.objects.create(name='  Mixed CASE ').name, 'mixed case')
+
+    def test_adding_tags_takes_the_same_queries_for_any_number_of_tags(self):
+        Tag.objects.create(name='existing')
+        with CaptureQueriesContext(connection) as few:
+            tags.add_tags(self.document, 'existing, new')
+        with CaptureQueriesContext(connection) as many:
+            tags.add_tags(self.other_document, 'existing, new, a, b, c, d, e, f')
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(sorted(self.other_document.tags.values_list('name', flat=True)),
+                         ['a', 'b', 'c', 'd', 'e', 'existing', 'f', 'new'])
+
+    def test_usage_counts_follow_tag_changes(self):
+        tags.add_tags(self.document, 'lab, exam')
+        tags.add_tags(self.other_document, 'lab')
+        self.assertEqual(self.usage(), {'lab': 2, 'exam': 1})
+
+        tags.set_tags(self.document, 'exam, notes')
+        self.assertEqual(self.usage(), {'lab': 1, 'exam': 1, 'notes': 1})
+
+        # Removing a tag the document doesn't have changes nothing
+        self.other_document.tags.remove(Tag.objects.get(name='exam'))
+        Tag.objects.get(name='notes').documents.add(self.other_document)
+        self.assertEqual(self.usage(), {'lab': 1, 'exam': 1, 'notes': 2})
+
+        Tag.objects.get(name='notes').documents.clear()
+        self.assertEqual(self.usage()['notes'], 0)
+
+        self.document.delete(user=self.user)
+        self.assertEqual(self.usage(), {'lab': 1, 'exam': 0, 'notes': 0})
+
+        Tag.objects.update(usage_count=7)
+        call_command('recount_tags', stdout=StringIO())
+        self.assertEqual(self.usage(), {'lab': 1, 'exam': 0, 'notes': 0})
+
+    def test_edit_tags_view(self):
+        tags.add_tags(self.document, 'lab')
+        url = reverse('classes:projects:doc:edit_document_tags',
+                      args=[self.classs.class_id, self.project.project_id, self.document.id])
+
+        self.client.login(username='otheruser', password='otherpass')
+        self.assertEqual(self.client.post(url, {'tags_input': 'spam'}).status_code, 403)
+
+        self.client.login(username='testuser', password='testpass')
+        self.client.post(url, {'tags_input': 'Exam, Notes'})
+        self.assertEqual(sorted(self.document.tags.values_list('name', flat=True)), ['exam', 'notes'])
+
+    def test_autocomplete_suggests_used_tags_by_prefix(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            tags.add_tags(self.document, 'lab, lab report, exam, labels')
+            tags.add_tags(self.other_document, 'lab report')
+            Tag.objects.create(name='laboratory')  # not used by any document
+        self.assertEqual(tags.suggest('LAB'), [('lab report', 2), ('lab', 1), ('labels', 1)])
+        self.assertEqual(tags.suggest('lab', limit=1), [('lab report', 2)])
+        self.assertEqual(tags.suggest(' '), [])
+
+        # New tags reach the index once their transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            tags.add_tags(self.other_document, 'lab safety')
+        self.assertIn(('lab safety', 1), tags.suggest('lab s'))
+
+        # Usage changes don't move the version, but each process drops its copy when it expires
+        with self.captureOnCommitCallbacks(execute=True):
+            tags.add_tags(self.other_document, 'laboratory')
+        self.assertNotIn(('laboratory', 1), tags.suggest('lab'))
+        with mock.patch('time.time', return_value=time.time() + settings.TAG_PREFIX_INDEX_TIMEOUT + 1):
+            self.assertIn(('laboratory', 1), tags.suggest('lab'))
+
+        self.client.login(username='testuser', password='testpass')
+        response = self.client.get(reverse('projects:tag_autocomplete'), {'q': 'ex'})
+        self.assertEqual(response.json(), {'tags': [{'name': 'exam', 'count': 1}]})
+        assert_within_budget(response)
+
+    def test_search_page_shows_popular_tags(self):
+        tags.add_tags(self.document, 'lab, exam')
+        tags.add_tags(self.other_document, 'lab')
+        self.client.login(username='testuser', password='testpass')
+        response = self.client.get(reverse('projects:search_documents'))
+        self.assertEqual([tag.name for tag in response.context['popular_tags']], ['lab', 'exam'])
+
+
+class DocumentSearchTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.outsider = User.objects.create_user(username='outsider', password='outsiderpass')
+        self.superuser = User.objects.create_superuser(username='superuser', email='superuser@example.com', password='testpassword')
+        self.classs = Class.objects.create(name='Test Class', owner=self.superuser)
+        self.project = Project.objects.create(name='Test Project', owner=self.user, class_belongs_to=self.classs)
+
+        self.minutes = Document.objects.create(
+            owner=self.user,
+            title='Meeting minutes',
+            file='minutes.txt',
+            description='Notes about the photosynthesis lab',
+            project=self.project
+        )
+        self.lab = Document.objects.create(
+            owner=self.user,
+            title='Photosynthesis lab report',
+            file='lab.txt',
+            project=self.project
+        )
+
+    def results(self, query, user=None):
+        return list(search.search_documents(user or self.user, query))
+
+    def test_title_matches_rank_above_description_matches(self):
+        self.assertEqual(self.results('photosynthesis'), [self.lab, self.minutes])
+
+    def test_tags_and_comments_are_indexed_incrementally(self):
+        tag = Tag.objects.create(name='planning')
+        self.minutes.tags.add(tag)
+        self.assertEqual(self.results('planning'), [self.minutes])
+
+        comment = DocumentComment.objects.create(document=self.lab, author=self.user, content='Great chlorophyll diagram')
+        self.assertEqual(self.results('chlorophyll'), [self.lab])
+
+        comment.delete()
+        self.assertEqual(self.results('chlorophyll'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.delete()
+        self.assertEqual(self.results('planning'), [])
+        self.assertEqual(SearchEntry.objects.get(document=self.minutes).tags, '')
+
+    def test_results_are_limited_to_accessible_projects(self):
+        self.assertEqual(self.results('minutes', user=self.outsider), [])
+
+    def test_deleted_documents_leave_the_index(self):
+        self.lab.delete(user=self.user)
+        self.assertEqual(self.results('photosynthesis'), [self.minutes])
+
+    def test_rebuild_command(self):
+        SearchEntry.objects.all().delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(SearchEntry.objects.count(), 2)
+        self.assertEqual(self.results('minutes'), [self.minutes])
+
+    def test_facet_filters_and_counts(self):
+        helper = User.objects.create_user(username='helper', password='helperpass')
+        self.project.members.add(helper)
+        other_project = Project.objects.create(name='Other Project', owner=self.user, class_belongs_to=self.classs,
+                                               folder_in_s3='documents/other-project')
+        quiz = Document.objects.create(owner=helper, title='Photosynthesis quiz', file='quiz.txt',
+                                       project=other_project, due_date='2026-03-01')
+        self.lab.due_date = '2026-02-01'
+        self.lab.save()
+        tags.add_tags(self.lab, 'lab, biology')
+        tags.add_tags(quiz, 'biology')
+
+        self.client.login(username='testuser', password='testpass')
+        url = reverse('projects:search_documents')
+        response = self.client.get(url, {'q': 'photosynthesis'})
+        facets = {facet['name']: facet['values'] for facet in response.context['facets']}
+        self.assertEqual([(value['label'], value['count']) for value in facets['tag']], [('biology', 2), ('lab', 1)])
+        self.assertEqual([(value['label'], value['count']) for value in facets['owner']], [('testuser', 2), ('helper', 1)])
+        self.assertEqual([(value['label'], value['count']) for value in facets['project']],
+                         [('Test Project', 2), ('Other Project', 1)])
+        assert_within_budget(response)
+
+        # The facet counts come from one query however many facets there are
+        results = search.search_documents(self.user, 'photosynthesis')
+        with CaptureQueriesContext(connection) as queries:
+            facets_module.facet_counts(results)
+        self.assertEqual(len(queries), 1)
+
+        response = self.client.get(url, {'q': 'photosynthesis', 'tag': 'Biology', 'due_before': '2026-02-15'})
+        self.assertEqual(list(response.context['documents']), [self.lab])
+        response = self.client.get(url, {'tag': ['biology', 'lab']})
+        self.assertEqual(list(response.context['documents']), [self.lab])
+        response = self.client.get(url, {'owner': helper.pk, 'due_after': '2026-02-15', 'project': 'junk'})
+        self.assertEqual(list(response.context['documents']), [quiz])
+        response = self.client.get(url, {'project': other_project.project_id, 'q': 'minutes'})
+        self.assertEqual(list(response.context['documents']), [])
+
+    def test_search_view_paginates(self):
+        self.client.login(username='testuser', password='testpass')
+        response = self.client.get(reverse('projects:search_documents'), {'q': 'photosynthesis'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result_count'], 2)
+        assert_within_budget(response)
+
+        with mock.patch('doc.views.SEARCH_RESULTS_PER_PAGE', 1):
+            response = self.client.get(reverse('projects:search_documents'), {'q': 'photosynthesis'})
+            self.assertEqual(list(response.context['documents']), [self.lab])
+            cursor = response.context['documents'].next_cursor
+            more = self.client.get(reverse('projects:search_documents'),
+                                   {'q': 'photosynthesis', 'after': cursor, 'format': 'json'}).json()
+        self.assertIn('Meeting minutes', more['html'])
+        self.assertNotIn('Photosynthesis lab report', more['html'])
+        self.assertIsNone(more['next'])
+
+    def test_queries_never_reach_the_tag_links_script(self):
+        self.lab.tags.add(Tag.objects.create(name='biology'))
+        query = "x'); alert(document.cookie); ('"
+        html = render_to_string('doc/search_result_cards.html', {'page': [self.lab], 'query': query})
+        self.assertIn('searchTag(event, this.dataset.tag, true)', html)
+        self.assertNotIn('alert', html)
+
+    def test_search_results_page_on_an_integer_rank(self):
+        for i in range(6):
+            document = Document.objects.create(owner=self.user, title=f'Osmosis {"osmosis " * i}', file='notes.txt',
+                                               project=self.project)
+            search.index_document(document)
+        results = search.search_documents(self.user, 'osmosis')
+        self.assertTrue(all(isinstance(document.rank_key, int) for document in results))
+
+        # Paging one result at a time visits each exactly once
+        seen, cursor = [], None
+        with mock.patch('doc.views.SEARCH_RESULTS_PER_PAGE', 1):
+            self.client.login(username='testuser', password='testpass')
+            while True:
+                page = self.client.get(reverse('projects:search_documents'), {'q': 'osmosis', 'after': cursor or ''})
+                seen += [document.pk for document in page.context['documents']]
+                cursor = page.context['documents'].next_cursor
+                if cursor is None:
+                    break
+        self.assertEqual(seen, [document.pk for document in results])
+
+
+class DocumentTextExtractionTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        storage_patch = mock.patch.object(Document._meta.get_field('file'), 'storage', FileSystemStorage(self.media_root))
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.superuser = User.objects.create_superuser(username='superuser', email='superuser@example.com', password='testpassword')
+        self.classs = Class.objects.create(name='Test Class', owner=self.superuser)
+        self.project = Project.objects.create(name='Test Project', owner=self.user, class_belongs_to=self.classs)
+
+    def upload(self, filename, content):
+        document = Document(owner=self.user, title='Upload', project=self.project)
+        document.file.save(filename, ContentFile(content), save=False)
+        document.save()
+        # Extraction is left to the job worker rather than run during the upload
+        self.assertTrue(Job.objects.filter(name='doc.extract_text', payload={'document_id': document.pk}).exists())
+        return document
+
+    def test_plain_text_is_extracted_and_searchable(self):
+        document = self.upload('notes.txt', 'Mitochondria is the powerhouse of the cell'.encode())
+        extracted = extract_document_text(document.pk)
+
+        self.assertEqual(extracted.status, 'done')
+        self.assertIn('powerhouse', extracted.text)
+        self.assertEqual(list(search.search_documents(self.user, 'mitochondria')), [document])
+
+    def test_docx_paragraphs_are_extracted(self):
+        body = (
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+            '<w:p><w:r><w:t>Krebs </w:t></w:r><w:r><w:t>cycle</w:t></w:r></w:p>'
+            '<w:p><w:r><w:t>Second paragraph</w:t></w:r></w:p>'
+            '</w:body></w:document>'
+        )
+        buffer = tempfile.SpooledTemporaryFile()
+        with zipfile.ZipFile(buffer, 'w') as docx:
+            docx.writestr('word/document.xml', body)
+        buffer.seek(0)
+        document = self.upload('report.docx', buffer.read())
+
+        extracted = extract_document_text(document.pk)
+        self.assertEqual(extracted.text, 'Krebs cycle\nSecond paragraph\n')
+
+    @override_settings(DOCUMENT_TEXT_MAX_CHARS=10)
+    def test_text_is_truncated_to_the_limit(self):
+        document = self.upload('long.txt', b'a' * 100)
+        extracted = extract_document_text(document.pk)
+        self.assertEqual(len(extracted.text), 10)
+        self.assertTrue(extracted.truncated)
+
+    def test_unknown_formats_are_marked_unsupported(self):
+        document = self.upload('image.bmp', b'BM')
+        extracted = extract_document_text(document.pk)
+        self.assertEqual(extracted.status, 'unsupported')
+        self.assertEqual(DocumentText.objects.get(document=document).text, '')
+
+
+@override_settings(AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing')
+class S3DeleteJobTest(TestCase):
+
+    def test_delete_job_uses_the_shared_client(self):
+        client = get_s3_client()
+        self.assertIs(get_s3_client(), client)
+
+        with Stubber(client) as stubber:
+            stubber.add_response('delete_object', {}, {'Bucket': 'a-06', 'Key': 'documents/project-1/notes.txt'})
+            registry['doc.delete_s3_object'](file_key='documents/project-1/notes.txt')
+            stubber.assert_no_pending_responses()
+
+
+@override_settings(AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing',
+                   DOCUMENT_UPLOAD_PART_BYTES=5 * 1024 * 1024)
+class DirectUploadTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.outsider = User.objects.create_user(username='outsider', password='testpass')
+        self.superuser = User.objects.create_superuser(username='superuser', email='superuser@example.com', password='testpassword')
+        self.classs = Class.objects.create(name='Test Class', owner=self.superuser)
+        self.project = Project.objects.create(name='Test Project', owner=self.user, class_belongs_to=self.classs)
+        self.client.login(username='testuser', password='testpass')
+        self.stubber = Stubber(get_s3_client())
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+
+    def url(self, name):
+        return reverse(f'classes:projects:doc:{name}', args=[self.classs.class_id, self.project.project_id])
+
+    def start(self, filename, size):
+        return self.client.post(self.url('start_direct_upload'), {'filename': filename, 'size': size})
+
+    def test_small_files_get_a_presigned_post(self):
+        response = self.start('notes.txt', 1200)
+        self.assertEqual(response.status_code, 200)
+        upload = response.json()
+        self.assertEqual(upload['method'], 'post')
+        self.assertTrue(upload['fields']['key'].startswith(f'documents/project-{self.project.project_id}/'))
+        self.assertTrue(upload['fields']['key'].endswith('/notes.txt'))
+        self.assertEqual(upload['fields']['Content-Type'], 'text/plain')
+
+    def test_finalize_checks_the_object_and_creates_the_document(self):
+        upload = self.start('notes.txt', 1200).json()
+        key = upload['fields']['key']
+        self.stubber.add_response('head_object', {'ContentLength': 1200, 'ContentType': 'text/plain'},
+                                  {'Bucket': 'a-06', 'Key': key})
+
+        details = {'token': upload['token'], 'title': 'Notes', 'description': '', 'tags_input': 'Minutes, lab'}
+        response = self.client.post(self.url('finalize_direct_upload'), details)
+        self.assertEqual(response.status_code, 201)
+        document = Document.objects.get(pk=response.json()['document_id'])
+        self.assertEqual(document.file.name, key)
+        self.assertEqual(document.owner, self.user)
+        self.assertEqual(sorted(tag.name for tag in document.tags.all()), ['lab', 'minutes'])
+
+        # Retrying finalize doesn't create a second document or touch S3 again
+        response = self.client.post(self.url('finalize_direct_upload'), details)
+        self.assertEqual(response.json()['document_id'], document.pk)
+        self.stubber.assert_no_pending_responses()
+
+    def test_concurrent_finalize_requests_create_one_document(self):
+        upload = self.start('notes.txt', 1200).json()
+        key = upload['fields']['key']
+        details = {'token': upload['token'], 'title': 'Notes'}
+
+        def first_request_finishes_meanwhile(upload):
+            # This request found no document, and another request for the same upload creates it
+            # while this one is waiting on S3
+            Document.objects.create(owner=self.user, title='Notes', project=self.project, file=key)
+
+        with mock.patch('doc.uploads.complete_upload', side_effect=first_request_finishes_meanwhile):
+            response = self.client.post(self.url('finalize_direct_upload'), details)
+        self.assertEqual(response.status_code, 201)
+        first = Document.objects.get(file=key)
+        self.assertEqual(response.json()['document_id'], first.pk)
+
+    def test_mismatched_objects_are_deleted(self):
+        upload = self.start('notes.txt', 1200).json()
+        key = upload['fields']['key']
+        self.stubber.add_response('head_object', {'ContentLength': 999999, 'ContentType': 'text/plain'},
+                                  {'Bucket': 'a-06', 'Key': key})
+        self.stubber.add_response('delete_object', {}, {'Bucket': 'a-06', 'Key': key})
+
+        response = self.client.post(self.url('finalize_direct_upload'), {'token': upload['token'], 'title': 'Notes'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Document.objects.exists())
+        self.stubber.assert_no_pending_responses()
+
+    def test_large_files_use_resumable_multipart_uploads(self):
+        size = 12 * 1024 * 1024
+        self.stubber.add_response('create_multipart_upload', {'UploadId': 'upload-1'})
+        upload = self.start('lecture.pdf', size).json()
+        self.assertEqual((upload['method'], upload['part_count']), ('multipart', 3))
+
+        # Part 1 made it before the connection dropped
+        self.stubber.add_response('list_parts', {'Parts': [{'PartNumber': 1, 'ETag': '"a"'}], 'IsTruncated': False})
+        response = self.client.post(self.url('direct_upload_parts'), {'token': upload['token'], 'part': [2, 3]})
+        parts = response.json()
+        self.assertEqual(parts['uploaded'], [1])
+        self.assertEqual(sorted(parts['urls']), ['2', '3'])
+
+        self.stubber.add_response('list_parts', {'Parts': [{'PartNumber': n, 'ETag': f'"{n}"'} for n in (1, 2, 3)],
+                                                 'IsTruncated': False})
+        self.stubber.add_response('complete_multipart_upload', {})
+        self.stubber.add_response('head_object', {'ContentLength': size, 'ContentType': 'application/pdf'})
+        response = self.client.post(self.url('finalize_direct_upload'), {'token': upload['token'], 'title': 'Lecture'})
+        self.assertEqual(response.status_code, 201)
+        self.stubber.assert_no_pending_responses()
+
+    def multipart_upload(self, size=12 * 1024 * 1024):
+        self.stubber.add_response('create_multipart_upload', {'UploadId': 'upload-1'})
+        return self.start('lecture.pdf', size).json()
+
+    def test_s3_errors_are_reported_as_bad_requests(self):
+        upload = self.multipart_upload()
+        self.stubber.add_client_error('list_parts', 'NoSuchUpload', http_status_code=404)
+        response = self.client.post(self.url('direct_upload_parts'), {'token': upload['token'], 'part': [1]})
+        self.assertEqual(response.status_code, 400)
+
+        self.stubber.add_response('list_parts', {'Parts': [{'PartNumber': n, 'ETag': f'"{n}"'} for n in (1, 2, 3)],
+                                                 'IsTruncated': False})
+        self.stubber.add_client_error('complete_multipart_upload', 'EntityTooSmall')
+        response = self.client.post(self.url('finalize_direct_upload'), {'token': upload['token'], 'title': 'Lecture'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Document.objects.exists())
+        self.stubber.assert_no_pending_responses()
+
+    def test_finalize_after_s3_completed_the_upload_checks_the_object(self):
+        # An earlier finalize completed the multipart upload, then failed before saving its Document
+        size = 12 * 1024 * 1024
+        upload = self.multipart_upload(size)
+        self.stubber.add_client_error('list_parts', 'NoSuchUpload', http_status_code=404)
+        self.stubber.add_response('head_object', {'ContentLength': size, 'ContentType': 'application/pdf'})
+        response = self.client.post(self.url('finalize_direct_upload'), {'token': upload['token'], 'title': 'Lecture'})
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Document.objects.filter(pk=response.json()['document_id']).exists())
+        self.stubber.assert_no_pending_responses()
+
+    def test_only_members_can_upload(self):
+        upload = self.start('notes.txt', 1200).json()
+        self.client.login(username='outsider', password='testpass')
+        self.assertEqual(self.start('notes.txt', 1200).status_code, 403)
+
+        self.project.members.add(self.outsider)
+        # A token issued to someone else is rejected
+        response = self.client.post(self.url('finalize_direct_upload'), {'token': upload['token'], 'title': 'Notes'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_upload_page_enables_direct_uploads(self):
+        response = self.client.get(reverse('classes:projects:doc:upload_document',
+                                           args=[self.classs.class_id, self.project.project_id]))
+        self.assertContains(response, f'data-start-url="{self.url("start_direct_upload")}"')
+
+    def test_oversized_files_are_refused(self):
+        with override_settings(DOCUMENT_UPLOAD_MAX_BYTES=1024):
+            self.assertEqual(self.start('notes.txt', 2048).status_code, 400)
+
+
+class DocumentDownloadTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        storage_patch = mock.patch.object(Document._meta.get_field('file'), 'storage', FileSystemStorage(self.media_root))
+        storage_patch.start()
+        self.addCleanup(storage_patch.stop)
+
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.outsider = User.objects.create_user(username='outsider', password='testpass')
+        self.superuser = User.objects.create_superuser(username='superuser', email='superuser@example.com', password='testpassword')
+        self.classs = Class.objects.create(name='Test Class', owner=self.superuser)
+        self.project = Project.objects.create(name='Test Project', owner=self.user, class_belongs_to=self.classs)
+        self.document = Document(owner=self.user, title='Notes', project=self.project)
+        self.document.file.save('notes.txt', ContentFile(b'0123456789abcdefghij'), save=False)
+        self.document.save()
+        self.client.login(username='testuser', password='testpass')
+
+    def get(self, name='download_document', **headers):
+        url = reverse(f'classes:projects:doc:{name}', args=[self.classs.class_id, self.project.project_id, self.document.id])
+        return self.client.get(url, headers=headers)
+
+    def test_download_streams_with_caching_headers(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789abcdefghij')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('private', response['Cache-Control'])
+        self.assertTrue(response['Content-Disposition'].startswith('attachment'))
+        self.assertIn('Last-Modified', response)
+
+        revalidated = self.get(If_None_Match=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        revalidated = self.get(If_Modified_Since=response['Last-Modified'])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_preview_is_inline(self):
+        response = self.get('preview_document')
+        self.assertTrue(response['Content-Disposition'].startswith('inline'))
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+        self.assertEqual(response['Content-Security-Policy'], 'sandbox')
+
+    def test_active_content_is_never_previewed_inline(self):
+        for name in ('page.html', 'drawing.svg', 'notes.docx'):
+            self.document.file.save(name, ContentFile(b'<script>alert(1)</script>'))
+            response = self.get('preview_document')
+            self.assertTrue(response['Content-Disposition'].startswith('attachment'), name)
+            self.assertEqual(response['Content-Security-Policy'], 'sandbox')
+
+    def test_missing_files_are_not_found(self):
+        self.document.file.storage.delete(self.document.file.name)
+        self.assertEqual(self.get().status_code, 404)
+
+    def test_range_requests(self):
+        response = self.get(Range='bytes=5-9')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'56789')
+        self.assertEqual(response['Content-Range'], 'bytes 5-9/20')
+
+        response = self.get(Range='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'hij')
+
+        response = self.get(Range='bytes=50-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */20')
+
+        # A stale If-Range gets the whole file
+        response = self.get(Range='bytes=5-9', If_Range='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_outsiders_are_refused(self):
+        self.client.login(username='outsider', password='testpass')
+        self.assertEqual(self.get().status_code, 403)
+
+    @override_settings(AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing')
+    def test_s3_files_redirect_to_a_reused_presigned_url(self):
+        with mock.patch.object(Document._meta.get_field('file'), 'storage', S3Boto3Storage()):
+            response = self.get()
+            self.assertEqual(response.status_code, 302)
+            self.assertIn('X-Amz-Signature', response['Location'])
+            self.assertIn(self.document.file.name, response['Location'])
+            self.assertEqual(self.get()['Location'], response['Location'])
+
+    @override_settings(AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing', DOCUMENT_DOWNLOAD_MODE='stream')
+    async def test_s3_files_stream_through_the_async_view(self):
+        content = b'0123456789abcdefghij'
+        requests = []
+
+        def s3(request):
+            requests.append(request.method)
+            headers = {'Content-Length': str(len(content)), 'Last-Modified': 'Mon, 05 May 2025 10:00:00 GMT'}
+            if request.method == 'HEAD':
+                return httpx.Response(200, headers=headers)
+            start, end = map(int, request.headers['Range'].removeprefix('bytes=').split('-'))
+            return httpx.Response(206, content=content[start:end + 1])
+
+        # The ASGI request path: async middleware, then the async view talking to S3 over httpx
+        await sync_to_async(self.async_client.force_login)(self.user)
+        url = reverse('classes:projects:doc:download_document',
+                      args=[self.classs.class_id, self.project.project_id, self.document.id])
+        with mock.patch.object(Document._meta.get_field('file'), 'storage', S3Boto3Storage()), \
+                mock.patch('doc.downloads.get_async_http_client',
+                           lambda: httpx.AsyncClient(transport=httpx.MockTransport(s3))):
+            response = await self.async_client.get(url, headers={'Range': 'bytes=5-9'})
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), b'56789')
+            self.assertEqual(response['Content-Range'], 'bytes 5-9/20')
+            self.assertGreater(response.perf.queries, 0)
+
+            revalidated = await self.async_client.get(url, headers={'If-None-Match': response['ETag']})
+            self.assertEqual(revalidated.status_code, 304)
+        # The file's size and date were cached after the first HEAD
+        self.assertEqual(requests, ['HEAD', 'GET'])
+
+    @override_settings(AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing', DOCUMENT_DOWNLOAD_MODE='stream')
+    async def test_missing_s3_files_are_not_found(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        url = reverse('classes:projects:doc:download_document',
+                      args=[self.classs.class_id, self.project.project_id, self.document.id])
+        with mock.patch.object(Document._meta.get_field('file'), 'storage', S3Boto3Storage()), \
+                mock.patch('doc.downloads.get_async_http_client',
+                           lambda: httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(404)))):
+            response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_async_views_require_login(self):
+        url = reverse('classes:projects:doc:download_document',
+                      args=[self.classs.class_id, self.project.project_id, self.document.id])
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith(settings.LOGIN_URL))
+
+
+class RenditionTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        storage = FileSystemStorage(self.media_root)
+        for model in (Document, Rendition):
+            storage_patch = mock.patch.object(model._meta.get_field('file'), 'storage', storage)
+            storage_patch.start()
+            self.addCleanup(storage_patch.stop)
+
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.superuser = User.objects.create_superuser(username='superuser', email='superuser@example.com', password='testpassword')
+        self.classs = Class.objects.create(name='Test Class', owner=self.superuser)
+        self.project = Project.objects.create(name='Test Project', owner=self.user, class_belongs_to=self.classs)
+
+    def upload(self, filename, content):
+        document = Document(owner=self.user, title='Upload', project=self.project)
+        document.file.save(filename, ContentFile(content), save=False)
+        document.save()
+        self.assertTrue(Job.objects.filter(name='doc.generate_rendition', payload={'document_id': document.pk}).exists())
+        return document
+
+    def png(self, size):
+        output = BytesIO()
+        Image.new('RGB', size, 'red').save(output, 'PNG')
+        return output.getvalue()
+
+    def test_images_get_a_downscaled_thumbnail_in_the_project_folder(self):
+        document = self.upload('diagram.png', self.png((1600, 800)))
+        rendition = generate_rendition(document.pk)
+
+        self.assertEqual((rendition.kind, rendition.status), ('thumbnail', 'done'))
+        self.assertEqual((rendition.width, rendition.height), (320, 160))
+        self.assertTrue(rendition.file.name.startswith(f'documents/project-{self.project.project_id}/renditions/'))
+
+    def test_scanned_pdfs_get_a_thumbnail_of_the_first_page(self):
+        with open(os.path.join(settings.BASE_DIR.parent, 'documents', 'project-1', 'WS_Ch8_1.pdf'), 'rb') as pdf:
+            document = self.upload('worksheet.pdf', pdf.read())
+        rendition = generate_rendition(document.pk)
+        self.assertEqual(rendition.kind, 'thumbnail')
+        self.assertLessEqual(max(rendition.width, rendition.height), 320)
+
+    def test_text_files_get_a_snippet(self):
+        document = self.upload('notes.txt', ('Meeting notes\n' + 'x' * 1000).encode())
+        rendition = generate_rendition(document.pk)
+        self.assertEqual(rendition.kind, 'snippet')
+        self.assertTrue(rendition.text.startswith('Meeting notes'))
+        self.assertEqual(len(rendition.text), 400)
+
+    def test_unsupported_files_are_recorded(self):
+        document = self.upload('archive.zip', b'PK')
+        self.assertEqual(generate_rendition(document.pk).status, 'unsupported')
+
+    def test_replacing_the_file_regenerates_the_rendition(self):
+        document = self.upload('diagram.png', self.png((400, 400)))
+        old_file = generate_rendition(document.pk).file.name
+
+        document.file.save('diagram-v2.png', ContentFile(self.png((200, 100))), save=True)
+        self.assertTrue(Job.objects.filter(idempotency_key=f'rendition:{document.pk}:{document.file.name}').exists())
+        rendition = generate_rendition(document.pk)
+        self.assertEqual((rendition.width, rendition.height), (200, 100))
+        self.assertTrue(Job.objects.filter(name='doc.delete_s3_object', payload={'file_key': old_file}).exists())
+
+    def test_a_failed_render_keeps_the_earlier_preview_and_its_source(self):
+        document = self.upload('diagram.png', self.png((400, 400)))
+        source_name = generate_rendition(document.pk).source_name
+
+        document.file.save('diagram-v2.png', ContentFile(b'not a png'), save=True)
+        with self.assertRaises(Exception):
+            generate_rendition(document.pk)
+        rendition = Rendition.objects.get(document=document)
+        self.assertEqual((rendition.status, rendition.kind), ('failed', 'thumbnail'))
+        # Still recorded as made from the old file, so it's known to be stale
+        self.assertEqual(rendition.source_name, source_name)
+
+    def test_previews_are_shown_on_the_project_page(self):
+        document = self.upload('diagram.png', self.png((400, 400)))
+        generate_rendition(document.pk)
+        self.client.login(username='testuser', password='testpass')
+
+        thumbnail_url = reverse('classes:projects:doc:document_thumbnail',
+                                args=[self.classs.class_id, self.project.project_id, document.id])
+        response = self.client.get(reverse('classes:projects:project_detail',
+                                           args=[self.classs.class_id, self.project.project_id]))
+        self.assertContains(response, thumbnail_url)
+
+        response = self.client.get(thumbnail_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
@@ -0,0 +1,188 @@
+"""
+Direct-to-S3 document uploads.
+
+The browser asks ``start_upload`` for permission to upload a file and gets back
+either a presigned POST (small files) or a multipart upload whose parts it PUTs
+to presigned URLs (large files). The file goes straight to the bucket under
+``documents/project-<id>/`` and never passes through a web worker. Every step
+after the first carries a signed token naming the object key, so the client
+can't redirect the upload elsewhere; ``complete_upload`` then checks the stored
+object's size and content type before the Document row is created.
+
+Multipart uploads are resumable: ``uploaded_parts`` reports which parts S3
+already has, so a client that lost its connection only sends the rest.
+Finishing is safe to repeat: when S3 no longer knows the multipart upload, an
+earlier attempt already completed it (and maybe failed afterwards, before its
+Document was saved), so ``complete_upload`` goes on to check the object.
+Errors from S3 are raised as UploadError, which the views report as a 400.
+"""
+import mimetypes
+import os
+import uuid
+from botocore.exceptions import BotoCoreError, ClientError
+from django.conf import settings
+from django.core import signing
+from django.utils.text import get_valid_filename
+from jobs.queue import enqueue
+from mysite.s3 import get_s3_client
+
+TOKEN_SALT = 'doc.uploads'
+
+
+class UploadError(Exception):
+    pass
+
+
+class UploadsUnavailable(UploadError):
+    """S3 can't be reached or signed for; the browser should post the file to the server instead."""
+
+
+class UploadClosed(UploadError):
+    """S3 no longer has the multipart upload: it was completed or aborted."""
+
+
+def error_code(error):
+    return error.response.get('Error', {}).get('Code') if isinstance(error, ClientError) else None
+
+
+def max_upload_bytes():
+    return getattr(settings, 'DOCUMENT_UPLOAD_MAX_BYTES', 200 * 1024 * 1024)
+
+
+def part_size():
+    # S3 requires every part but the last to be at least 5 MB
+    return max(getattr(settings, 'DOCUMENT_UPLOAD_PART_BYTES', 8 * 1024 * 1024), 5 * 1024 * 1024)
+
+
+def content_type_for(filename):
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+def part_count(upload):
+    return -(-upload['size'] // upload['part_size'])
+
+
+def object_key(project, filename):
+    """A fresh key for ``filename`` in the project's folder; the random directory keeps names unique."""
+    name = get_valid_filename(os.path.basename(filename)) or 'upload'
+    return f'documents/project-{project.project_id}/{uuid.uuid4().hex}/{name}'
+
+
+def make_token(**upload):
+    return signing.dumps(upload, salt=TOKEN_SALT, compress=True)
+
+
+def read_token(token, user, project):
+    max_age = getattr(settings, 'DOCUMENT_UPLOAD_TOKEN_MAX_AGE', 24 * 60 * 60)
+    try:
+        upload = signing.loads(token, salt=TOKEN_SALT, max_age=max_age)
+    except signing.BadSignature:
+        raise UploadError("This upload has expired or is invalid. Please start it again.")
+    if upload['user'] != user.id or upload['project'] != project.project_id:
+        raise UploadError("This upload belongs to a different user or project.")
+    return upload
+
+
+def start_upload(user, project, filename, size):
+    """Reserve an object key and return what the browser needs to upload ``size`` bytes to it."""
+    if not 0 < size <= max_upload_bytes():
+        raise UploadError(f"Files must be between 1 byte and {max_upload_bytes() // (1024 * 1024)} MB.")
+
+    s3 = get_s3_client()
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    key = object_key(project, filename)
+    content_type = content_type_for(filename)
+    upload = {'user': user.id, 'project': project.project_id, 'key': key, 'size': size,
+              'content_type': content_type, 'filename': os.path.basename(filename)}
+
+    try:
+        if size <= part_size():
+            post = s3.generate_presigned_post(
+                bucket, key,
+                Fields={'Content-Type': content_type},
+                Conditions=[{'Content-Type': content_type}, ['content-length-range', size, size]],
+                ExpiresIn=3600,
+            )
+            return {'method': 'post', 'url': post['url'], 'fields': post['fields'], 'token': make_token(**upload)}
+        multipart = s3.create_multipart_upload(Bucket=bucket, Key=key, ContentType=content_type)
+    except (BotoCoreError, ClientError) as e:
+        raise UploadsUnavailable(f"Direct uploads are unavailable: {e}")
+
+    upload.update(upload_id=multipart['UploadId'], part_size=part_size())
+    return {
+        'method': 'multipart',
+        'part_size': upload['part_size'],
+        'part_count': part_count(upload),
+        'token': make_token(**upload),
+    }
+
+
+def uploaded_parts(upload):
+    """Parts S3 has received so far, as ``[{'PartNumber': n, 'ETag': ...}]``."""
+    s3 = get_s3_client()
+    parts = []
+    kwargs = {'Bucket': settings.AWS_STORAGE_BUCKET_NAME, 'Key': upload['key'], 'UploadId': upload['upload_id']}
+    while True:
+        try:
+            page = s3.list_parts(**kwargs)
+        except (BotoCoreError, ClientError) as e:
+            if error_code(e) == 'NoSuchUpload':
+                raise UploadClosed("This upload is no longer open. Please start it again.")
+            raise UploadError(f"S3 couldn't list the uploaded parts: {e}")
+        parts.extend({'PartNumber': p['PartNumber'], 'ETag': p['ETag']} for p in page.get('Parts', []))
+        if not page.get('IsTruncated'):
+            return parts
+        kwargs['PartNumberMarker'] = page['NextPartNumberMarker']
+
+
+def part_urls(upload, part_numbers):
+    """Presigned PUT URLs for the given part numbers of a multipart upload."""
+    if 'upload_id' not in upload:
+        raise UploadError("This upload doesn't use multipart.")
+    s3 = get_s3_client()
+    urls = {}
+    for number in part_numbers:
+        if not 1 <= number <= part_count(upload):
+            raise UploadError(f"Part {number} is out of range.")
+        urls[number] = s3.generate_presigned_url('upload_part', Params={
+            'Bucket': settings.AWS_STORAGE_BUCKET_NAME, 'Key': upload['key'],
+            'UploadId': upload['upload_id'], 'PartNumber': number,
+        }, ExpiresIn=3600)
+    return urls
+
+
+def complete_upload(upload):
+    """
+    Finish a multipart upload if there is one, then check the object S3 stored
+    matches what was announced in ``start_upload``. Objects that don't match
+    are deleted.
+    """
+    s3 = get_s3_client()
+    bucket = settings.AWS_STORAGE_BUCKET_NAME
+    if 'upload_id' in upload:
+        try:
+            parts = uploaded_parts(upload)
+            missing = part_count(upload) - len(parts)
+            if missing > 0:
+                # Leave the upload open so the client can resume it
+                raise UploadError(f"{missing} parts of the file haven't been uploaded yet.")
+            s3.complete_multipart_upload(Bucket=bucket, Key=upload['key'], UploadId=upload['upload_id'],
+                                         MultipartUpload={'Parts': parts})
+        except UploadClosed:
+            pass  # Completed by an earlier attempt; head_object tells whether the object is there
+        except (BotoCoreError, ClientError) as e:
+            if error_code(e) != 'NoSuchUpload':
+                # EntityTooSmall, InvalidPart and the like: the parts can't be assembled as sent
+                raise UploadError(f"S3 couldn't assemble the file: {e}")
+    try:
+        head = s3.head_object(Bucket=bucket, Key=upload['key'])
+    except (BotoCoreError, ClientError):
+        raise UploadError("The file hasn't finished uploading.")
+
+    if head['ContentLength'] != upload['size'] or head.get('ContentType') != upload['content_type']:
+        try:
+            s3.delete_object(Bucket=bucket, Key=upload['key'])
+        except (BotoCoreError, ClientError):
+            # Leave it to the job worker, which retries
+            enqueue('doc.delete_s3_object', file_key=upload['key'])
+        raise UploadError("The uploaded file doesn't match the file that was announced.")
@@ -26,7 +26,15 @@ urlpatterns = [
     # and whether they are function or class based views (see above)
     #path('', views.doc_view, name='doc'),
     path('upload/', views.upload_document, name='upload_document'),
+    path('upload/start/', views.start_direct_upload, name='start_direct_upload'),
+    path('upload/parts/', views.direct_upload_parts, name='direct_upload_parts'),
+    path('upload/finalize/', views.finalize_direct_upload, name='finalize_direct_upload'),
     path('<int:document_id>/', views.document_detail, name='document_detail'),
+    path('<int:document_id>/download/', views.download_document, name='download_document'),
+    path('<int:document_id>/preview/', views.download_document, {'inline': True}, name='preview_document'),
+    path('<int:document_id>/thumbnail/', views.document_thumbnail, name='document_thumbnail'),
+    path('<int:document_id>/comments/', views.document_comments, name='document_comments'),
+    path('<int:document_id>/tags/', views.edit_document_tags, name='edit_document_tags'),
     path('<int:document_id>/delete/', views.delete_document, name='delete_document'),
     path('<int:document_id>/like/', views.like_document, name='like_document'),
     path('<int:document_id>/comment/<int:comment_id>/delete/', views.delete_comment, name='delete_comment'),
@@ -1,17 +1,32 @@
 import os
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from .models import Document, Like, DocumentComment, Tag
+from django.core.exceptions import PermissionDenied
+from django.db import connection, transaction
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.http import require_POST
+from .models import Document, Like, DocumentComment, Rendition
 from django.contrib import messages
 from projects.models import Project
-from .forms import DocumentForm, DocumentCommentForm
+from .forms import DocumentForm, DocumentDetailsForm, DocumentCommentForm
 from django.conf import settings
-import boto3
 from classes.models import Class
+from mysite import async_views
+from mysite.async_views import aget_object_or_404
+from mysite.roles import get_roles
+from .counters import is_first_view, record_view
+from . import facets, search, tags, uploads
+from .uploads import UploadError, UploadsUnavailable
+from .downloads import afile_response, file_response
+from mysite.pagination import KeysetPage, keyset_paginate, load_more
 
-
-def is_pma_admin(user):
-    return user.groups.filter(name='PMA Admin').exists()
+SEARCH_RESULTS_PER_PAGE = 20
+COMMENTS_PER_PAGE = 20
+COMMENT_ORDER = ('-created_at', '-id')
+TAG_SUGGESTIONS = 10
+TAG_SUGGESTIONS_MAX = 50
 
 @login_required
 def upload_document(request, class_id, project_id):
@@ -26,17 +41,104 @@ def upload_document(request, class_id, project_id):
             document.owner = request.user
             document.project = project
             document.save()
-            # Handle tags
-            tags_input = form.cleaned_data.get('tags_input', '')
-            if tags_input:
-                tag_names = [t.strip().lower() for t in tags_input.split(',') if t.strip()]
-                for tag_name in tag_names:
-                    tag, created = Tag.objects.get_or_create(name=tag_name)
-                    document.tags.add(tag)
+            tags.add_tags(document, form.cleaned_data.get('tags_input', ''))
             return redirect('classes:projects:doc:document_detail', class_id=class_id, project_id=project_id, document_id=document.id)
     else:
         form = DocumentForm()
-        return render(request, 'doc/upload_document.html', {'form': form, 'project': project})
+        return render(request, 'doc/upload_document.html', {
+            'form': form,
+            'project': project,
+            'direct_uploads': getattr(settings, 'DOCUMENT_DIRECT_UPLOADS', False),
+        })
+
+
+def get_upload_project(request, class_id, project_id):
+    """The project being uploaded to, or None if the user can't add documents to it."""
+    project = get_object_or_404(Project, project_id=project_id, class_belongs_to__class_id=class_id)
+    roles = get_roles(request)
+    return project if roles.owns(project) or roles.is_member(project) else None
+
+
+# Direct-to-S3 uploads (see doc/uploads.py). The upload page calls these with fetch()
+# and sends the file itself straight to the bucket.
+
+@login_required
+@require_POST
+def start_direct_upload(request, class_id, project_id):
+    project = get_upload_project(request, class_id, project_id)
+    if project is None:
+        return JsonResponse({'error': "Only project members can upload documents."}, status=403)
+    try:
+        size = int(request.POST.get('size', ''))
+        return JsonResponse(uploads.start_upload(request.user, project, request.POST.get('filename', ''), size))
+    except ValueError:
+        return JsonResponse({'error': "The file size is missing."}, status=400)
+    except UploadsUnavailable as e:
+        # The upload page falls back to posting the file through the server
+        return JsonResponse({'error': str(e)}, status=503)
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+
+@login_required
+@require_POST
+def direct_upload_parts(request, class_id, project_id):
+    """Presigned URLs for the requested parts, plus the parts S3 already has (for resuming)."""
+    project = get_upload_project(request, class_id, project_id)
+    if project is None:
+        return JsonResponse({'error': "Only project members can upload documents."}, status=403)
+    try:
+        upload = uploads.read_token(request.POST.get('token', ''), request.user, project)
+        part_numbers = [int(n) for n in request.POST.getlist('part')]
+        return JsonResponse({
+            'uploaded': [part['PartNumber'] for part in uploads.uploaded_parts(upload)],
+            'urls': uploads.part_urls(upload, part_numbers),
+        })
+    except ValueError:
+        return JsonResponse({'error': "Part numbers must be integers."}, status=400)
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+
+@login_required
+@require_POST
+def finalize_direct_upload(request, class_id, project_id):
+    """Check the uploaded object and create its Document."""
+    project = get_upload_project(request, class_id, project_id)
+    if project is None:
+        return JsonResponse({'error': "Only project members can upload documents."}, status=403)
+    form = DocumentDetailsForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    try:
+        upload = uploads.read_token(request.POST.get('token', ''), request.user, project)
+        # A retried finalize request returns the document the first one created
+        document = Document.objects.filter(project=project, file=upload['key']).first()
+        if document is None:
+            # The S3 calls run before any lock is taken; completing twice is harmless (see complete_upload)
+            uploads.complete_upload(upload)
+            with transaction.atomic():
+                # Two requests finishing the same upload at once queue here, and the second returns
+                # the first one's document. FOR NO KEY UPDATE still lets other rows referencing the
+                # project be inserted meanwhile.
+                Project.objects.select_for_update(no_key=connection.features.has_select_for_no_key_update).get(
+                    pk=project.pk)
+                document = Document.objects.filter(project=project, file=upload['key']).first()
+                if document is None:
+                    document = form.save(commit=False)
+                    document.owner = request.user
+                    document.project = project
+                    document.file.name = upload['key']  # already in the bucket, so nothing is re-uploaded
+                    document.save()
+                    tags.add_tags(document, form.cleaned_data.get('tags_input', ''))
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'document_id': document.id,
+        'redirect': reverse('classes:projects:doc:document_detail', kwargs={
+            'class_id': class_id, 'project_id': project_id, 'document_id': document.id}),
+    }, status=201)
 
 @login_required
 def document_detail(request, class_id, project_id, document_id):
@@ -48,30 +150,19 @@ def document_detail(request, class_id, project_id, document_id):
     project = get_object_or_404(Project, project_id=project_id, class_belongs_to=class_instance)
     document = get_object_or_404(Document, id=document_id, project=project)
 
-     # Create a set of viewed documents in the session if it doesn't exist
-    if 'viewed_documents' not in request.session:
-        request.session['viewed_documents'] = []
-    
-    # Check if this document has been viewed in this session
-    viewed_documents = request.session['viewed_documents']
-    if document_id not in viewed_documents:
-        document.views += 1
-        document.save()
-        # Add the document ID to the viewed list
-        viewed_documents.append(document_id)
-        request.session['viewed_documents'] = viewed_documents
-        request.session.modified = True
+    # Count each user's view once per dedupe window
+    if is_first_view(request.user, document):
+        record_view(document)
 
     file_extension = os.path.splitext(document.file.name)[1].lower()
-    comments = document.comments.all()
+    # Only evaluated when the cached comments fragment has to be rendered (see mysite/fragments.py);
+    # later pages come from document_comments
+    comments = KeysetPage(document.comments.select_related('author'), COMMENT_ORDER, COMMENTS_PER_PAGE)
     comment_form = DocumentCommentForm()
 
     # Determine if the file is a previewable type
     can_preview = file_extension in ['.pdf', '.png', '.jpg', '.jpeg', '.txt']
 
-    if 'viewed_documents' not in request.session:
-        request.session['viewed_documents'] = []
-
     # Handle new comment
     if request.method == 'POST':
         comment_form = DocumentCommentForm(request.POST)
@@ -83,10 +174,8 @@ def document_detail(request, class_id, project_id, document_id):
             messages.success(request, "Comment added successfully!")
             return redirect('classes:projects:doc:document_detail', class_id=class_id, project_id=project_id, document_id=document.id)
 
-    # Split tags into a list
-    tags = [tag.name for tag in document.tags.all()]
-
     is_liked_by_user = document.is_liked_by(request.user)
+    can_delete = request.user == document.owner or get_roles(request).is_pma_admin_of(class_instance)
 
     context = {
         'class': class_instance,
@@ -94,14 +183,49 @@ def document_detail(request, class_id, project_id, document_id):
         'document': document,
         'comments': comments,
         'comment_form': comment_form,
-        'tags': tags,
         'file_extension': file_extension,
         'can_preview': can_preview,
         'is_liked_by_user': is_liked_by_user,
+        'can_delete': can_delete,
+        'comment_count': document.comments.count(),
+        'viewer': {'id': request.user.id, 'roles': ['document-owner'] if request.user.id == document.owner_id else []},
     }
     return render(request, 'doc/document_detail.html', context)
 
 
+@login_required
+def document_comments(request, class_id, project_id, document_id):
+    """The page of the document's comments after ``?after=``, for the "Load more" button."""
+    document = get_object_or_404(Document.objects.select_related('project__class_belongs_to'), id=document_id,
+                                 project__project_id=project_id, project__class_belongs_to__class_id=class_id)
+    if not get_roles(request).can_view_project(document.project):
+        raise PermissionDenied
+    page = keyset_paginate(request, document.comments.select_related('author'), COMMENT_ORDER, COMMENTS_PER_PAGE)
+    return load_more(request, page, 'doc/comment_cards.html', {'document': document})
+
+
+@async_views.login_required
+async def download_document(request, class_id, project_id, document_id, inline=False):
+    """The document's file, for project members only; ``inline`` serves it for the preview pane."""
+    project = await aget_object_or_404(Project.objects.select_related('class_belongs_to'), project_id=project_id,
+                                       class_belongs_to__class_id=class_id)
+    document = await aget_object_or_404(Document.objects.all(), id=document_id, project=project)
+    if not await sync_to_async(get_roles(request).can_view_project)(project):
+        raise PermissionDenied
+    return await afile_response(request, document.file, inline=inline)
+
+
+@login_required
+def document_thumbnail(request, class_id, project_id, document_id):
+    """The document's preview thumbnail (see doc/renditions.py)."""
+    project = get_object_or_404(Project, project_id=project_id, class_belongs_to__class_id=class_id)
+    rendition = get_object_or_404(Rendition.objects.exclude(file=''), document_id=document_id,
+                                  document__project=project)
+    if not get_roles(request).can_view_project(project):
+        raise PermissionDenied
+    return file_response(request, rendition.file, inline=True)
+
+
 @login_required
 def delete_comment(request, class_id, project_id, document_id, comment_id):
     class_instance = get_object_or_404(Class, class_id=class_id)
@@ -122,13 +246,13 @@ def delete_comment(request, class_id, project_id, document_id, comment_id):
                    project_id=project_id, 
                    document_id=document_id)
 
-@login_required
-def like_document(request, class_id, project_id, document_id):
-    class_instance = get_object_or_404(Class, class_id=class_id)
-    project = get_object_or_404(Project, project_id=project_id, class_belongs_to=class_instance)
-    document = get_object_or_404(Document, id=document_id, project=project)
+@async_views.login_required
+async def like_document(request, class_id, project_id, document_id):
+    document = await aget_object_or_404(Document.objects.all(), id=document_id, project__project_id=project_id,
+                                        project__class_belongs_to__class_id=class_id)
 
-    was_liked = document.toggle_like(user=request.user)
+    # toggle_like() runs in a transaction, which the async ORM can't open
+    was_liked = await sync_to_async(document.toggle_like)(user=request.user)
         
     if was_liked:
         messages.success(request, "Document liked successfully!")
@@ -144,7 +268,7 @@ def delete_document(request, class_id, project_id, document_id):
     document = get_object_or_404(Document, id=document_id, project=project)
 
     # Check if the user is the owner or part of PMA admins
-    if request.user == document.owner or request.user in document.project.get_all_pma_admins():
+    if request.user == document.owner or get_roles(request).is_pma_admin_of(class_instance):
         try:
             document.delete(user=request.user)
             messages.success(request, "Document deleted successfully.")
@@ -161,39 +285,72 @@ def delete_document(request, class_id, project_id, document_id):
                    project_id=project_id, 
                    document_id=document_id)
 
-from django.db.models import Q
+@login_required
+@require_POST
+def edit_document_tags(request, class_id, project_id, document_id):
+    """Replace a document's tags; allowed to whoever may delete it."""
+    document = get_object_or_404(Document.objects.select_related('project__class_belongs_to'), id=document_id,
+                                 project_id=project_id, project__class_belongs_to_id=class_id)
+    if request.user.id != document.owner_id and not get_roles(request).is_pma_admin_of(document.project.class_belongs_to):
+        raise PermissionDenied
+    tags.set_tags(document, request.POST.get('tags_input', ''))
+    messages.success(request, "Tags updated.")
+    return redirect('classes:projects:doc:document_detail', class_id=class_id, project_id=project_id, document_id=document_id)
+
 
-@login_required  
-def search_documents(request):
+@async_views.login_required
+async def search_documents(request):
     if request.user.username == 'guest':
         messages.error(request, "Access restricted for Anonymous Users.")
         return redirect('home')
     
     query = request.GET.get('q', '')
-    if query:
-        # First, get all projects the user has access to
-        accessible_projects = Project.objects.filter(
-            Q(owner=request.user) |  # Projects owned by user
-            Q(members=request.user)   # Projects where user is a member
-        ).distinct()
-
-        # Then search for documents within those projects
-        documents = Document.objects.filter(
-            # Filter documents by accessible projects
-            project__in=accessible_projects
-        ).filter(
-            # Apply search criteria
-            Q(title__icontains=query) |  # Search in titles
-            Q(tags__name__icontains=query)  # Search in tags
-        ).distinct().select_related('project', 'owner').prefetch_related('tags')
-        
-        # Filter out documents with no project (if any exist)
-        documents = [doc for doc in documents if doc.project and doc.project.project_id]
+    filters = facets.parse_filters(request.GET)
+    searching = bool(query) or facets.is_filtered(filters)
+    if searching:
+        # Matching, ranking and the access check all happen in the database; without a query,
+        # the filters alone browse the documents the user can see, newest first
+        if query:
+            # The first search picks the backend, which can mean introspecting the database
+            results = await sync_to_async(search.search_documents)(request.user, query)
+            ordering = search.SEARCH_ORDER
+        else:
+            results = search.accessible_documents(request.user)
+            ordering = ('-date_uploaded', '-id')
+        results = facets.apply_filters(results, filters)
+        documents = keyset_paginate(request, results.select_related(
+            'project__class_belongs_to', 'owner', 'rendition'
+        ).prefetch_related('tags'), ordering, SEARCH_RESULTS_PER_PAGE)
+        if request.GET.get('format') == 'json':
+            return await sync_to_async(load_more)(request, documents, 'doc/search_result_cards.html', {'query': query})
+        result_count = await results.acount()
+        facet_links = facets.facet_links(request.GET, filters, await sync_to_async(facets.facet_counts)(results))
     else:
         documents = []
-    
+        result_count = 0
+        facet_links = []
+
     context = {
         'documents': documents,
         'query': query,
+        'searching': searching,
+        'result_count': result_count,
+        'filters': filters,
+        'facets': facet_links,
+        'clear_filters_url': facets.query_string(request.GET, tag=None, owner=None, project=None,
+                                                 due_after=None, due_before=None),
+        'popular_tags': [] if searching else await sync_to_async(tags.popular)(),
     }
-    return render(request, 'doc/search_results.html', context)
+    # The page of results is fetched while rendering: Django 4.2's async ORM can't prefetch_related() their tags
+    return await sync_to_async(render)(request, 'doc/search_results.html', context)
+
+
+@login_required
+def tag_autocomplete(request):
+    """The most used tags starting with ``?q=``, as JSON for the tag inputs."""
+    try:
+        limit = min(int(request.GET.get('limit', TAG_SUGGESTIONS)), TAG_SUGGESTIONS_MAX)
+    except ValueError:
+        limit = TAG_SUGGESTIONS
+    suggestions = tags.suggest(request.GET.get('q', ''), max(limit, 1))
+    return JsonResponse({'tags': [{'name': name, 'count': count} for name, count in suggestions]})
@@ -0,0 +1,17 @@
+from django.contrib import admin
+from django.utils import timezone
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'max_attempts', 'run_at', 'updated_at')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'idempotency_key')
+    readonly_fields = ('name', 'payload', 'attempts', 'idempotency_key', 'last_error', 'locked_at', 'created_at', 'updated_at')
+    actions = ['requeue']
+
+    @admin.action(description="Requeue selected jobs")
+    def requeue(self, request, queryset):
+        updated = queryset.exclude(status='running').update(status='queued', attempts=0, run_at=timezone.now())
+        self.message_user(request, f"Requeued {updated} jobs.")
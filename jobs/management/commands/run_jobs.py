@@ -0,0 +1,32 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+from jobs.models import Job
+from jobs import queue
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs. Keeps polling unless --once is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run every due job, then exit.")
+        parser.add_argument('--sleep', type=float, default=2.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--purge-days', type=int, default=7,
+                            help="Delete finished jobs older than this many days on startup.")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['purge_days'])
+        purged, _ = Job.objects.filter(status='done', updated_at__lt=cutoff).delete()
+        self.stdout.write(f"Purged {purged} finished jobs; registered jobs: {', '.join(sorted(queue.registry))}")
+
+        while True:
+            close_old_connections()
+            ran = queue.run_pending()
+            if ran:
+                self.stdout.write(f"Ran {ran} jobs")
+            if options['once']:
+                break
+            if not ran:
+                time.sleep(options['sleep'])
@@ -0,0 +1,29 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """A unit of background work, run by the run_jobs management command."""
+    STATUS_CHOICES = [('queued', 'Queued'),
+                      ('running', 'Running'),
+                      ('done', 'Done'),
+                      ('dead', 'Dead')  # Gave up after max_attempts; kept for inspection and requeueing
+                      ]
+
+    name = models.CharField(max_length=200)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    idempotency_key = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_at'], name='jobs_job_status_run_at_idx')]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
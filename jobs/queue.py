@@ -0,0 +1,143 @@
+"""
+A small database-backed job queue.
+
+Functions are registered with ``@job('app.name')`` in an app's ``jobs.py`` and
+queued with ``enqueue('app.name', **payload)``, or many at once with
+``enqueue_many()``. The job row is written in the caller's transaction, so it
+only becomes visible to workers if the surrounding change commits. ``python manage.py run_jobs`` claims due jobs and runs them,
+retrying failures with exponential backoff until ``max_attempts`` is reached,
+after which the job is left in the ``dead`` state.
+"""
+import logging
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def job(name, max_attempts=5):
+    """Register the decorated function as a background job called ``name``."""
+    def register(func):
+        func.job_name = name
+        func.max_attempts = max_attempts
+        registry[name] = func
+        return func
+    return register
+
+
+def enqueue(name, key=None, delay=None, **payload):
+    """
+    Queue job ``name`` with ``payload`` as keyword arguments.
+
+    ``key`` is an idempotency key: a job with the same key is only ever queued
+    once, and the existing Job is returned instead. ``delay`` is a timedelta.
+    """
+    func = registry[name]
+    job = Job(
+        name=name,
+        payload=payload,
+        max_attempts=func.max_attempts,
+        run_at=timezone.now() + (delay or timedelta()),
+        idempotency_key=key,
+    )
+    if getattr(settings, 'JOBS_RUN_EAGERLY', False):
+        func(**payload)
+        return job
+
+    if key is None:
+        job.save()
+        return job
+    try:
+        with transaction.atomic():
+            job.save()
+        return job
+    except IntegrityError:
+        return Job.objects.get(idempotency_key=key)
+
+
+def enqueue_many(name, payloads):
+    """Queue job ``name`` once per payload in ``payloads`` with a single insert."""
+    func = registry[name]
+    payloads = list(payloads)
+    if getattr(settings, 'JOBS_RUN_EAGERLY', False):
+        for payload in payloads:
+            func(**payload)
+        return [Job(name=name, payload=payload, max_attempts=func.max_attempts) for payload in payloads]
+
+    run_at = timezone.now()
+    return Job.objects.bulk_create(
+        Job(name=name, payload=payload, max_attempts=func.max_attempts, run_at=run_at) for payload in payloads
+    )
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying a job that has failed ``attempts`` times."""
+    base = getattr(settings, 'JOBS_RETRY_BASE_SECONDS', 10)
+    return min(base * 2 ** (attempts - 1), 3600)
+
+
+def claim_next():
+    """Mark the next due job as running and return it, or None if nothing is due."""
+    now = timezone.now()
+    lock_timeout = timedelta(seconds=getattr(settings, 'JOBS_LOCK_TIMEOUT_SECONDS', 600))
+    # Jobs left running by a worker that died are picked up again after the lock timeout
+    due = Q(status='queued', run_at__lte=now) | Q(status='running', locked_at__lt=now - lock_timeout)
+
+    with transaction.atomic():
+        candidates = Job.objects.filter(due).order_by('run_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = candidates.select_for_update(skip_locked=True)
+        job = candidates.first()
+        if job is None:
+            return None
+        # Conditional update so two workers can't both claim it on databases without row locks
+        claimed = Job.objects.filter(pk=job.pk, status=job.status, locked_at=job.locked_at).update(
+            status='running', locked_at=now, attempts=job.attempts + 1, updated_at=now,
+        )
+    if not claimed:
+        return claim_next()
+    job.refresh_from_db()
+    return job
+
+
+def run(job):
+    """Run a claimed job and record the outcome."""
+    func = registry.get(job.name)
+    try:
+        if func is None:
+            raise LookupError(f"No job registered as {job.name!r}")
+        func(**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = 'dead'
+            logger.error("Job %s failed for the last time:\n%s", job, job.last_error)
+        else:
+            job.status = 'queued'
+            job.run_at = timezone.now() + timedelta(seconds=backoff(job.attempts))
+            logger.warning("Job %s failed, retrying at %s", job, job.run_at)
+    else:
+        job.status = 'done'
+        job.last_error = ''
+    job.locked_at = None
+    job.save(update_fields=['status', 'run_at', 'last_error', 'locked_at', 'updated_at'])
+    return job
+
+
+def run_pending(limit=None):
+    """Run due jobs until none are left (or ``limit`` have run); returns how many ran."""
+    count = 0
+    while limit is None or count < limit:
+        job = claim_next()
+        if job is None:
+            break
+        run(job)
+        count += 1
+    return count
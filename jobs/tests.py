@@ -0,0 +1,94 @@
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from .models import Job
+from .queue import backoff, enqueue, job, registry, run_pending
+
+calls = []
+
+
+@job('tests.record')
+def record(value):
+    calls.append(value)
+
+
+@job('tests.fail', max_attempts=2)
+def fail():
+    raise RuntimeError("S3 is down")
+
+
+class JobQueueTest(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueued_job_runs_from_the_worker_command(self):
+        queued = enqueue('tests.record', value='hello')
+        self.assertEqual(queued.status, 'queued')
+        self.assertEqual(calls, [])
+
+        call_command('run_jobs', '--once', stdout=StringIO())
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'done')
+        self.assertEqual(queued.attempts, 1)
+        self.assertEqual(calls, ['hello'])
+
+    def test_delayed_jobs_wait_until_due(self):
+        queued = enqueue('tests.record', delay=timedelta(minutes=5), value='later')
+        self.assertEqual(run_pending(), 0)
+        Job.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(calls, ['later'])
+
+    @override_settings(JOBS_RETRY_BASE_SECONDS=10)
+    def test_failed_jobs_retry_with_backoff_then_die(self):
+        queued = enqueue('tests.fail')
+        self.assertEqual(queued.max_attempts, 2)
+
+        before = timezone.now()
+        with self.assertLogs('jobs.queue', 'WARNING'):
+            run_pending()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'queued')
+        self.assertIn('S3 is down', queued.last_error)
+        self.assertGreaterEqual(queued.run_at, before + timedelta(seconds=10))
+        self.assertEqual(run_pending(), 0)  # not due again yet
+
+        Job.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            run_pending()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, 'dead')
+        self.assertEqual(queued.attempts, 2)
+        self.assertEqual(run_pending(), 0)
+
+    @override_settings(JOBS_RETRY_BASE_SECONDS=10)
+    def test_backoff_doubles_and_is_capped(self):
+        self.assertEqual([backoff(n) for n in (1, 2, 3)], [10, 20, 40])
+        self.assertEqual(backoff(20), 3600)
+
+    def test_idempotency_key_queues_once(self):
+        first = enqueue('tests.record', key='welcome:1', value='first')
+        second = enqueue('tests.record', key='welcome:1', value='second')
+        self.assertEqual(first.pk, second.pk)
+        run_pending()
+        self.assertEqual(calls, ['first'])
+
+    def test_stale_running_jobs_are_reclaimed(self):
+        queued = enqueue('tests.record', value='again')
+        Job.objects.filter(pk=queued.pk).update(status='running', locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(calls, ['again'])
+
+    @override_settings(JOBS_RUN_EAGERLY=True)
+    def test_eager_mode_runs_inline(self):
+        enqueue('tests.record', value='now')
+        self.assertEqual(calls, ['now'])
+        self.assertFalse(Job.objects.exists())
+
+    def test_app_jobs_are_registered(self):
+        for name in ('doc.delete_s3_object', 'doc.extract_text', 'profiles.delete_s3_object',
+                     'projects.notify_join_decision'):
+            self.assertIn(name, registry)
@@ -2,6 +2,8 @@ from django.test import TestCase, Client
 from django.urls import reverse
 from django.contrib.auth.models import User
 from unittest.mock import patch
+import threading
+from .views import verify_google_token
 
 class LoginViewsTest(TestCase):
     def setUp(self):
@@ -41,6 +43,23 @@ class LoginViewsTest(TestCase):
         response = self.client.post(self.auth_receiver_url, {'credential': 'invalid_token'})
         self.assertEqual(response.status_code, 403)
 
+    # Purpose: requests sessions aren't thread-safe, so each thread verifying tokens must fetch
+    # Google's certificates over a session of its own, and reuse it for later sign-ins.
+    @patch.dict('os.environ', {'GOOGLE_OAUTH_CLIENT_ID': 'fake_google_client_id'})
+    @patch('google.oauth2.id_token.verify_oauth2_token')
+    def test_each_thread_verifies_tokens_with_its_own_session(self, mock_verify_oauth2_token):
+        def verify_twice():
+            verify_google_token('token')
+            verify_google_token('token')
+
+        threads = [threading.Thread(target=verify_twice) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        transports = [call.args[1] for call in mock_verify_oauth2_token.call_args_list]
+        self.assertEqual(len(set(map(id, transports))), 2)
+
     # Purpose: to test that an authenticated user can access their information correctly. 
     # Creates a test user and then logs them in with already made up data. 
     # Afterwards, a GET request to the user_info view to see if the response status code is 200 or not. Indicating that the page loaded the correctly. 
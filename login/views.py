@@ -2,6 +2,7 @@ from django.shortcuts import render
 
 # Create your views here.
 import os
+import threading
 
 from django.http import HttpResponse
 from django.shortcuts import render, redirect
@@ -13,10 +14,22 @@ from google.auth.transport import requests
 from django.conf import settings
 from profiles.models import Profile
 from django.contrib import messages
+from asgiref.sync import sync_to_async
+from mysite import async_views
 
 
 from mysite.views import home
 
+# Google's certificates are fetched over a pooled requests session rather than a new connection per
+# sign-in. Sessions aren't thread-safe, so each thread in the pool verifying tokens gets its own.
+_google = threading.local()
+
+
+def verify_google_token(token):
+    if not hasattr(_google, 'transport'):
+        _google.transport = requests.Request()
+    return id_token.verify_oauth2_token(token, _google.transport, os.environ['GOOGLE_OAUTH_CLIENT_ID'])
+
 
 @csrf_exempt
 def log_in(request):
@@ -64,38 +77,18 @@ def pma_info(request):
 
 
 
-@csrf_exempt
-def auth_receiver(request):
-    """
-    Google calls this URL after the user has signed in with their Google account.
-    """
-    print('Inside')
-    token = request.POST.get('credential')
-
-    if not token:
-        print("No token received")
-        return HttpResponse(status=403, content="Missing or invalid token")
-
-    try:
-        # Verify the Google token and get user info
-        user_data = id_token.verify_oauth2_token(
-            token, requests.Request(), os.environ['GOOGLE_OAUTH_CLIENT_ID']
-        )
-        email = user_data['email'].lower() # Normalize email address (convert to lowercase)
-        first_name = user_data.get('given_name', '')
-        last_name = user_data.get('family_name', '')
-    except ValueError:
-        print("Token verification failed")
-        return HttpResponse(status=403)
-
+def sign_in(request, user_data):
+    """Log in the Google account's user, creating them on first sign-in; returns whether they are new."""
+    email = user_data['email'].lower()  # Normalize email address (convert to lowercase)
     first_time_user = False
-    
+
     # Check if the user already exists in Django's User model
     try:
         user = User.objects.get(email=email)
     except User.DoesNotExist:
         # If user does not exist, create a new user
-        user = User.objects.create_user(username=email, email=email, first_name=first_name, last_name=last_name)
+        user = User.objects.create_user(username=email, email=email, first_name=user_data.get('given_name', ''),
+                                        last_name=user_data.get('family_name', ''))
         Profile.objects.get_or_create(user=user)
         user.set_unusable_password()  # Set unusable password since they log in with Google
         user.save()
@@ -110,7 +103,28 @@ def auth_receiver(request):
         'first_name': user.first_name,
         'last_name': user.last_name
     }
-    
+    return user, first_time_user
+
+
+@async_views.csrf_exempt
+async def auth_receiver(request):
+    """
+    Google calls this URL after the user has signed in with their Google account.
+    """
+    token = request.POST.get('credential')
+
+    if not token:
+        return HttpResponse(status=403, content="Missing or invalid token")
+
+    try:
+        # Verifying the token may fetch Google's signing certificates. That runs in the shared thread
+        # pool rather than this request's thread, and the event loop serves other requests meanwhile.
+        user_data = await sync_to_async(verify_google_token, thread_sensitive=False)(token)
+    except ValueError:
+        return HttpResponse(status=403)
+
+    user, first_time_user = await sync_to_async(sign_in)(request, user_data)
+
     if(first_time_user):
         return redirect('profiles:editprofile', user.username)
     
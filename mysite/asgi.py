@@ -2,6 +2,10 @@
 ASGI config for mysite project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The web dyno serves it with uvicorn workers under gunicorn (see Procfile), so
+async views (see mysite/async_views.py) wait on S3 and Google without holding a
+thread; sync views still run, each in a thread of its own. ``gunicorn
+mysite.wsgi`` remains a working fallback.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -12,5 +16,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+# Each ASGI request runs its sync code in a thread of its own, so a persistent connection would be
+# left open by every request's thread; connect per request instead
+os.environ.setdefault('DATABASE_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -0,0 +1,56 @@
+"""
+Helpers for async views.
+
+Under ASGI (see mysite/asgi.py) an ``async def`` view runs on the event loop,
+so a request waiting on S3 or Google holds no worker thread. Django 4.2's view
+decorators and shortcuts only wrap sync views, and ``request.user`` is loaded
+lazily with a blocking query, so async views use the versions here instead:
+
+* ``login_required`` and ``csrf_exempt``, like Django's,
+* ``get_user(request)``, which loads ``request.user`` in a thread, after which
+  its attributes can be read on the event loop,
+* ``aget_object_or_404()``, on Django's async ORM.
+
+Anything without an async API (sessions, ``login()``, ``get_roles()``,
+transactions) is called through ``sync_to_async``, which runs it in the
+request's own thread so it shares one database connection.
+"""
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404
+
+
+async def get_user(request):
+    """``request.user``, loaded from the session without blocking the event loop."""
+    def load():
+        request.user.is_authenticated  # Evaluates the lazy object
+        return request.user
+    return await sync_to_async(load)()
+
+
+def login_required(view):
+    """``django.contrib.auth.decorators.login_required`` for an async view."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await get_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def csrf_exempt(view):
+    """``django.views.decorators.csrf.csrf_exempt`` for an async view."""
+    @wraps(view)
+    async def wrapper(*args, **kwargs):
+        return await view(*args, **kwargs)
+    wrapper.csrf_exempt = True
+    return wrapper
+
+
+async def aget_object_or_404(queryset, **kwargs):
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
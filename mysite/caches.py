@@ -0,0 +1,151 @@
+"""
+Cache backend selection.
+
+``cache_settings()`` builds ``CACHES`` from the environment so every web and
+worker process on a deploy shares one cache:
+
+* ``CACHE_BACKEND`` picks a backend explicitly: ``redis``, ``memcached``,
+  ``db``, ``file`` or ``locmem``. ``CACHE_LOCATION`` overrides its location.
+* Otherwise Redis is used when ``REDIS_URL`` (or ``REDIS_TLS_URL``) is set and
+  the ``redis`` package is installed, then Memcached when
+  ``MEMCACHED_SERVERS`` (or the MemCachier/Memcached Cloud add-on variables)
+  is set and ``pymemcache`` is installed, then the ``django_cache`` database
+  table on Heroku, and per-process local memory everywhere else.
+
+The database table is created by ``python manage.py createcachetable``, which
+runs in the Procfile's release phase. Keys are prefixed with the deploy's
+release (``CACHE_KEY_PREFIX``, else Heroku's ``HEROKU_RELEASE_VERSION`` or
+``SOURCE_VERSION``), so a new deploy never reads entries written by old code.
+
+``backend_stats()`` reports what the configured backend knows about itself for
+the staff cache stats page.
+"""
+import importlib.util
+import os
+import tempfile
+
+BACKENDS = {
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+    'db': 'django.core.cache.backends.db.DatabaseCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+}
+DATABASE_TABLE = 'django_cache'
+MEMCACHED_VARIABLES = ('MEMCACHED_SERVERS', 'MEMCACHIER_SERVERS', 'MEMCACHEDCLOUD_SERVERS')
+
+
+def installed(module):
+    return importlib.util.find_spec(module) is not None
+
+
+def redis_url(environ):
+    return environ.get('REDIS_URL') or environ.get('REDIS_TLS_URL')
+
+
+def memcached_servers(environ):
+    for variable in MEMCACHED_VARIABLES:
+        if environ.get(variable):
+            return environ[variable].split(',')
+    return None
+
+
+def pick_backend(environ):
+    backend = environ.get('CACHE_BACKEND')
+    if backend:
+        if backend not in BACKENDS:
+            raise ValueError(f"CACHE_BACKEND must be one of {', '.join(BACKENDS)}, not {backend!r}")
+        return backend
+    if redis_url(environ) and installed('redis'):
+        return 'redis'
+    if memcached_servers(environ) and installed('pymemcache'):
+        return 'memcached'
+    if environ.get('DYNO'):
+        return 'db'
+    return 'locmem'
+
+
+def key_prefix(environ):
+    return (environ.get('CACHE_KEY_PREFIX') or environ.get('HEROKU_RELEASE_VERSION')
+            or environ.get('SOURCE_VERSION', '')[:12] or 'sharednotes')
+
+
+def cache_settings(environ=os.environ):
+    """The ``CACHES`` setting for this environment."""
+    backend = pick_backend(environ)
+    location = environ.get('CACHE_LOCATION')
+    config = {
+        'BACKEND': BACKENDS[backend],
+        'KEY_PREFIX': key_prefix(environ),
+        'TIMEOUT': int(environ.get('CACHE_TIMEOUT', 300)),
+    }
+    if backend == 'redis':
+        config['LOCATION'] = location or redis_url(environ)
+        if config['LOCATION'].startswith('rediss://'):
+            # Heroku Redis uses self-signed certificates
+            config['OPTIONS'] = {'ssl_cert_reqs': None}
+    elif backend == 'memcached':
+        config['LOCATION'] = location.split(',') if location else memcached_servers(environ)
+        username, password = environ.get('MEMCACHIER_USERNAME'), environ.get('MEMCACHIER_PASSWORD')
+        options = {'no_delay': True, 'ignore_exc': True, 'use_pooling': True}
+        if username and password:
+            options.update(username=username, password=password)
+        config['OPTIONS'] = options
+    elif backend == 'db':
+        config['LOCATION'] = location or DATABASE_TABLE
+        config['OPTIONS'] = {'MAX_ENTRIES': 50_000}
+    elif backend == 'file':
+        config['LOCATION'] = location or os.path.join(tempfile.gettempdir(), 'sharednotes-cache')
+        config['OPTIONS'] = {'MAX_ENTRIES': 50_000}
+    else:
+        config['LOCATION'] = location or 'sharednotes'
+    return {'default': config}
+
+
+def backend_stats(cache):
+    """Entry counts, hit rates and memory use as far as the backend of ``cache`` reports them."""
+    from django.core.cache.backends.db import DatabaseCache
+    from django.core.cache.backends.filebased import FileBasedCache
+    from django.core.cache.backends.locmem import LocMemCache
+    from django.core.cache.backends.memcached import BaseMemcachedCache
+    from django.core.cache.backends.redis import RedisCache
+    from django.db import connections, router
+
+    if isinstance(cache, RedisCache):
+        info = cache._cache.get_client().info()
+        hits, misses = info.get('keyspace_hits', 0), info.get('keyspace_misses', 0)
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+            'keys': sum(db.get('keys', 0) for name, db in info.items() if name.startswith('db')),
+            'used_memory': info.get('used_memory'),
+            'evicted_keys': info.get('evicted_keys'),
+        }
+    if isinstance(cache, BaseMemcachedCache):
+        servers = {}
+        for server, client in cache._cache.clients.items():
+            values = {key.decode() if isinstance(key, bytes) else key: value for key, value in client.stats().items()}
+            hits, misses = int(values.get('get_hits', 0)), int(values.get('get_misses', 0))
+            servers[server] = {
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+                'keys': int(values.get('curr_items', 0)),
+                'used_memory': int(values.get('bytes', 0)),
+                'evictions': int(values.get('evictions', 0)),
+            }
+        return {'servers': servers}
+    if isinstance(cache, DatabaseCache):
+        db = router.db_for_read(cache.cache_model_class)
+        connection = connections[db]
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(cache._table)}')
+            return {'keys': cursor.fetchone()[0], 'max_entries': cache._max_entries}
+    if isinstance(cache, FileBasedCache):
+        files = cache._list_cache_files()
+        return {'keys': len(files), 'used_memory': sum(os.path.getsize(name) for name in files if os.path.exists(name)),
+                'max_entries': cache._max_entries}
+    if isinstance(cache, LocMemCache):
+        return {'keys': len(cache._cache), 'max_entries': cache._max_entries, 'per_process': True}
+    return {}
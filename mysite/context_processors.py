@@ -0,0 +1,6 @@
+from .roles import get_roles
+
+
+def roles(request):
+    """Expose the request's cached UserRoles to templates as ``roles``."""
+    return {'roles': get_roles(request)}
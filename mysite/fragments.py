@@ -0,0 +1,125 @@
+"""
+Versioned template fragment caching.
+
+``{% cachefragment 'project-documents' project.pk %}`` (from the ``fragments``
+tag library) caches the rendered block under a key that includes a version
+number for that fragment and object. Signal handlers call ``bump()`` when the
+underlying rows change, which moves the version on so the old entry is never
+read again and simply expires.
+
+Fragments are shared by every user who can see the page, so they must not
+contain anything that depends on who is looking: per-user controls are
+rendered hidden and revealed by ``includes/user_controls.html``, and forms in
+fragments get their CSRF token from outside the fragment.
+
+Values that change without a signal (document view counts) can be up to
+``FRAGMENT_CACHE_TIMEOUT`` seconds stale.
+"""
+import atexit
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+FRAGMENTS = (
+    'project-documents',
+    'project-comments',
+    'project-members',
+    'document-tags',
+    'document-comments',
+)
+
+
+def version_key(name, object_id):
+    return f'fragment-version:{name}:{object_id}'
+
+
+def get_version(name, object_id):
+    key = version_key(name, object_id)
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock rather than 1, so a version evicted from the cache can't come back
+        # with a number whose old fragments are still stored
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump(name, *object_ids):
+    """Invalidate fragment ``name`` for the given objects once the current transaction commits."""
+    def bump_versions():
+        for object_id in object_ids:
+            key = version_key(name, object_id)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, time.time_ns(), None)
+    # Bumping before commit would let another request re-cache the old rows in between
+    transaction.on_commit(bump_versions)
+
+
+def get_or_render(name, object_id, render):
+    key = f'fragment:{name}:{object_id}:{get_version(name, object_id)}'
+    content = cache.get(key)
+    stats.record(name, hit=content is not None)
+    if content is None:
+        content = render()
+        cache.set(key, content, getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 300))
+    return content
+
+
+class FragmentStats:
+    """Hit and miss counts per fragment, buffered in process and added to cache-wide totals in batches."""
+
+    flush_every = 100
+    flush_seconds = 30
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(int)
+        self._pending_total = 0
+        self._last_flush = time.monotonic()
+
+    def record(self, name, hit):
+        with self._lock:
+            self._pending[(name, 'hits' if hit else 'misses')] += 1
+            self._pending_total += 1
+            due = (self._pending_total >= self.flush_every
+                   or time.monotonic() - self._last_flush >= self.flush_seconds)
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+            self._pending_total = 0
+            self._last_flush = time.monotonic()
+        for (name, outcome), count in pending.items():
+            key = f'fragment-stats:{name}:{outcome}'
+            cache.add(key, 0, None)
+            cache.incr(key, count)
+
+    def totals(self):
+        """``{name: {'hits': n, 'misses': n, 'hit_rate': r}}`` across all processes sharing the cache."""
+        self.flush()
+        keys = [f'fragment-stats:{name}:{outcome}' for name in FRAGMENTS for outcome in ('hits', 'misses')]
+        counts = cache.get_many(keys)
+        totals = {}
+        for name in FRAGMENTS:
+            hits = counts.get(f'fragment-stats:{name}:hits', 0)
+            misses = counts.get(f'fragment-stats:{name}:misses', 0)
+            totals[name] = {'hits': hits, 'misses': misses,
+                            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None}
+        return totals
+
+    def reset(self):
+        with self._lock:
+            self._pending.clear()
+            self._pending_total = 0
+        cache.delete_many([f'fragment-stats:{name}:{outcome}' for name in FRAGMENTS for outcome in ('hits', 'misses')])
+
+
+stats = FragmentStats()
+atexit.register(stats.flush)
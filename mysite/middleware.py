@@ -1,22 +1,121 @@
+import time
+from contextlib import ExitStack
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.shortcuts import redirect
 from django.conf import settings
+from django.db import connections
 from django.urls import reverse
+from whitenoise.middleware import WhiteNoiseMiddleware
+from mysite import perf
 
-class SuperuserRedirectMiddleware:
+class AsyncCapableMiddleware:
     """
-    Middleware to restrict superusers to only the admin page.
+    Base for middleware that works in both handler modes. Under ASGI a sync-only
+    middleware makes Django run the rest of the chain, async views included, in
+    a thread, so every middleware here provides an async ``__acall__`` too.
     """
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.call(request)
+
+
+class SuperuserRedirectMiddleware(AsyncCapableMiddleware):
+    """
+    Middleware to restrict superusers to only the admin page.
+    """
+
+    def redirect(self, request):
         # If the user is authenticated and a superuser, but not accessing the admin page
         if request.user.is_authenticated and request.user.is_superuser:
             admin_url = reverse('admin:index')  # Admin index page URL
             # Check if the user is trying to access a non-admin page
             if not request.path.startswith(reverse('admin:index')):
                 return redirect(admin_url)
+        return None
+
+    def call(self, request):
+        return self.redirect(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        # Loading request.user is a query, so it happens in a thread
+        return await sync_to_async(self.redirect)(request) or await self.get_response(request)
+
+
+class StaticFilesMiddleware(AsyncCapableMiddleware, WhiteNoiseMiddleware):
+    """
+    WhiteNoise, which only has a sync ``__call__``, made async-capable: static
+    files are served from a thread and everything else is passed straight on.
+    """
+
+    def __init__(self, get_response):
+        WhiteNoiseMiddleware.__init__(self, get_response)
+        AsyncCapableMiddleware.__init__(self, get_response)
+
+    def call(self, request):
+        return WhiteNoiseMiddleware.__call__(self, request)
+
+    async def __acall__(self, request):
+        static_file = self.find_file(request.path_info) if self.autorefresh else self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+
+class InstrumentationMiddleware(AsyncCapableMiddleware):
+    """
+    Records query count, DB time, template time and latency for each request (see mysite/perf.py).
+    """
+
+    @staticmethod
+    def wrap_connections(metrics):
+        # Execute wrappers belong to this thread's connections; async views query from the request's thread
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(metrics.execute_wrapper))
+        return stack
+
+    def call(self, request):
+        metrics = perf.RequestMetrics()
+        token = perf.current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with self.wrap_connections(metrics):
+                response = self.get_response(request)
+        finally:
+            perf.current.reset(token)
+        metrics.total_time = time.perf_counter() - start
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = perf.RequestMetrics()
+        token = perf.current.set(metrics)
+        start = time.perf_counter()
+        stack = await sync_to_async(self.wrap_connections)(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            perf.current.reset(token)
+        metrics.total_time = time.perf_counter() - start
+        return await sync_to_async(self.finish)(request, response, metrics)
 
-        response = self.get_response(request)
+    def finish(self, request, response, metrics):
+        match = request.resolver_match
+        if match is None or match.view_name is None:
+            # Static files and 404s for unknown URLs
+            return response
+        metrics.view_name = match.view_name
+        response.perf = metrics
+        if getattr(settings, 'PERF_SERVER_TIMING', True):
+            response['Server-Timing'] = metrics.server_timing()
+        perf.record(metrics)
         return response
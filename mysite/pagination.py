@@ -0,0 +1,119 @@
+"""
+Page-number and keyset pagination.
+
+``paginate()`` is Django's page-number pagination, for short lists where
+jumping to page N matters. ``keyset_paginate()`` is for long, append-heavy
+lists (comments, documents, search results): instead of ``OFFSET`` it filters
+on the sort key of the last row shown, ``WHERE (created_at, id) < (?, ?)``, so
+with a matching composite index every page costs the same as the first. The
+position is carried in an opaque ``after`` cursor, and ``load_more()`` returns
+the next page as rendered HTML plus the following cursor for the "Load more"
+buttons (see includes/load_more.html).
+"""
+import base64
+import binascii
+import datetime
+import json
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.http import JsonResponse
+from django.template.loader import render_to_string
+from django.utils.functional import cached_property
+
+
+def paginate(request, queryset, per_page, page_param='page'):
+    """Return the requested page of ``queryset``, falling back to the first/last page on bad input."""
+    return Paginator(queryset, per_page).get_page(request.GET.get(page_param))
+
+
+def encode_cursor(values):
+    values = [value.isoformat() if isinstance(value, (datetime.date, datetime.datetime)) else value
+              for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """The sort key values in ``cursor``, or ``None`` when it isn't one of ours."""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if not isinstance(values, list) or not all(isinstance(value, (str, int, float)) for value in values):
+        return None
+    return values
+
+
+class KeysetPage:
+    """
+    The ``per_page`` rows of ``queryset`` that follow ``cursor`` in ``ordering``,
+    which must end in a unique field (usually ``-id``). Rows are fetched on
+    first use, so a page rendered inside a cached fragment costs no query.
+    """
+
+    def __init__(self, queryset, ordering, per_page, cursor=None):
+        self.queryset = queryset
+        self.ordering = ordering
+        self.per_page = per_page
+        self.after = decode_cursor(cursor)
+        if self.after is not None and len(self.after) != len(ordering):
+            self.after = None
+
+    def after_filter(self, values):
+        # (a, b, c) after (x, y, z) is a > x, or a = x and b > y, or a = x and b = y and c > z
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    @cached_property
+    def rows(self):
+        queryset = self.queryset.order_by(*self.ordering)
+        if self.after is not None:
+            try:
+                queryset = queryset.filter(self.after_filter(self.after))
+            except (ValidationError, ValueError, TypeError):
+                # A tampered cursor starts over from the first page
+                queryset = self.queryset.order_by(*self.ordering)
+        return list(queryset[:self.per_page + 1])
+
+    @property
+    def object_list(self):
+        return self.rows[:self.per_page]
+
+    @property
+    def has_next(self):
+        return len(self.rows) > self.per_page
+
+    @property
+    def next_cursor(self):
+        if not self.has_next:
+            return None
+        last = self.object_list[-1]
+        return encode_cursor([getattr(last, field.lstrip('-')) for field in self.ordering])
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+def keyset_paginate(request, queryset, ordering, per_page, cursor_param='after'):
+    """The page of ``queryset`` after the request's cursor, or the first page."""
+    return KeysetPage(queryset, ordering, per_page, request.GET.get(cursor_param))
+
+
+def load_more(request, page, template_name, context=None):
+    """A page rendered with ``template_name`` (which gets it as ``page``) and the cursor of the next one, as JSON."""
+    html = render_to_string(template_name, {**(context or {}), 'page': page}, request)
+    return JsonResponse({'html': html, 'next': page.next_cursor})
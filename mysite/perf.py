@@ -0,0 +1,203 @@
+"""
+Per-view request instrumentation.
+
+``mysite.middleware.InstrumentationMiddleware`` measures every request that
+resolves to a URL name: the number of SQL queries and the time spent in them
+(through a database execute wrapper, so it works with DEBUG off), the time
+spent rendering templates (through the ``InstrumentedTemplates`` backend) and
+the total latency. Each request is
+
+* logged as one JSON line on the ``mysite.perf`` logger,
+* sent back in a ``Server-Timing`` header, which browser dev tools display,
+* attached to the response as ``response.perf`` for tests, and
+* added to the samples behind the staff page at admin/perf/, which shows
+  latency and query percentiles per view.
+
+Template time includes any queries run while rendering, so it overlaps DB time.
+
+``VIEW_QUERY_BUDGETS`` maps URL names to the most queries the view may run.
+Requests over budget are logged as warnings, and tests call
+``assert_within_budget(response)`` so an N+1 regression fails the build.
+"""
+import atexit
+import json
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger('mysite.perf')
+current = ContextVar('request_metrics', default=None)
+
+SAMPLES_KEY = 'perf-samples:{}'
+VIEWS_KEY = 'perf-views'
+
+
+class RequestMetrics:
+
+    def __init__(self):
+        self.view_name = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.total_time = 0.0
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+    def as_dict(self):
+        return {
+            'view': self.view_name,
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 2),
+            'template_ms': round(self.template_time * 1000, 2),
+            'total_ms': round(self.total_time * 1000, 2),
+        }
+
+    def server_timing(self):
+        return (f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries", '
+                f'tpl;dur={self.template_time * 1000:.1f}, total;dur={self.total_time * 1000:.1f}')
+
+
+class TimedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        metrics = current.get()
+        if metrics is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - start
+
+
+class InstrumentedTemplates(DjangoTemplates):
+    """The Django template backend, timing each top-level render (includes are part of their parent's time)."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+def query_budget(view_name):
+    return getattr(settings, 'VIEW_QUERY_BUDGETS', {}).get(view_name)
+
+
+def assert_within_budget(response):
+    """Fail unless the view that produced ``response`` stayed within its query budget."""
+    metrics = response.perf
+    budget = query_budget(metrics.view_name)
+    if budget is None:
+        raise AssertionError(f"{metrics.view_name} has no entry in VIEW_QUERY_BUDGETS")
+    if metrics.queries > budget:
+        raise AssertionError(f"{metrics.view_name} ran {metrics.queries} queries, over its budget of {budget}")
+
+
+def record(metrics):
+    line = metrics.as_dict()
+    budget = query_budget(metrics.view_name)
+    if budget is not None and metrics.queries > budget:
+        logger.warning(json.dumps({**line, 'budget': budget, 'over_budget': True}))
+    else:
+        logger.info(json.dumps(line))
+    samples.add(metrics)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    return values[max(math.ceil(fraction * len(values)), 1) - 1]
+
+
+class Samples:
+    """
+    The latest ``keep`` requests per view, shared through the cache. Each
+    process buffers its samples and appends them in batches; a batch can be
+    lost to a concurrent append, which only thins the sample.
+    """
+
+    keep = 500
+    flush_every = 50
+    flush_seconds = 30
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = defaultdict(list)
+        self._pending_total = 0
+        self._last_flush = time.monotonic()
+
+    def add(self, metrics):
+        sample = (round(metrics.total_time * 1000, 2), metrics.queries,
+                  round(metrics.db_time * 1000, 2), round(metrics.template_time * 1000, 2))
+        with self._lock:
+            self._pending[metrics.view_name].append(sample)
+            self._pending_total += 1
+            due = (self._pending_total >= self.flush_every
+                   or time.monotonic() - self._last_flush >= self.flush_seconds)
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(list)
+            self._pending_total = 0
+            self._last_flush = time.monotonic()
+        if not pending:
+            return
+        stored = cache.get_many([SAMPLES_KEY.format(view) for view in pending])
+        cache.set_many({
+            SAMPLES_KEY.format(view): (stored.get(SAMPLES_KEY.format(view), []) + new)[-self.keep:]
+            for view, new in pending.items()
+        }, None)
+        views = cache.get(VIEWS_KEY, set())
+        if not views.issuperset(pending):
+            cache.set(VIEWS_KEY, views | set(pending), None)
+
+    def summary(self):
+        """Per-view request counts and percentiles, slowest p95 first."""
+        self.flush()
+        views = sorted(cache.get(VIEWS_KEY, set()))
+        stored = cache.get_many([SAMPLES_KEY.format(view) for view in views])
+        rows = []
+        for view in views:
+            view_samples = stored.get(SAMPLES_KEY.format(view))
+            if not view_samples:
+                continue
+            latency, queries, db, template = (sorted(column) for column in zip(*view_samples))
+            rows.append({
+                'view': view,
+                'requests': len(view_samples),
+                'p50_ms': percentile(latency, 0.50),
+                'p95_ms': percentile(latency, 0.95),
+                'p99_ms': percentile(latency, 0.99),
+                'p50_queries': percentile(queries, 0.50),
+                'max_queries': queries[-1],
+                'query_budget': query_budget(view),
+                'p95_db_ms': percentile(db, 0.95),
+                'p95_template_ms': percentile(template, 0.95),
+            })
+        return sorted(rows, key=lambda row: row['p95_ms'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._pending.clear()
+            self._pending_total = 0
+        cache.delete_many([SAMPLES_KEY.format(view) for view in cache.get(VIEWS_KEY, set())] + [VIEWS_KEY])
+
+
+samples = Samples()
+atexit.register(samples.flush)
@@ -0,0 +1,71 @@
+from django.utils.functional import cached_property
+from classes.models import Class
+from profiles.models import Profile
+from projects.models import Project
+
+
+class UserRoles:
+    """
+    Resolves what a user is allowed to do, once per request.
+
+    Every set is loaded lazily with a single query the first time it is used and
+    then kept for the rest of the request, so views and templates can call the
+    helpers below as often as they like.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def profile(self):
+        if not self.user.is_authenticated:
+            return None
+        return Profile.objects.filter(user=self.user).first()
+
+    @cached_property
+    def is_pma_admin(self):
+        return self.profile is not None and self.profile.user_type == 'PMA Admin'
+
+    @cached_property
+    def pma_admin_class_ids(self):
+        if not self.user.is_authenticated:
+            return frozenset()
+        return frozenset(Class.objects.filter(pma_admins=self.user).values_list('class_id', flat=True))
+
+    @cached_property
+    def owned_project_ids(self):
+        if not self.user.is_authenticated:
+            return frozenset()
+        return frozenset(Project.objects.filter(owner=self.user).values_list('project_id', flat=True))
+
+    @cached_property
+    def member_project_ids(self):
+        if not self.user.is_authenticated:
+            return frozenset()
+        memberships = Project.members.through.objects.filter(user_id=self.user.id)
+        return frozenset(memberships.values_list('project_id', flat=True))
+
+    def is_pma_admin_of(self, class_instance):
+        return class_instance.class_id in self.pma_admin_class_ids
+
+    def owns(self, project):
+        return project.owner_id == self.user.id
+
+    def is_member(self, project):
+        return project.project_id in self.member_project_ids
+
+    def can_view_project(self, project):
+        """Owners, members and the class's PMA admins can see a project's contents."""
+        return (self.owns(project) or self.is_member(project)
+                or project.class_belongs_to_id in self.pma_admin_class_ids)
+
+    def can_manage_project(self, project):
+        """Owners and the class's PMA admins can delete the project and its members."""
+        return self.owns(project) or project.class_belongs_to_id in self.pma_admin_class_ids
+
+
+def get_roles(request):
+    """Return the UserRoles for this request, creating them on first use."""
+    if not hasattr(request, '_cached_roles'):
+        request._cached_roles = UserRoles(request.user)
+    return request._cached_roles
@@ -0,0 +1,63 @@
+"""
+One S3 client per process.
+
+Creating a boto3 client loads and parses the botocore service model and starts
+with an empty connection pool, so building one per call costs tens of
+milliseconds plus a fresh TLS handshake. Clients are thread-safe once created,
+so every caller shares the client returned by ``get_s3_client()``. Pool size,
+retries and timeouts come from ``AWS_S3_CLIENT_CONFIG``, which django-storages
+uses for its own connections too.
+
+Async views (see doc/downloads.py) don't call boto3, which blocks: they sign a
+URL with the shared client, which needs no network, and send the request with
+the pooled httpx client from ``get_async_http_client()``.
+"""
+import asyncio
+import threading
+import weakref
+import boto3
+import httpx
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+_client = None
+_lock = threading.Lock()
+# httpx clients can't be shared between event loops; uvicorn runs one loop per worker process
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_s3_client():
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                # A private session, since boto3's default session isn't safe to share between threads
+                session = boto3.session.Session()
+                _client = session.client(
+                    's3',
+                    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                    region_name=settings.AWS_S3_REGION_NAME,
+                    endpoint_url=getattr(settings, 'AWS_S3_ENDPOINT_URL', None),
+                    config=getattr(settings, 'AWS_S3_CLIENT_CONFIG', None),
+                )
+    return _client
+
+
+def get_async_http_client():
+    """An httpx.AsyncClient for the running event loop, with the S3 client's timeouts."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        config = getattr(settings, 'AWS_S3_CLIENT_CONFIG', None)
+        timeout = httpx.Timeout(getattr(config, 'read_timeout', 30), connect=getattr(config, 'connect_timeout', 5))
+        client = _async_clients[loop] = httpx.AsyncClient(timeout=timeout)
+    return client
+
+
+@receiver(setting_changed)
+def reset_s3_client(setting, **kwargs):
+    global _client
+    if setting.startswith('AWS_'):
+        _client = None
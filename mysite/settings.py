@@ -1,7 +1,9 @@
 import dj_database_url
+from botocore.config import Config
 from dotenv import load_dotenv
 from pathlib import Path
 import os
+from mysite.caches import cache_settings
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,6 +48,7 @@ INSTALLED_APPS = [
     'projects',  # Custom app for project management
     'classes',  # Custom app for class-related functionality
     'doc',  # Custom app for document management
+    'jobs',  # Database-backed background job queue
 ]
 
 INSTALLED_APPS += [
@@ -80,8 +83,9 @@ SOCIALACCOUNT_PROVIDERS = {
 
 
 MIDDLEWARE = [
+    'mysite.middleware.InstrumentationMiddleware',  # First, so it times everything below it
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'mysite.middleware.StaticFilesMiddleware',  # WhiteNoise, async-capable for ASGI
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -90,7 +94,6 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
     'mysite.middleware.SuperuserRedirectMiddleware',  # Add this line
-    'projects.middleware.EnsureOwnerInMembersMiddleware',
 ]
 
 
@@ -98,7 +101,7 @@ ROOT_URLCONF = 'mysite.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'mysite.perf.InstrumentedTemplates',  # DjangoTemplates that times renders (see mysite/perf.py)
         'DIRS': [os.path.join(BASE_DIR, 'templates')],  # Make sure this points to your templates directory
         'APP_DIRS': True,
         'OPTIONS': {
@@ -108,6 +111,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'profiles.context_processors.user_profile',
+                'mysite.context_processors.roles',
             ],
         },
     },
@@ -123,7 +127,8 @@ if os.getenv('DYNO'):
     DATABASES = {
     'default': dj_database_url.config(
         default=os.getenv('DATABASE_URL'),  # Use DATABASE_URL from environment
-        conn_max_age=600,  # Maintain persistent connections for better performance
+        # Persistent connections for better performance; mysite/asgi.py turns them off, see there
+        conn_max_age=int(os.getenv('DATABASE_CONN_MAX_AGE', 600)),
         ssl_require=True  # Use SSL if needed (you can set this to False if SSL is not required)
         )
     }
@@ -135,6 +140,10 @@ else:
          }
     }
 
+# Cache shared by all web and worker processes, picked from the environment (see mysite/caches.py)
+# The database cache table is created by `python manage.py createcachetable` in the release phase
+CACHES = cache_settings()
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -188,7 +197,98 @@ AWS_S3_REGION_NAME = 'us-east-2'  # e.g., 'us-east-1'
 AWS_S3_FILE_OVERWRITE = False  # To prevent overwriting files
 AWS_DEFAULT_ACL = None  # To avoid any issues with ACLs
 AWS_S3_CUSTOM_DOMAIN = f'{AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com'
+AWS_S3_ENDPOINT_URL = os.getenv('AWS_S3_ENDPOINT_URL')  # Unset for AWS; point at a local S3 stand-in for development
+# Shared by django-storages and mysite.s3.get_s3_client(): one pooled client per process
+AWS_S3_CLIENT_CONFIG = Config(
+    max_pool_connections=int(os.getenv('AWS_S3_MAX_POOL_CONNECTIONS', 20)),  # At least one per concurrent request thread
+    connect_timeout=5,
+    read_timeout=30,
+    retries={'max_attempts': 3, 'mode': 'standard'},
+)
 
 # File storage settings
 DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
-MEDIA_URL = f'https://{AWS_S3_CUSTOM_DOMAIN}/'
\ No newline at end of file
+MEDIA_URL = f'https://{AWS_S3_CUSTOM_DOMAIN}/'
+
+# Sessions are read from the cache and written through to the database; SESSION_ENGINE can be set to
+# 'db', 'cache' or 'signed_cookies' instead. Sessions only hold login data, so a signed cookie stays small.
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.getenv('SESSION_ENGINE', 'cached_db')
+
+# Document view counters (see doc/counters.py)
+# Number of views each worker buffers before writing them; 1 writes every view immediately
+DOCUMENT_VIEW_BUFFER_SIZE = int(os.getenv('DOCUMENT_VIEW_BUFFER_SIZE', 1))
+# Buffered views are also written once this many seconds have passed since the last flush
+DOCUMENT_VIEW_FLUSH_SECONDS = 10
+# A user's repeat views of a document within this many seconds aren't counted again
+DOCUMENT_VIEW_DEDUPE_SECONDS = 24 * 60 * 60
+
+# Full-text document search backend (see doc/search.py); picked from the database vendor when unset
+DOCUMENT_SEARCH_BACKEND = os.getenv('DOCUMENT_SEARCH_BACKEND')
+
+# Maximum number of characters of file text extracted per document for search (see doc/extraction.py)
+DOCUMENT_TEXT_MAX_CHARS = 200_000
+
+# Browser uploads go straight to S3 (see doc/uploads.py); the bucket's CORS rules must allow
+# POST and PUT from the site, and a lifecycle rule should abort incomplete multipart uploads
+DOCUMENT_DIRECT_UPLOADS = os.getenv('DOCUMENT_DIRECT_UPLOADS', 'true').lower() == 'true'
+DOCUMENT_UPLOAD_MAX_BYTES = 200 * 1024 * 1024
+DOCUMENT_UPLOAD_PART_BYTES = 8 * 1024 * 1024  # Files larger than one part use a resumable multipart upload
+
+# Document downloads (see doc/downloads.py): 'redirect' sends S3 files via presigned URLs, 'stream' proxies them
+DOCUMENT_DOWNLOAD_MODE = os.getenv('DOCUMENT_DOWNLOAD_MODE', 'redirect')
+DOCUMENT_DOWNLOAD_MAX_AGE = 300  # Seconds browsers may reuse a download before revalidating
+DOCUMENT_DOWNLOAD_URL_EXPIRY = 3600
+
+# Seconds the tag prefix index behind autocomplete is cached off Postgres (see doc/tags.py); tag changes rebuild it sooner
+TAG_PREFIX_INDEX_TIMEOUT = 600
+
+# Seconds a rendered page fragment is kept (see mysite/fragments.py); edits invalidate it sooner
+FRAGMENT_CACHE_TIMEOUT = 300
+
+# Roster imports turn computing IDs into addresses at this domain (see classes/roster.py)
+ROSTER_EMAIL_DOMAIN = os.getenv('ROSTER_EMAIL_DOMAIN', 'virginia.edu')
+
+# Background jobs (see jobs/queue.py); run the worker with `python manage.py run_jobs`
+JOBS_RUN_EAGERLY = False  # Run jobs inline instead of queueing them
+JOBS_RETRY_BASE_SECONDS = 10  # First retry delay, doubled after each failed attempt
+JOBS_LOCK_TIMEOUT_SECONDS = 600  # A running job is retried if its worker hasn't finished it by then
+
+# Join request notification emails are sent by the job worker; printed to the console unless configured
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'webmaster@localhost')
+
+# Request instrumentation (see mysite/perf.py); staff see percentiles per view at admin/perf/
+PERF_SERVER_TIMING = True  # Send query count and timings to the browser in a Server-Timing header
+# Most SQL queries each view may run with uncached page fragments; tests fail and requests log a warning above it
+VIEW_QUERY_BUDGETS = {
+    'classes:class_list': 4,
+    'classes:class_detail': 8,
+    'classes:projects:project_detail': 12,
+    'classes:projects:doc:document_detail': 18,
+    'projects:project_list': 8,
+    'projects:search_documents': 12,
+    'classes:projects:search_documents': 12,
+    'projects:tag_autocomplete': 4,
+    'classes:projects:project_documents': 8,
+    'classes:projects:project_comments': 6,
+    'classes:projects:doc:document_comments': 6,
+    'classes:projects:add_members': 12,
+    'classes:projects:remove_members': 12,
+    'classes:projects:decide_join_requests': 12,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # One JSON line per request; only over-budget requests are logged unless PERF_LOG_LEVEL is INFO
+        'mysite.perf': {
+            'handlers': ['console'],
+            'level': os.getenv('PERF_LOG_LEVEL', 'INFO' if os.getenv('DYNO') else 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
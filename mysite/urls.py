@@ -24,6 +24,9 @@ urlpatterns = [
     # has not been implemented yet. Please both the url Name and views are subject to change based on need
     # and whether they are function or class based views (see above)
     path('', views.home, name='home'),
+    path('admin/perf/', views.perf_stats, name='perf_stats'),
+    path('admin/cache/', views.cache_stats, name='cache_stats'),
+    path('admin/fragment-cache/', views.fragment_cache_stats, name='fragment_cache_stats'),
     path('admin/', admin.site.urls),
     path('login/', include('login.urls')),
     path('profile/', include('profiles.urls')),
@@ -1,8 +1,43 @@
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import caches
+from django.http import JsonResponse
 from django.shortcuts import render
+from mysite import fragments, perf
+from mysite.caches import backend_stats
 
 
 def home(request):
     return render(request,'home.html')
 
 def project_list(request):
-    return render(request, 'project_list.html')
\ No newline at end of file
+    return render(request, 'project_list.html')
+
+
+@staff_member_required
+def fragment_cache_stats(request):
+    """Hit and miss counts of the page fragment cache, for staff."""
+    return JsonResponse(fragments.stats.totals())
+
+
+@staff_member_required
+def cache_stats(request):
+    """Which cache backend is in use and what it reports about itself, for staff."""
+    config = settings.CACHES['default']
+    return JsonResponse({
+        'backend': config['BACKEND'],
+        'key_prefix': config.get('KEY_PREFIX', ''),
+        'stats': backend_stats(caches['default']),
+        'fragments': fragments.stats.totals(),
+    })
+
+
+@staff_member_required
+def perf_stats(request):
+    """Latency and query percentiles per view over the latest requests, for staff."""
+    rows = perf.samples.summary()
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'views': rows})
+    context = {**admin.site.each_context(request), 'rows': rows, 'title': 'Request performance'}
+    return render(request, 'admin/perf_stats.html', context)
@@ -1,10 +1,6 @@
-from .models import Profile
+from mysite.roles import get_roles
 
 def user_profile(request):
     if request.user.is_authenticated:
-        try:
-            profile = Profile.objects.get(user=request.user)
-            return {'user_profile': profile}
-        except Profile.DoesNotExist:
-            return {'user_profile': None}
+        return {'user_profile': get_roles(request).profile}
     return {}
@@ -0,0 +1,9 @@
+from django.conf import settings
+from jobs.queue import job
+from mysite.s3 import get_s3_client
+
+
+@job('profiles.delete_s3_object')
+def delete_s3_object(file_key):
+    """Delete a replaced profile picture from S3; errors propagate so the job is retried."""
+    get_s3_client().delete_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=file_key)
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0007_alter_profile_computing_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['user_type'], name='profile_user_type'),
+        ),
+    ]
@@ -1,10 +1,12 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
-import boto3
-from django.conf import settings
+from jobs.queue import enqueue
 
 # Create your models here.
 
+# Shared by every user who hasn't uploaded a picture, so it must never be deleted
+DEFAULT_PROFILE_PIC = 'profiles/images/testpfp.png'
+
 def upload_to_profile_folder(instance, filename):
     return f'profiles/{instance.user.username}/{filename}'
 
@@ -27,36 +29,29 @@ class Profile(models.Model):
     user_type = models.CharField(max_length=20, default='Common', choices=USER_TYPE_CHOICES)
     date_joined = models.DateField(auto_now_add=True)
     bio = models.TextField(max_length=500, blank=True, null=True)
-    profile_pic = models.FileField(upload_to=upload_to_profile_folder, default='profiles/images/testpfp.png')
+    profile_pic = models.FileField(upload_to=upload_to_profile_folder, default=DEFAULT_PROFILE_PIC)
+
+    class Meta:
+        indexes = [
+            # Profiles are filtered by role, e.g. by the admin's user type filter
+            models.Index(fields=['user_type'], name='profile_user_type'),
+        ]
 
     def __str__(self):
         return self.user.username
 
     def delete_file_from_s3(self, file_key):
-        """This is a helper method to delete a file from S3."""
-        try:
-            s3 = boto3.client(
-                's3',
-                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                region_name=settings.AWS_S3_REGION_NAME
-            )
-            s3.delete_object(
-                Bucket=settings.AWS_STORAGE_BUCKET_NAME,
-                Key=file_key
-            )
-            return True
-        except Exception as e:
-            print(f"Error deleting file from S3: {e}")
-            return False
+        """Queue a file for deletion from S3 (see profiles.jobs)."""
+        return enqueue('profiles.delete_s3_object', file_key=file_key)
 
     def save(self, *args, **kwargs):
-        # Check if the profile picture is being updated
-        if self.pk:
-            old_profile = Profile.objects.get(pk=self.pk)
-            if old_profile.profile_pic and self.profile_pic != old_profile.profile_pic:
-                # Delete the old profile picture
-                self.delete_file_from_s3(old_profile.profile_pic.name)
-
-        super().save(*args, **kwargs)
-
+        with transaction.atomic():
+            # Check if the profile picture is being updated
+            if self.pk:
+                old_profile = Profile.objects.get(pk=self.pk)
+                if (old_profile.profile_pic and self.profile_pic != old_profile.profile_pic
+                        and old_profile.profile_pic.name != DEFAULT_PROFILE_PIC):
+                    # Delete the old profile picture once the new one is saved
+                    self.delete_file_from_s3(old_profile.profile_pic.name)
+
+            super().save(*args, **kwargs)
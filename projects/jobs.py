@@ -0,0 +1,21 @@
+from django.contrib.auth.models import User
+from django.core.mail import send_mail
+from jobs.queue import job
+from .models import Project
+
+
+@job('projects.notify_join_decision')
+def notify_join_decision(user_id, project_id, approved):
+    """Email a user whether their request to join a project was approved."""
+    user = User.objects.filter(pk=user_id).first()
+    project = Project.objects.filter(pk=project_id).first()
+    if user is None or project is None or not user.email:
+        return
+
+    if approved:
+        subject = f"Your request to join '{project.name}' was approved"
+        message = f"You are now a member of '{project.name}'."
+    else:
+        subject = f"Your request to join '{project.name}' was denied"
+        message = f"The owner of '{project.name}' declined your request to join."
+    send_mail(subject, message, None, [user.email])
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from projects.models import Project
+
+
+class Command(BaseCommand):
+    help = "Add every project owner to their project's members list (one-time backfill)."
+
+    def handle(self, *args, **options):
+        Membership = Project.members.through
+        owner_is_member = Membership.objects.filter(
+            project_id=OuterRef('pk'),
+            user_id=OuterRef('owner_id'),
+        )
+        missing = (
+            Project.objects
+            .filter(~Exists(owner_is_member))
+            .values_list('project_id', 'owner_id')
+        )
+
+        with transaction.atomic():
+            rows = [Membership(project_id=project_id, user_id=owner_id) for project_id, owner_id in missing]
+            Membership.objects.bulk_create(rows, ignore_conflicts=True)
+
+        self.stdout.write(self.style.SUCCESS(f"Added {len(rows)} missing owner memberships."))
@@ -0,0 +1,89 @@
+"""
+Batch membership changes.
+
+Each function takes a project and many usernames, user ids or join request
+ids, and returns one ``{'item': ..., 'status': ...}`` result per distinct item,
+in the order given. The users are resolved in one query, the membership change
+is a single ``members.add()`` or ``members.remove()`` (so the ``m2m_changed``
+handlers in projects.signals still run once), and join requests are deleted in
+one statement, so processing a queue of a few hundred requests costs the same
+handful of queries as processing one. Changes are made in one transaction.
+"""
+import re
+from django.contrib.auth.models import User
+from django.db import transaction
+from jobs.queue import enqueue_many
+from .models import JoinRequest, Project
+
+MAX_BATCH_SIZE = 500
+
+
+def split_usernames(text):
+    """The usernames in ``text``, separated by commas, semicolons or whitespace."""
+    return [name for name in re.split(r'[\s,;]+', text or '') if name]
+
+
+def distinct(items):
+    return list(dict.fromkeys(items))
+
+
+def results(items, statuses, default):
+    return [{'item': item, 'status': statuses.get(item, default)} for item in items]
+
+
+def member_ids(project, user_ids):
+    """The ids in ``user_ids`` that are already members of ``project``."""
+    memberships = Project.members.through.objects.filter(project_id=project.pk, user_id__in=user_ids)
+    return set(memberships.values_list('user_id', flat=True))
+
+
+@transaction.atomic
+def add_members(project, usernames):
+    """Add the users called ``usernames``: 'added', 'already_member' or 'not_found'."""
+    usernames = distinct(usernames)
+    users = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+    existing = member_ids(project, users.values())
+    new = [user_id for user_id in users.values() if user_id not in existing]
+    if new:
+        project.members.add(*new)
+        # A pending request from someone who is now a member has nothing left to decide
+        JoinRequest.objects.filter(project=project, user_id__in=new).delete()
+
+    statuses = {username: 'already_member' if user_id in existing else 'added' for username, user_id in users.items()}
+    return results(usernames, statuses, 'not_found')
+
+
+@transaction.atomic
+def remove_members(project, user_ids):
+    """Remove the users with ``user_ids``: 'removed', 'not_member' or 'owner' (the owner always stays)."""
+    user_ids = distinct(user_ids)
+    existing = member_ids(project, user_ids)
+    removable = [user_id for user_id in user_ids if user_id in existing and user_id != project.owner_id]
+    if removable:
+        project.members.remove(*removable)
+
+    statuses = {user_id: 'removed' for user_id in removable}
+    if project.owner_id in user_ids:
+        statuses[project.owner_id] = 'owner'
+    return results(user_ids, statuses, 'not_member')
+
+
+@transaction.atomic
+def decide_join_requests(project, request_ids, approve):
+    """
+    Approve or deny the project's pending join requests with ``request_ids``:
+    'approved', 'denied' or 'not_found'. Each requester is emailed the decision.
+    """
+    request_ids = distinct(request_ids)
+    pending = dict(JoinRequest.objects.filter(project=project, approved=False, pk__in=request_ids)
+                   .values_list('pk', 'user_id'))
+    if pending:
+        if approve:
+            project.members.add(*pending.values())
+        JoinRequest.objects.filter(pk__in=pending).delete()
+        enqueue_many('projects.notify_join_decision', (
+            {'user_id': user_id, 'project_id': project.pk, 'approved': approve} for user_id in pending.values()
+        ))
+
+    statuses = dict.fromkeys(pending, 'approved' if approve else 'denied')
+    return results(request_ids, statuses, 'not_found')
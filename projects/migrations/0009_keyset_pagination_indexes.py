@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0008_remove_project_pma_admins'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='projectcomment',
+            index=models.Index(fields=['project', '-created_at', '-id'], name='project_comment_recent'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0009_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='joinrequest',
+            index=models.Index(fields=['project', 'approved'], name='joinrequest_project_approved'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.16 on 2026-10-18 13:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0010_joinrequest_project_approved_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='projectcomment',
+            name='project',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='projects.project'),
+        ),
+    ]
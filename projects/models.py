@@ -1,12 +1,60 @@
 from django.db import models
+from django.db.models import Exists, F, Func, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from classes.models import Class
 
 def validate_common(user, project):
-    if user in project.get_all_pma_admins():
+    if project.has_pma_admin(user):
         raise ValidationError("The owner must be a PMA Admin.")
 
+def count_subquery(queryset):
+    """COUNT(*) over a correlated queryset, as a scalar subquery that is 0 when nothing matches."""
+    counted = queryset.order_by().annotate(total=Func('pk', function='COUNT')).values('total')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+class ProjectQuerySet(models.QuerySet):
+
+    def accessible_projects_for(self, user):
+        """
+        The projects ``user`` can see: those they own or are a member of, and
+        every project in a class they are a PMA admin of (see mysite.roles).
+        Membership is checked with EXISTS subqueries, so no member list is loaded.
+        """
+        memberships = Project.members.through.objects.filter(project_id=OuterRef('pk'), user_id=user.pk)
+        pma_admins = Class.pma_admins.through.objects.filter(class_id=OuterRef('class_belongs_to_id'), user_id=user.pk)
+        return self.filter(Q(owner_id=user.pk) | Exists(memberships) | Exists(pma_admins))
+
+    def with_activity(self):
+        """
+        Annotate document_count, member_count, comment_count and latest_activity.
+
+        Each value is a correlated subquery rather than a JOIN + GROUP BY, so the
+        counts don't multiply each other and a page of projects stays one query.
+        """
+        from doc.models import Document  # doc.models imports this module
+
+        documents = Document.objects.filter(project=OuterRef('pk'))
+        members = Project.members.through.objects.filter(project=OuterRef('pk'))
+        comments = ProjectComment.objects.filter(project=OuterRef('pk'))
+
+        last_upload = Subquery(documents.order_by('-date_uploaded').values('date_uploaded')[:1])
+        last_comment = Subquery(comments.order_by('-created_at').values('created_at')[:1])
+
+        return self.annotate(
+            document_count=count_subquery(documents),
+            member_count=count_subquery(members),
+            comment_count=count_subquery(comments),
+            latest_activity=Greatest(
+                F('date_created'),
+                Coalesce(last_upload, F('date_created')),
+                Coalesce(last_comment, F('date_created')),
+            ),
+        )
+
+
 class Project(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
     name = models.CharField(max_length=255)
@@ -17,24 +65,29 @@ class Project(models.Model):
     members = models.ManyToManyField(User, related_name='project_access', blank=True)
     description = models.TextField(blank=True) 
 
+    objects = ProjectQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
-        if self.owner in self.class_belongs_to.pma_admins.all():
+        if self.class_belongs_to.has_pma_admin(self.owner):
             raise ValidationError("The owner must be a common user, not a PMA Admin.")
         super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
     
-    def get_all_pma_admins(self):
-        """Return all PMA admins for this project"""
-        class_pma_admins = list(self.class_belongs_to.pma_admins.all())  
-        return class_pma_admins
+    def has_member(self, user):
+        """One EXISTS query on the (project_id, user_id) unique index, however many members there are."""
+        return Project.members.through.objects.filter(project_id=self.pk, user_id=user.pk).exists()
+
+    def has_pma_admin(self, user):
+        """Whether ``user`` is a PMA admin of the project's class."""
+        return Class.pma_admins.through.objects.filter(class_id=self.class_belongs_to_id, user_id=user.pk).exists()
 
     def delete(self, *args, **kwargs):
         user = kwargs.pop('user', None)
     
         # Allow deletion if the user is either the owner or part of PMA admins
-        if not user or (user != self.owner and user not in self.get_all_pma_admins()):
+        if not user or (user != self.owner and not self.has_pma_admin(user)):
             raise ValidationError(f"Only the owner or PMA admins can delete this project. "
                               f"Owner: {self.owner}, User: {user}")
         
@@ -42,7 +95,8 @@ class Project(models.Model):
 
 
 class ProjectComment(models.Model):
-    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='comments')
+    # Indexed by project_comment_recent, which leads with project
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='comments', db_index=False)
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
@@ -50,9 +104,13 @@ class ProjectComment(models.Model):
 
     class Meta:
         ordering = ['-created_at']  # Most recent comments first
+        indexes = [
+            # Keyset pagination of a project's comments (see mysite/pagination.py)
+            models.Index(fields=['project', '-created_at', '-id'], name='project_comment_recent'),
+        ]
     
     def save(self, *args, **kwargs):
-        if self.owner in self.project.get_all_pma_admins():
+        if self.project.has_pma_admin(self.author):
             raise ValidationError("The owner must be a common user, not a PMA Admin.")
         super().save(*args, **kwargs)
 
@@ -68,6 +126,10 @@ class JoinRequest(models.Model):
 
     class Meta:
         unique_together = ('user', 'project')  # Ensures no duplicate requests
+        indexes = [
+            # A project's pending requests, listed on its page for the owner
+            models.Index(fields=['project', 'approved'], name='joinrequest_project_approved'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} requested to join {self.project.title}"
@@ -0,0 +1,55 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from projects.models import Project, ProjectComment
+from mysite import fragments
+
+
+@receiver(post_save, sender=Project)
+def add_owner_to_members(sender, instance, **kwargs):
+    """
+    Keep the owner in the members list whenever a project is saved.
+    """
+    instance.members.add(instance.owner)
+
+
+@receiver(m2m_changed, sender=Project.members.through)
+def keep_owner_in_members(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Put the owner back if a members change removed them.
+    """
+    if action not in ['post_remove', 'post_clear']:
+        return
+
+    if not reverse:
+        # instance is the project, pk_set holds user ids
+        if action == 'post_clear' or instance.owner_id in pk_set:
+            instance.members.add(instance.owner_id)
+    else:
+        # instance is the user, pk_set holds project ids
+        owned_projects = Project.objects.filter(owner=instance)
+        if action == 'post_remove':
+            owned_projects = owned_projects.filter(project_id__in=pk_set)
+        instance.project_access.add(*owned_projects)
+
+
+# Cached template fragments (see mysite/fragments.py)
+
+@receiver(m2m_changed, sender=Project.members.through)
+def invalidate_member_list(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ['post_add', 'post_remove', 'post_clear']:
+            fragments.bump('project-members', instance.pk)
+        return
+
+    # instance is the user; pk_set holds project ids, except on clear
+    if action == 'pre_clear':
+        instance._cleared_project_ids = list(instance.project_access.values_list('project_id', flat=True))
+    elif action in ['post_add', 'post_remove', 'post_clear']:
+        project_ids = pk_set if action != 'post_clear' else instance._cleared_project_ids
+        fragments.bump('project-members', *project_ids)
+
+
+@receiver(post_save, sender=ProjectComment)
+@receiver(post_delete, sender=ProjectComment)
+def invalidate_comment_list(sender, instance, **kwargs):
+    fragments.bump('project-comments', instance.project_id)
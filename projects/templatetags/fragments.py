@@ -0,0 +1,34 @@
+from django import template
+from mysite import fragments
+
+register = template.Library()
+
+
+class CacheFragmentNode(template.Node):
+
+    def __init__(self, nodelist, name, object_id):
+        self.nodelist = nodelist
+        self.name = name
+        self.object_id = object_id
+
+    def render(self, context):
+        return fragments.get_or_render(self.name, self.object_id.resolve(context),
+                                       lambda: self.nodelist.render(context))
+
+
+@register.tag
+def cachefragment(parser, token):
+    """
+    Caches the enclosed block until mysite.fragments.bump() is called for it:
+
+        {% cachefragment 'project-documents' project.pk %} ... {% endcachefragment %}
+    """
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' takes a fragment name and an object id")
+    name = bits[1].strip('\'"')
+    if name not in fragments.FRAGMENTS:
+        raise template.TemplateSyntaxError(f"Unknown fragment {name!r}; add it to mysite.fragments.FRAGMENTS")
+    nodelist = parser.parse(('endcachefragment',))
+    parser.delete_first_token()
+    return CacheFragmentNode(nodelist, name, parser.compile_filter(bits[2]))
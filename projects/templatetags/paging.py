@@ -0,0 +1,10 @@
+from django import template
+
+register = template.Library()
+
+@register.simple_tag(takes_context=True)
+def page_url(context, page_param, number):
+    """Returns the current query string with ``page_param`` set to ``number``."""
+    params = context['request'].GET.copy()
+    params[page_param] = number
+    return f'?{params.urlencode()}'
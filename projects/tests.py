@@ -1,3 +1,404 @@
-from django.test import TestCase
+from io import StringIO
+from unittest import mock
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from classes.models import Class
+from doc.models import Document, Tag
+from mysite import fragments, perf
+from mysite.perf import assert_within_budget
+from jobs.models import Job
+from .models import JoinRequest, Project, ProjectComment
 
-# Create your tests here.
+
+class ProjectOwnerMembershipTest(TestCase):
+
+    def setUp(self):
+        self.superuser = User.objects.create_superuser(username='superuser', email='superuser@example.com', password='testpassword')
+        self.owner = User.objects.create_user(username='projectowner', password='ownerpass')
+        self.other_user = User.objects.create_user(username='otheruser', password='otherpass')
+
+        self.classs = Class.objects.create(
+            name='Test Class',
+            class_code='TEST101',
+            owner=self.superuser
+        )
+        self.project = Project.objects.create(
+            name='Test Project',
+            owner=self.owner,
+            class_belongs_to=self.classs
+        )
+
+    def test_owner_added_on_create(self):
+        self.assertTrue(self.project.members.filter(id=self.owner.id).exists())
+
+    def test_owner_restored_after_remove(self):
+        self.project.members.add(self.other_user)
+        self.project.members.remove(self.owner, self.other_user)
+        self.assertEqual(list(self.project.members.all()), [self.owner])
+
+        self.project.members.clear()
+        self.assertTrue(self.project.members.filter(id=self.owner.id).exists())
+
+        self.owner.project_access.remove(self.project)
+        self.assertTrue(self.project.members.filter(id=self.owner.id).exists())
+
+    def test_backfill_command(self):
+        # Simulate rows written before the signal existed
+        Project.members.through.objects.filter(project=self.project).delete()
+
+        out = StringIO()
+        call_command('backfill_project_owners', stdout=out)
+
+        self.assertTrue(self.project.members.filter(id=self.owner.id).exists())
+        self.assertIn('Added 1', out.getvalue())
+
+    def test_request_queries_do_not_grow_with_owned_projects(self):
+        self.client.login(username='projectowner', password='ownerpass')
+        url = reverse('classes:class_list')
+        self.client.get(url)  # Fills the cached class list
+
+        with CaptureQueriesContext(connection) as few_projects:
+            self.client.get(url)
+
+        for i in range(10):
+            Project.objects.create(name=f'Project {i}', owner=self.owner, class_belongs_to=self.classs,
+                                   folder_in_s3=f'documents/project-{i}')
+
+        with CaptureQueriesContext(connection) as many_projects:
+            self.client.get(url)
+
+        self.assertEqual(len(few_projects), len(many_projects))
+
+
+class MembershipCheckTest(TestCase):
+
+    def setUp(self):
+        self.superuser = User.objects.create_superuser(username='superuser', email='superuser@example.com', password='testpassword')
+        self.owner = User.objects.create_user(username='projectowner', password='ownerpass')
+        self.member = User.objects.create_user(username='member', password='memberpass')
+        self.admin = User.objects.create_user(username='pmaadmin', password='adminpass')
+        self.outsider = User.objects.create_user(username='outsider', password='outsiderpass')
+        self.classs = Class.objects.create(name='Test Class', class_code='TEST101', owner=self.superuser)
+        self.classs.pma_admins.add(self.admin)
+        self.project = Project.objects.create(name='Test Project', owner=self.owner, class_belongs_to=self.classs)
+        self.project.members.add(self.member)
+
+    def test_checks_are_one_query_each(self):
+        with self.assertNumQueries(4):
+            self.assertTrue(self.project.has_member(self.member))
+            self.assertFalse(self.project.has_member(self.outsider))
+            self.assertTrue(self.project.has_pma_admin(self.admin))
+            self.assertFalse(self.classs.has_member(self.member))
+
+    def test_accessible_projects(self):
+        Project.objects.create(name='Elsewhere', owner=self.outsider, class_belongs_to=self.classs,
+                               folder_in_s3='documents/elsewhere')
+        for user, expected in [(self.owner, ['Test Project']), (self.member, ['Test Project']),
+                               (self.admin, ['Elsewhere', 'Test Project']), (self.outsider, ['Elsewhere'])]:
+            accessible = Project.objects.accessible_projects_for(user).order_by('name')
+            self.assertEqual([project.name for project in accessible], expected)
+
+    def test_leaving_checks_membership_without_loading_members(self):
+        User.objects.bulk_create(User(username=f'student{i}') for i in range(30))
+        self.project.members.add(*User.objects.filter(username__startswith='student'))
+        self.client.login(username='member', password='memberpass')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('projects:leave_project', args=[self.project.project_id]))
+        self.assertFalse(self.project.has_member(self.member))
+        member_lists = [query['sql'] for query in queries
+                        if query['sql'].startswith('SELECT "auth_user"') and 'projects_project_members' in query['sql']]
+        self.assertEqual(member_lists, [])
+
+    def test_pma_admins_are_refused_comments(self):
+        self.client.login(username='pmaadmin', password='adminpass')
+        url = reverse('classes:projects:project_detail', args=[self.classs.class_id, self.project.project_id])
+        response = self.client.post(url, {'content': 'Hello'})
+        self.assertRedirects(response, url)
+        self.assertFalse(ProjectComment.objects.exists())
+
+
+class ProjectViewQueryTest(TestCase):
+
+    def setUp(self):
+        self.superuser = User.objects.create_superuser(username='superuser', email='superuser@example.com', password='testpassword')
+        self.owner = User.objects.create_user(username='projectowner', password='ownerpass')
+
+        self.classs = Class.objects.create(
+            name='Test Class',
+            class_code='TEST101',
+            owner=self.superuser
+        )
+        self.project = Project.objects.create(
+            name='Test Project',
+            owner=self.owner,
+            class_belongs_to=self.classs
+        )
+        self.url = reverse('classes:projects:project_detail', args=[self.classs.class_id, self.project.project_id])
+        cache.clear()
+        self.client.login(username='projectowner', password='ownerpass')
+
+    def add_content(self, count):
+        tag, _ = Tag.objects.get_or_create(name='notes')
+        # Fragment versions are bumped on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(count):
+                member = User.objects.create_user(username=f'member{i}-{count}', password='memberpass')
+                self.project.members.add(member)
+                document = Document.objects.create(owner=member, title=f'Doc {i}', file='testfile.txt', project=self.project)
+                document.tags.add(tag)
+                ProjectComment.objects.create(project=self.project, author=member, content='Looks good')
+
+    def test_project_view_renders_in_constant_queries(self):
+        self.add_content(1)
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+        self.add_content(5)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Doc 4')
+
+        self.assertEqual(len(small), len(large))
+        assert_within_budget(response)
+
+
+class KeysetPaginationTest(TestCase):
+
+    def setUp(self):
+        self.superuser = User.objects.create_superuser(username='superuser', email='superuser@example.com', password='testpassword')
+        self.owner = User.objects.create_user(username='projectowner', password='ownerpass')
+        self.outsider = User.objects.create_user(username='outsider', password='outsiderpass')
+        self.classs = Class.objects.create(name='Test Class', class_code='TEST101', owner=self.superuser)
+        self.project = Project.objects.create(name='Test Project', owner=self.owner, class_belongs_to=self.classs)
+        for i in range(7):
+            ProjectComment.objects.create(project=self.project, author=self.owner, content=f'Comment {i}')
+        # Equal timestamps, so pages have to fall back on the id to stay in order
+        ProjectComment.objects.update(created_at=timezone.now())
+        self.url = reverse('classes:projects:project_comments', args=[self.classs.class_id, self.project.project_id])
+        cache.clear()
+        self.client.login(username='projectowner', password='ownerpass')
+
+    @mock.patch('projects.views.COMMENTS_PER_PAGE', 3)
+    def test_load_more_walks_every_comment_once(self):
+        detail = self.client.get(reverse('classes:projects:project_detail', args=[self.classs.class_id, self.project.project_id]))
+        self.assertEqual([comment.content for comment in detail.context['comments']], ['Comment 6', 'Comment 5', 'Comment 4'])
+
+        seen, cursor, query_counts = [], detail.context['comments'].next_cursor, []
+        while cursor:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.url, {'after': cursor})
+            assert_within_budget(response)
+            query_counts.append(len(queries))
+            seen += [f'Comment {i}' for i in range(7) if f'Comment {i}<' in response.json()['html']]
+            cursor = response.json()['next']
+        self.assertEqual(sorted(seen, reverse=True), ['Comment 3', 'Comment 2', 'Comment 1', 'Comment 0'])
+        # A deeper page costs the same as the one before it
+        self.assertEqual(len(set(query_counts)), 1)
+
+    def test_bad_cursors_start_from_the_first_page(self):
+        for cursor in ('junk', 'WyJub3QgYSBkYXRlIiwgMV0'):
+            response = self.client.get(self.url, {'after': cursor})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('Comment 6', response.json()['html'])
+
+    def test_outsiders_are_refused(self):
+        self.client.login(username='outsider', password='outsiderpass')
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class BatchMembershipTest(TestCase):
+
+    def setUp(self):
+        self.superuser = User.objects.create_superuser(username='superuser', email='superuser@example.com', password='testpassword')
+        self.owner = User.objects.create_user(username='projectowner', password='ownerpass')
+        self.classs = Class.objects.create(name='Test Class', class_code='TEST101', owner=self.superuser)
+        self.project = Project.objects.create(name='Test Project', owner=self.owner, class_belongs_to=self.classs)
+        self.args = [self.classs.class_id, self.project.project_id]
+        cache.clear()
+        self.client.login(username='projectowner', password='ownerpass')
+
+    def students(self, count, prefix='student'):
+        User.objects.bulk_create(User(username=f'{prefix}{i}') for i in range(count))
+        return list(User.objects.filter(username__startswith=prefix).order_by('id'))
+
+    def member_names(self):
+        return set(self.project.members.values_list('username', flat=True))
+
+    def test_add_and_remove_report_each_item(self):
+        alice, bob = self.students(2)
+        JoinRequest.objects.create(user=alice, project=self.project)
+        self.project.members.add(bob)
+
+        response = self.client.post(reverse('classes:projects:add_members', args=self.args) + '?format=json',
+                                    {'usernames': 'student0, student1\nnobody student0'})
+        self.assertEqual(response.json()['results'], [
+            {'item': 'student0', 'status': 'added'},
+            {'item': 'student1', 'status': 'already_member'},
+            {'item': 'nobody', 'status': 'not_found'},
+        ])
+        # Adding someone settles their pending request
+        self.assertFalse(JoinRequest.objects.exists())
+
+        response = self.client.post(reverse('classes:projects:remove_members', args=self.args),
+                                    {'user': [alice.pk, bob.pk, self.owner.pk, self.superuser.pk]}, follow=True)
+        self.assertContains(response, 'Removed 2 members.')
+        self.assertContains(response, "The project owner can&#x27;t be removed.")
+        self.assertEqual(self.member_names(), {'projectowner'})
+
+    def test_batches_cost_the_same_queries_as_single_items(self):
+        def decide(count, prefix):
+            users = self.students(count, prefix)
+            JoinRequest.objects.bulk_create(JoinRequest(user=user, project=self.project) for user in users)
+            ids = list(JoinRequest.objects.filter(user__in=users).values_list('pk', flat=True))
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(reverse('classes:projects:decide_join_requests', args=self.args) + '?format=json',
+                                            {'decision': 'approve', 'request': ids})
+            assert_within_budget(response)
+            self.assertEqual({result['status'] for result in response.json()['results']}, {'approved'})
+            return len(queries)
+
+        self.assertEqual(decide(1, 'one'), decide(50, 'many'))
+        self.assertEqual(self.project.members.count(), 52)
+        self.assertFalse(JoinRequest.objects.exists())
+        self.assertEqual(Job.objects.filter(name='projects.notify_join_decision').count(), 51)
+
+    def test_only_the_owner_can_batch(self):
+        member = self.students(1)[0]
+        self.project.members.add(member)
+        self.client.force_login(member)
+        for name in ('add_members', 'remove_members', 'decide_join_requests'):
+            response = self.client.post(reverse(f'classes:projects:{name}', args=self.args), {'decision': 'approve'})
+            self.assertEqual(response.status_code, 403)
+
+    def test_ids_that_are_not_integers_are_skipped(self):
+        member = self.students(1)[0]
+        self.project.members.add(member)
+        response = self.client.post(reverse('classes:projects:remove_members', args=self.args) + '?format=json',
+                                    {'user': ['²', 'x', str(member.id)]})
+        self.assertEqual(response.json()['results'], [{'item': member.id, 'status': 'removed'}])
+        response = self.client.post(reverse('classes:projects:decide_join_requests', args=self.args) + '?format=json',
+                                    {'request': ['²'], 'decision': 'approve'})
+        self.assertEqual(response.status_code, 200)
+
+
+class FragmentCacheTest(TestCase):
+
+    def setUp(self):
+        self.superuser = User.objects.create_superuser(username='superuser', email='superuser@example.com', password='testpassword')
+        self.owner = User.objects.create_user(username='projectowner', password='ownerpass')
+        self.member = User.objects.create_user(username='member', password='memberpass')
+
+        self.classs = Class.objects.create(name='Test Class', class_code='TEST101', owner=self.superuser)
+        self.project = Project.objects.create(name='Test Project', owner=self.owner, class_belongs_to=self.classs)
+        self.project.members.add(self.member)
+        self.url = reverse('classes:projects:project_detail', args=[self.classs.class_id, self.project.project_id])
+        cache.clear()
+        fragments.stats.reset()
+
+    def test_second_render_hits_the_cache(self):
+        self.client.login(username='projectowner', password='ownerpass')
+        with CaptureQueriesContext(connection) as rendered:
+            self.client.get(self.url)
+        with CaptureQueriesContext(connection) as cached:
+            self.client.get(self.url)
+        self.assertLess(len(cached), len(rendered))
+
+        totals = fragments.stats.totals()
+        for name in ('project-documents', 'project-comments', 'project-members'):
+            self.assertEqual(totals[name]['hits'], 1)
+            self.assertEqual(totals[name]['misses'], 1)
+
+    def test_changes_invalidate_fragments(self):
+        self.client.login(username='projectowner', password='ownerpass')
+        self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Document.objects.create(owner=self.member, title='Fresh notes', file='testfile.txt', project=self.project)
+            ProjectComment.objects.create(project=self.project, author=self.member, content='New comment')
+            self.project.members.add(User.objects.create_user(username='newcomer', password='newpass'))
+
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Fresh notes')
+        self.assertContains(response, 'New comment')
+        self.assertContains(response, 'newcomer')
+
+    def test_fragments_are_shared_between_users(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ProjectComment.objects.create(project=self.project, author=self.member, content='Mine')
+
+        self.client.login(username='member', password='memberpass')
+        member_page = self.client.get(self.url)
+        self.client.login(username='projectowner', password='ownerpass')
+        owner_page = self.client.get(self.url)
+
+        # Both pages carry the same hidden controls; only the viewer data differs
+        for page in (member_page, owner_page):
+            self.assertContains(page, f'data-allowed-users="{self.member.id}" data-allowed-roles="owner"')
+        self.assertContains(member_page, f'"id": {self.member.id}, "roles": []')
+        self.assertContains(owner_page, f'"id": {self.owner.id}, "roles": ["owner"]')
+        # Only the owner may remove members (see remove_member), so only they see the button
+        self.assertNotContains(owner_page, 'data-allowed-roles="owner pma-admin"')
+        self.assertEqual(fragments.stats.totals()['project-comments']['hits'], 1)
+
+    def test_stats_are_staff_only(self):
+        url = reverse('fragment_cache_stats')
+        self.client.login(username='projectowner', password='ownerpass')
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.login(username='superuser', password='testpassword')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('project-documents', response.json())
+
+
+class InstrumentationTest(TestCase):
+
+    def setUp(self):
+        self.superuser = User.objects.create_superuser(username='superuser', email='superuser@example.com', password='testpassword')
+        self.owner = User.objects.create_user(username='projectowner', password='ownerpass')
+        self.classs = Class.objects.create(name='Test Class', class_code='TEST101', owner=self.superuser)
+        self.project = Project.objects.create(name='Test Project', owner=self.owner, class_belongs_to=self.classs)
+        self.url = reverse('classes:projects:project_detail', args=[self.classs.class_id, self.project.project_id])
+        cache.clear()
+        self.client.login(username='projectowner', password='ownerpass')
+
+    def test_requests_are_measured(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.perf.view_name, 'classes:projects:project_detail')
+        self.assertEqual(response.perf.queries, len(queries))
+        self.assertGreater(response.perf.template_time, 0)
+        self.assertGreaterEqual(response.perf.total_time, response.perf.template_time)
+        self.assertIn(f'desc="{len(queries)} queries"', response['Server-Timing'])
+
+    @override_settings(VIEW_QUERY_BUDGETS={'classes:projects:project_detail': 1})
+    def test_over_budget_requests_are_logged_and_fail_the_budget_check(self):
+        with self.assertLogs('mysite.perf', 'WARNING') as logs:
+            response = self.client.get(self.url)
+        self.assertIn('"over_budget": true', logs.output[0])
+        with self.assertRaises(AssertionError):
+            assert_within_budget(response)
+
+    def test_stats_page_shows_percentiles_to_staff(self):
+        perf.samples.reset()
+        for _ in range(3):
+            self.client.get(self.url)
+
+        stats_url = reverse('perf_stats')
+        self.assertEqual(self.client.get(stats_url).status_code, 302)
+
+        self.client.login(username='superuser', password='testpassword')
+        rows = self.client.get(stats_url, {'format': 'json'}).json()['views']
+        row = next(row for row in rows if row['view'] == 'classes:projects:project_detail')
+        self.assertEqual(row['requests'], 3)
+        self.assertLessEqual(row['p50_ms'], row['p99_ms'])
+        self.assertEqual(row['query_budget'], 12)
+        self.assertContains(self.client.get(stats_url), 'classes:projects:project_detail')
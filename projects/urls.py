@@ -27,6 +27,7 @@ urlpatterns = [
     # and whether they are function or class based views (see above)
 
     path('search/', doc_views.search_documents, name='search_documents'),  # Add this line first
+    path('search/tags/', doc_views.tag_autocomplete, name='tag_autocomplete'),
     path("add/", views.add_project, name="add_project"),
     path("<int:project_id>/doc/", include("doc.urls")),
     # path('<int:class_id>/', views.project_list, name='project_list'),
@@ -34,7 +35,12 @@ urlpatterns = [
     path('add/', views.add_project, name='add_project_without_class'),
 
     path('<int:project_id>/add_member/', views.add_member, name='add_member'),
+    path('<int:project_id>/members/add/', views.add_members, name='add_members'),
+    path('<int:project_id>/members/remove/', views.remove_members, name='remove_members'),
+    path('<int:project_id>/requests/decide/', views.decide_join_requests, name='decide_join_requests'),
     path('<int:project_id>/', views.project_view, name='project_detail'),
+    path('<int:project_id>/documents/', views.project_documents, name='project_documents'),
+    path('<int:project_id>/comments/', views.project_comments, name='project_comments'),
     path('<int:project_id>/delete/', views.delete_project, name='delete_project'), 
     path('<int:class_id>/<int:project_id>/comment/<int:comment_id>/delete/', views.delete_comment, name='delete_comment'),
 
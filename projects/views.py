@@ -1,24 +1,29 @@
 import uuid
+from collections import Counter
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.views.decorators.http import require_POST
 from .models import Project, JoinRequest
-from profiles.models import Profile
 from .forms import ProjectForm
 from .models import ProjectComment
 from .forms import ProjectCommentForm
 from classes.models import Class
+from mysite.roles import get_roles
+from mysite.pagination import KeysetPage, keyset_paginate, load_more, paginate
+from jobs.queue import enqueue
+from . import membership
 
+PROJECTS_PER_PAGE = 24
+DOCUMENTS_PER_PAGE = 25
+COMMENTS_PER_PAGE = 20
+# Newest first; both end in the primary key so keyset pages never skip or repeat rows
+DOCUMENT_ORDER = ('-date_uploaded', '-id')
+COMMENT_ORDER = ('-created_at', '-id')
 
-def is_pma_admin(user):
-    if not user.is_authenticated:
-        return False
-    try:
-        profile = Profile.objects.get(user=user)
-        return profile.user_type == "PMA Admin"
-    except Profile.DoesNotExist:
-        return False
 
 @login_required
 def project_list(request, *args, **kwargs):
@@ -26,18 +31,19 @@ def project_list(request, *args, **kwargs):
         messages.error(request, "Access restricted for Anonymous Users.")
         return redirect('home')
             
-    if is_pma_admin(request.user):
+    if get_roles(request).is_pma_admin:
         return redirect('projects:pma_admin_dashboard')  
     else:
         # No class_id provided; retrieve all projects the user is a member of
         class_instance = None
-        owned_projects = Project.objects.filter(owner=request.user)
-        member_projects = Project.objects.filter(members=request.user).exclude(owner=request.user)
+        projects = Project.objects.with_activity().select_related('class_belongs_to').order_by('-date_created', '-project_id')
+        owned_projects = projects.filter(owner=request.user)
+        member_projects = projects.filter(members=request.user).exclude(owner=request.user)
 
         return render(request, 'projects/project_list.html', {
             'class': class_instance,
-            'owned_projects': owned_projects,
-            'member_projects': member_projects,
+            'owned_projects': paginate(request, owned_projects, PROJECTS_PER_PAGE, 'owned_page'),
+            'member_projects': paginate(request, member_projects, PROJECTS_PER_PAGE, 'member_page'),
         })
 
 def pma_admin_dashboard(request, *args, **kwargs):
@@ -47,13 +53,18 @@ def pma_admin_dashboard(request, *args, **kwargs):
     
 
     class_instance = Class.objects.get(pma_admins__id=request.user.id)       
-    if not is_pma_admin(request.user):
+    if not get_roles(request).is_pma_admin:
         messages.error(request, "Please go to My Projects Dashboard.")
         return redirect('project_list')
     
     else:
-        projects = class_instance.project_set.all()
-        return render(request, 'projects/pma_projects.html', {'projects': projects, 'class': class_instance})
+        projects = (class_instance.project_set.with_activity()
+                    .select_related('owner', 'class_belongs_to')
+                    .order_by('-date_created', '-project_id'))
+        return render(request, 'projects/pma_projects.html', {
+            'projects': paginate(request, projects, PROJECTS_PER_PAGE),
+            'class': class_instance,
+        })
 
 @login_required
 def add_project(request, class_id):
@@ -62,7 +73,7 @@ def add_project(request, class_id):
     if request.user.username == 'guest':
         messages.error(request, "Access restricted for Anonymous Users.")
         return redirect('home')
-    if is_pma_admin(request.user):
+    if get_roles(request).is_pma_admin:
         messages.error(request, "PMA Admin is not allowed to Add Project.")
         return redirect('classes:class_detail', class_id)
     
@@ -73,8 +84,7 @@ def add_project(request, class_id):
             project.owner = request.user
             project.class_belongs_to  = class_instance
             project.folder_in_s3 = f"documents/project-{uuid.uuid4()}"
-            project.save()
-            project.members.add(request.user)
+            project.save()  # the owner is added to members by projects.signals
             messages.success(request, "Project created successfully!")
             return redirect('classes:class_detail', class_id=class_id)
     else:
@@ -85,13 +95,21 @@ def add_project(request, class_id):
 @login_required
 def project_view(request, class_id, project_id):   
     class_instance = get_object_or_404(Class, class_id=class_id)
-    project = get_object_or_404(Project, project_id=project_id, class_belongs_to=class_instance)
-
-    documents = project.document_set.all()
-    comments = project.comments.all()  # Get all comments
+    project = get_object_or_404(Project.objects.with_activity().select_related('owner', 'class_belongs_to'),
+                                project_id=project_id, class_belongs_to=class_instance)
+
+    # First pages only; later ones come from project_documents and project_comments
+    documents = KeysetPage(project.document_set.select_related('rendition').prefetch_related('tags'),
+                           DOCUMENT_ORDER, DOCUMENTS_PER_PAGE)
+    comments = KeysetPage(project.comments.select_related('author'), COMMENT_ORDER, COMMENTS_PER_PAGE)
+    members = project.members.all()
     comment_form = ProjectCommentForm()
 
     if request.method == 'POST':
+        if get_roles(request).is_pma_admin_of(project.class_belongs_to):
+            # ProjectComment.save() refuses them too, but with a ValidationError that would be a 500 here
+            messages.error(request, "PMA Admin is not allowed to comment on projects.")
+            return redirect('classes:projects:project_detail', class_id=class_id, project_id=project_id)
         comment_form = ProjectCommentForm(request.POST)
         if comment_form.is_valid():
             comment = comment_form.save(commit=False)
@@ -103,17 +121,55 @@ def project_view(request, class_id, project_id):
 
 
     join_requests = JoinRequest.objects.filter(project=project,
-                                               approved=False) if request.user == project.owner else None
-    
+                                               approved=False).select_related('user') if request.user == project.owner else None
+
+    roles = get_roles(request)
+    # The document, comment and member lists are cached fragments shared by every viewer
+    # (see mysite/fragments.py); these roles decide which of their controls this user sees
+    viewer_roles = [role for role, has_role in [('owner', roles.owns(project)),
+                                                ('pma-admin', roles.is_pma_admin_of(class_instance))] if has_role]
     return render(request, 'projects/project_detail.html', {
         'class': class_instance,
         'project': project,
         'documents': documents,
         'comments': comments,
+        'members': members,
         'comment_form': comment_form,
         'join_requests': join_requests,
+        'is_owner': roles.owns(project),
+        'is_member': roles.is_member(project),
+        'is_class_pma_admin': roles.is_pma_admin_of(class_instance),
+        'can_view': roles.can_view_project(project),
+        'can_manage': roles.can_manage_project(project),
+        'viewer': {'id': request.user.id, 'roles': viewer_roles},
     })
 
+def viewable_project(request, class_id, project_id):
+    project = get_object_or_404(Project.objects.select_related('class_belongs_to'), project_id=project_id,
+                                class_belongs_to__class_id=class_id)
+    if not get_roles(request).can_view_project(project):
+        raise PermissionDenied
+    return project
+
+
+@login_required
+def project_documents(request, class_id, project_id):
+    """The page of the project's documents after ``?after=``, for the "Load more" button."""
+    project = viewable_project(request, class_id, project_id)
+    page = keyset_paginate(request, project.document_set.select_related('rendition').prefetch_related('tags'),
+                           DOCUMENT_ORDER, DOCUMENTS_PER_PAGE)
+    return load_more(request, page, 'projects/document_rows.html',
+                     {'class': project.class_belongs_to, 'project': project})
+
+
+@login_required
+def project_comments(request, class_id, project_id):
+    """The page of the project's comments after ``?after=``, for the "Load more" button."""
+    project = viewable_project(request, class_id, project_id)
+    page = keyset_paginate(request, project.comments.select_related('author'), COMMENT_ORDER, COMMENTS_PER_PAGE)
+    return load_more(request, page, 'projects/comment_cards.html', {'project': project})
+
+
 @login_required
 def add_member(request, class_id, project_id):
     class_instance = get_object_or_404(Class, class_id=class_id)
@@ -121,7 +177,7 @@ def add_member(request, class_id, project_id):
     if request.user.username == 'guest':
         messages.error(request, "Access restricted for Anonymous Users.")
         return redirect('home')
-    if is_pma_admin(request.user):
+    if get_roles(request).is_pma_admin:
         messages.error(request, "PMA Admin is not allowed to Add Member.")
         return redirect('classes:projects:project_detail', class_id, project_id)
     
@@ -132,15 +188,13 @@ def add_member(request, class_id, project_id):
         return redirect('projects:project_detail', class_id=class_id, project_id=project_id)
     
     if request.method == 'POST':
-        username = request.POST.get('username')
-        try:
-            user = User.objects.get(username=username)
-            if user in project.members.all():
-                messages.error(request, f"{username} is already a member of the project.")
-            else:
-                project.members.add(user)
-                messages.success(request, f"{username} has been added to the project.")
-        except User.DoesNotExist:
+        username = request.POST.get('username', '')
+        [result] = membership.add_members(project, [username])
+        if result['status'] == 'added':
+            messages.success(request, f"{username} has been added to the project.")
+        elif result['status'] == 'already_member':
+            messages.error(request, f"{username} is already a member of the project.")
+        else:
             messages.error(request, "User does not exist.")
     return redirect('classes:projects:project_detail', class_id=class_id, project_id=project_id)
 
@@ -156,7 +210,7 @@ def remove_member(request, class_id, project_id, user_id):
 
     # Check if the current user is the project owner
     if request.user == project.owner:
-        if user_to_remove in project.members.all():
+        if project.has_member(user_to_remove):
             project.members.remove(user_to_remove)
             messages.success(request, f"{user_to_remove.username} has been removed from the project.")
         else:
@@ -173,14 +227,14 @@ def request_to_join_project(request, class_id, project_id):
     if request.user.username == 'guest':
         messages.error(request, "Access restricted for Anonymous Users.")
         return redirect('home')
-    if is_pma_admin(request.user):
+    if get_roles(request).is_pma_admin:
         messages.error(request, "PMA Admin is not allowed to Join Project.")
         return redirect('classes:projects:project_detail', class_id, project_id)
     
     project = get_object_or_404(Project, project_id=project_id, class_belongs_to=class_instance)
 
     if request.method == 'POST':
-        if request.user in project.members.all():
+        if project.has_member(request.user):
             messages.error(request, "You are already a member of this project.")
         else:
             # Check if a join request already exists
@@ -201,7 +255,7 @@ def approve_request(request, class_id, project_id, user_id):
     if request.user.username == 'guest':
         messages.error(request, "Access restricted for Anonymous Users.")
         return redirect('home')
-    if is_pma_admin(request.user):
+    if get_roles(request).is_pma_admin:
         messages.error(request, "PMA Admin is not allowed to Approve Join Request.")
         return redirect('classes:projects:project_detail', class_id, project_id)
     
@@ -211,6 +265,7 @@ def approve_request(request, class_id, project_id, user_id):
     if request.user == project.owner:
         project.members.add(user)
         JoinRequest.objects.filter(project=project, user=user).delete()  # Assuming you have a JoinRequest model
+        enqueue('projects.notify_join_decision', user_id=user.id, project_id=project.pk, approved=True)
         messages.success(request, f"{user.username} has been added to the project.")
         messages.add_message(request, messages.INFO, f"Your request to join '{project.name}' was approved!",
                              extra_tags="user_notification")
@@ -225,7 +280,7 @@ def deny_request(request, class_id, project_id, user_id):
     if request.user.username == 'guest':
         messages.error(request, "Access restricted for Anonymous Users.")
         return redirect('home')
-    if is_pma_admin(request.user):
+    if get_roles(request).is_pma_admin:
         messages.error(request, "PMA Admin is not allowed to Deny Join Request.")
         return redirect('classes:projects:project_detail', class_id, project_id)
     
@@ -234,6 +289,7 @@ def deny_request(request, class_id, project_id, user_id):
 
     if request.user == project.owner:
         JoinRequest.objects.filter(project=project, user=user).delete()  # Assuming you have a JoinRequest model
+        enqueue('projects.notify_join_decision', user_id=user.id, project_id=project.pk, approved=False)
         messages.info(request, f"{user.username}'s join request has been denied.")
         messages.add_message(request, messages.WARNING, f"Your request to join '{project.name}' was denied.",
                              extra_tags="user_notification")
@@ -249,7 +305,7 @@ def delete_project(request, class_id, project_id):
     class_instance = get_object_or_404(Class, class_id=class_id)
     project = get_object_or_404(Project, project_id=project_id, class_belongs_to=class_instance)
   
-    if request.user == project.owner or is_pma_admin(request.user):
+    if request.user == project.owner or get_roles(request).is_pma_admin:
         project.delete(user=request.user)
         messages.success(request, "Project deleted successfully.")
         return redirect('classes:class_detail', class_id=class_id)
@@ -264,7 +320,7 @@ def delete_comment(request,class_id, project_id, comment_id):
     if request.user.username == 'guest':
         messages.error(request, "Access restricted for Anonymous Users.")
         return redirect('home')
-    if is_pma_admin(request.user):
+    if get_roles(request).is_pma_admin:
         messages.error(request, "PMA Admin is not allowed to Delete Join Comment.")
         return redirect('classes:projects:project_detail', project.class_belongs_to.class_id, project_id)
     
@@ -290,7 +346,7 @@ def leave_project(request, project_id):
         project = get_object_or_404(Project, project_id=project_id)
 
         # Check if the user is a member
-        if request.user in project.members.all():
+        if project.has_member(request.user):
             project.members.remove(request.user)
             messages.success(request, "You have successfully left the project.")
         else:
@@ -301,3 +357,103 @@ def leave_project(request, project_id):
         # Redirect if accessed without POST
     messages.error(request, "Invalid request.")
     return redirect('projects:project_list')
+
+
+def managed_project(request, class_id, project_id):
+    """The project, if the user owns it; PMA admins and guests can't change memberships."""
+    project = get_object_or_404(Project, project_id=project_id, class_belongs_to__class_id=class_id)
+    if request.user.username == 'guest' or get_roles(request).is_pma_admin or request.user != project.owner:
+        raise PermissionDenied
+    return project
+
+
+def posted_ids(request, name):
+    """The integers posted as ``name``, skipping the rest; ``isdigit()`` would pass "²", which int() rejects."""
+    return [int(value) for value in request.POST.getlist(name) if value.isdecimal()]
+
+
+def batch_response(request, class_id, project_id, results, summary):
+    """The per-item ``results`` as JSON for ``?format=json``, otherwise ``summary`` as messages on the project page."""
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'results': results})
+    counts = Counter(result['status'] for result in results)
+    for level, text in summary(counts, results):
+        messages.add_message(request, level, text)
+    return redirect('classes:projects:project_detail', class_id=class_id, project_id=project_id)
+
+
+def too_many(request, class_id, project_id, count):
+    text = f"At most {membership.MAX_BATCH_SIZE} can be processed at once; {count} were sent."
+    if request.GET.get('format') == 'json':
+        return JsonResponse({'error': text}, status=400)
+    messages.error(request, text)
+    return redirect('classes:projects:project_detail', class_id=class_id, project_id=project_id)
+
+
+def plural(count, noun):
+    return f"{count} {noun}{'' if count == 1 else 's'}"
+
+
+@login_required
+@require_POST
+def add_members(request, class_id, project_id):
+    """Add every username in ``usernames`` (separated by commas or whitespace) and each ``username`` field."""
+    project = managed_project(request, class_id, project_id)
+    usernames = request.POST.getlist('username') + membership.split_usernames(request.POST.get('usernames'))
+    if len(usernames) > membership.MAX_BATCH_SIZE:
+        return too_many(request, class_id, project_id, len(usernames))
+
+    def summary(counts, results):
+        if counts['added']:
+            yield messages.SUCCESS, f"Added {plural(counts['added'], 'member')}."
+        if counts['already_member']:
+            yield messages.INFO, f"{plural(counts['already_member'], 'user')} already in the project."
+        if counts['not_found']:
+            missing = ', '.join(result['item'] for result in results if result['status'] == 'not_found')
+            yield messages.ERROR, f"No users named {missing}."
+
+    return batch_response(request, class_id, project_id, membership.add_members(project, usernames), summary)
+
+
+@login_required
+@require_POST
+def remove_members(request, class_id, project_id):
+    """Remove the members whose ids are posted as ``user``."""
+    project = managed_project(request, class_id, project_id)
+    user_ids = posted_ids(request, 'user')
+    if len(user_ids) > membership.MAX_BATCH_SIZE:
+        return too_many(request, class_id, project_id, len(user_ids))
+
+    def summary(counts, results):
+        if counts['removed']:
+            yield messages.SUCCESS, f"Removed {plural(counts['removed'], 'member')}."
+        if counts['owner']:
+            yield messages.ERROR, "The project owner can't be removed."
+        if counts['not_member']:
+            yield messages.INFO, f"{plural(counts['not_member'], 'user')} weren't members."
+
+    return batch_response(request, class_id, project_id, membership.remove_members(project, user_ids), summary)
+
+
+@login_required
+@require_POST
+def decide_join_requests(request, class_id, project_id):
+    """Approve or deny (``decision``) the join requests whose ids are posted as ``request``."""
+    project = managed_project(request, class_id, project_id)
+    decision = request.POST.get('decision')
+    if decision not in ('approve', 'deny'):
+        return HttpResponseBadRequest("decision must be 'approve' or 'deny'")
+    request_ids = posted_ids(request, 'request')
+    if len(request_ids) > membership.MAX_BATCH_SIZE:
+        return too_many(request, class_id, project_id, len(request_ids))
+
+    def summary(counts, results):
+        if counts['approved']:
+            yield messages.SUCCESS, f"Approved {plural(counts['approved'], 'join request')}."
+        if counts['denied']:
+            yield messages.INFO, f"Denied {plural(counts['denied'], 'join request')}."
+        if counts['not_found']:
+            yield messages.WARNING, f"{plural(counts['not_found'], 'request')} had already been handled."
+
+    results = membership.decide_join_requests(project, request_ids, approve=decision == 'approve')
+    return batch_response(request, class_id, project_id, results, summary)